@@ -1,19 +1,37 @@
-from fastapi import FastAPI, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, Literal, Optional
+import asyncio
 import os
-import json
-import io
-import uuid
-from datetime import datetime
 
 # --- UPDATED IMPORTS ---
-from core.evidence_processor import EvidenceProcessor
-from database import update_scan_results, upsert_assets, update_asset_status, get_asset_map, insert_findings_bulk, engine, \
-    text, clear_asset_findings
-from reporting.report_generator import generate_csv_string
+from database import enqueue_scan, ensure_scan_queue_schema, ensure_scan_results_schema, \
+    ensure_evidence_cache_schema, ensure_scan_state_schema, scan_has_findings, iter_scan_results, \
+    get_scan_results_page, get_evidence_key_types, get_scan_summary, ensure_worker_metrics_schema, get_worker_metrics
+from core.metrics import REGISTRY, render
+from reporting.report_generator import iter_csv_chunks, iter_arrow_chunks, ARROW_MEDIA_TYPES
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    await asyncio.to_thread(ensure_scan_queue_schema)
+    await asyncio.to_thread(ensure_scan_results_schema)
+    await asyncio.to_thread(ensure_evidence_cache_schema)
+    await asyncio.to_thread(ensure_scan_state_schema)
+    await asyncio.to_thread(ensure_worker_metrics_schema)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Largest page a single paginated download may ask for
+MAX_DOWNLOAD_PAGE = 10000
+
+# Page sizes for the JSON findings endpoint
+DEFAULT_FINDINGS_PAGE = 100
+MAX_FINDINGS_PAGE = 1000
 
 
 class ScanRequest(BaseModel):
@@ -21,144 +39,126 @@ class ScanRequest(BaseModel):
     role_arn: str
     scan_id: str
     external_id: str
+    # Ignore cached evidence and re-read everything from AWS
+    force_refresh: bool = False
+    # Only re-check buckets CloudTrail reports as changed since the last scan
+    incremental: bool = False
+    # role_arn is an Organizations management role: scan every member account
+    organization: bool = False
+    # Role assumed in each member account (defaults to role_arn's role name)
+    member_role_name: Optional[str] = None
+    # Member accounts scanned at once; the worker caps it at its LOXE_ORG_SCAN_PROCESSES
+    processes: Optional[int] = Field(default=None, ge=1)
 
 
-def run_background_scan(role_arn: str, scan_id: str, cloud_account_id: str, external_id: str):
-    print(f"🚀 Starting scan for {scan_id}...")
-    role_arn = role_arn.strip()
-    external_id = external_id.strip()
-
-    try:
-        # A. Initialize
-        processor = EvidenceProcessor(role_arn=role_arn, external_id=external_id, region='us-east-1')
-
-        # B. INVENTORY
-        print("🔍 Collecting Inventory...")
-        assets = processor.collect_assets()
-        upsert_assets(assets, cloud_account_id)
-
-        # Get the Map (ARN -> DB_ID)
-        asset_map = get_asset_map(cloud_account_id)
-
-        # --- THE FIX: Clear Old Data ---
-        # 1. Identify all assets we are about to check
-        all_scanned_asset_ids = list(asset_map.values())
-
-        # 2. Wipe their finding history so we start fresh
-        if all_scanned_asset_ids:
-            clear_asset_findings(all_scanned_asset_ids)
-        # -------------------------------
-
-        # C. RUN CHECKS
-        raw_findings_objects = processor.run_s3_checks()
-
-        # D. PROCESS FINDINGS
-        findings_json = []
-        finding_records = []
-        failure_count = 0
-
-        for finding in raw_findings_objects:
-            # ... (Everything inside this loop stays EXACTLY the same) ...
-            # ... Extract Data ...
-            f_control = getattr(finding, "control_id", "N/A")
-            f_resource_name = getattr(finding, "resource", "Unknown")
-            f_status = getattr(finding, "status", "UNKNOWN")
-            f_desc = getattr(finding, "description", "")
-            f_evidence = getattr(finding, "evidence", {})
-
-            finding_dict = {
-                "control_id": f_control,
-                "resource": f_resource_name,
-                "status": f_status,
-                "description": f_desc,
-                "evidence": f_evidence
-            }
-            findings_json.append(finding_dict)
-
-            if f_status in ["FAIL", "ERROR"]:
-                failure_count += 1
-
-            if f_resource_name:
-                arn = f"arn:aws:s3:::{f_resource_name}"
-                update_asset_status(cloud_account_id, arn, f_status)
-
-                db_asset_id = asset_map.get(arn)
-
-                if db_asset_id and f_status == "FAIL":
-                    finding_records.append({
-                        "id": f"find_{uuid.uuid4().hex}",
-                        "controlId": f_control,
-                        "status": f_status,
-                        "description": f_desc,
-                        "severity": "HIGH",
-                        "assetId": db_asset_id,
-                        "scanId": scan_id,
-                        "updatedAt": datetime.now()
-                    })
-
-        # E. Save Finding Records
-        if finding_records:
-            insert_findings_bulk(finding_records)
-
-        # ... (Calculate Score and Save Results logic stays same) ...
-        total_items = len(findings_json)
-        if total_items == 0:
-            score = 100
-        else:
-            score = int(((total_items - failure_count) / total_items) * 100)
-
-        update_scan_results(
-            scan_id=scan_id,
-            status="COMPLETED",
-            score=score,
-            findings={"results": findings_json}
-        )
-        print(f"✅ Scan {scan_id} finished. Score: {score}")
-
-    except Exception as e:
-        print(f"💥 Scan failed: {e}")
-        update_scan_results(scan_id, "FAILED", 0, {"error": str(e)})
-
-
-# ... (The rest of the file: endpoints / download / health_check stay exactly the same)
-# Just make sure the @app.post and @app.get parts are still there at the bottom!
 @app.post("/scan")
-async def start_scan(request: ScanRequest, background_tasks: BackgroundTasks):
-    background_tasks.add_task(
-        run_background_scan,
-        request.role_arn,
-        request.scan_id,
-        request.cloud_account_id,
-        request.external_id
-    )
-    return {"status": "Scan started", "scan_id": request.scan_id}
+def start_scan(request: ScanRequest):
+    # Scans are queued on their Scan row and picked up by worker.py processes,
+    # so they survive restarts and run outside the web workers.
+    # A scan for an account that already has an equivalent one in flight is
+    # attached to it rather than run twice; both ids get the results.
+    leader_id = enqueue_scan(request.scan_id, {
+        "role_arn": request.role_arn,
+        "cloud_account_id": request.cloud_account_id,
+        "external_id": request.external_id,
+        "force_refresh": request.force_refresh,
+        "incremental": request.incremental,
+        "organization": request.organization,
+        "member_role_name": request.member_role_name,
+        "processes": request.processes
+    })
+    if leader_id is None:
+        return {"error": "Scan not found"}
+    if leader_id != request.scan_id:
+        return {"status": "Scan attached", "scan_id": request.scan_id, "attached_to": leader_id}
+    return {"status": "Scan queued", "scan_id": request.scan_id}
 
 
 @app.get("/download/{scan_id}")
-def download_report(scan_id: str):
-    with engine.connect() as conn:
-        result = conn.execute(
-            text('SELECT findings FROM "Scan" WHERE id = :id'),
-            {"id": scan_id}
-        ).fetchone()
-
-    if not result or not result[0]:
+def download_report(
+        scan_id: str,
+        format: Literal["csv", "arrow", "parquet"] = "csv",
+        control_id: Optional[str] = None,
+        status: Optional[str] = None,
+        resource_prefix: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: Annotated[Optional[int], Query(ge=1, le=MAX_DOWNLOAD_PAGE)] = None
+):
+    if not scan_has_findings(scan_id):
         return {"error": "Scan not found or no data available"}
 
-    data = result[0]
-    if isinstance(data, str):
-        data = json.loads(data)
-
-    findings_list = data.get("results", [])
-    csv_content = generate_csv_string(findings_list)
+    filters = {"control_id": control_id, "status": status, "resource_prefix": resource_prefix, "after": after}
+    with_evidence = format != "csv"
+    headers = {"Content-Disposition": f"attachment; filename=scan_report_{scan_id}.{format}"}
+
+    if limit:
+        # One bounded page; the cursor for the next one goes in a header
+        rows, next_after = get_scan_results_page(scan_id, limit, with_evidence=with_evidence, **filters)
+        if next_after is not None:
+            headers["X-Next-After"] = str(next_after)
+    else:
+        # Rows are read with a server-side cursor and sent as they are written,
+        # so the report is never held in memory whole.
+        rows = iter_scan_results(scan_id, with_evidence=with_evidence, **filters)
+
+    if format == "csv":
+        body = iter_csv_chunks(rows)
+        media_type = "text/csv"
+    else:
+        # Columnar formats keep evidence as a struct whose fields are known up front
+        evidence_key_types = get_evidence_key_types([scan_id])
+        body = iter_arrow_chunks(rows, evidence_key_types, format)
+        media_type = ARROW_MEDIA_TYPES[format]
+
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@app.get("/scans/{scan_id}/findings")
+def list_findings(
+        scan_id: str,
+        control_id: Optional[str] = None,
+        status: Optional[str] = None,
+        resource_prefix: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: Annotated[int, Query(ge=1, le=MAX_FINDINGS_PAGE)] = DEFAULT_FINDINGS_PAGE
+):
+    """
+    One page of the scan's results in report order (by resource name when
+    filtered by resource_prefix). Pass `next_after` from the response as
+    `after` to get the next page; it is null on the last one.
+    """
+    if not scan_has_findings(scan_id):
+        return {"error": "Scan not found or no data available"}
 
-    return StreamingResponse(
-        iter([csv_content]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=scan_report_{scan_id}.csv"}
+    rows, next_after = get_scan_results_page(
+        scan_id, limit, with_evidence=True,
+        control_id=control_id, status=status, resource_prefix=resource_prefix, after=after
     )
+    return {"scan_id": scan_id, "findings": [dict(row) for row in rows], "next_after": next_after}
+
+
+@app.get("/scans/{scan_id}/summary")
+def scan_summary(scan_id: str):
+    """
+    Status, score and result counts by status and by control.
+    """
+    summary = get_scan_summary(scan_id)
+    if summary is None:
+        return {"error": "Scan not found"}
+    return summary
 
 
 @app.get("/")
-def health_check():
-    return {"status": "Loxe Engine is Online"}
\ No newline at end of file
+async def health_check():
+    return {"status": "Loxe Engine is Online"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text format: this API process's metrics plus the latest
+    snapshot of every live scan worker, told apart by the `process` label.
+    """
+    sources = [({"process": f"api-{os.getpid()}"}, REGISTRY.snapshot())]
+    sources += [({"process": worker_id}, snapshot) for worker_id, snapshot in get_worker_metrics()]
+    return PlainTextResponse(render(sources), media_type="text/plain; version=0.0.4")
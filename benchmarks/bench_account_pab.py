@@ -0,0 +1,60 @@
+"""
+Benchmark: S3 API calls per scan with and without an account-level Public Access Block.
+
+Runs EvidenceProcessor.run_s3_checks against the stub session for three
+account settings: none, partial (two of four settings) and full. With the
+full account block every bucket is covered, so the per-bucket
+GetPublicAccessBlock calls are skipped. Reports calls made, calls skipped
+and wall time.
+
+    python -m benchmarks.bench_account_pab --buckets 500 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest import mock
+
+from connectors.aws_connector import AWSConnector
+from core.evidence_processor import EvidenceProcessor
+from benchmarks.stubs import StubSession
+
+ACCOUNT_SETTINGS = {
+    "none": None,
+    "partial": {"BlockPublicAcls": True, "IgnorePublicAcls": True},
+    "full": {"BlockPublicAcls": True, "IgnorePublicAcls": True, "BlockPublicPolicy": True,
+             "RestrictPublicBuckets": True},
+}
+
+
+def run(bucket_count, latency, account_pab):
+    session = StubSession(bucket_count, latency, account_pab=account_pab)
+    with contextlib.redirect_stdout(io.StringIO()):
+        with mock.patch.object(AWSConnector, "_create_session", return_value=session):
+            processor = EvidenceProcessor(role_arn="arn:aws:iam::123456789012:role/bench",
+                                          external_id="bench", region="us-east-1")
+        start = time.perf_counter()
+        findings = processor.run_s3_checks()
+        elapsed = time.perf_counter() - start
+    return session, processor.rules_engine.skipped_calls, elapsed, findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stubbed API call")
+    args = parser.parse_args()
+
+    print(f"{args.buckets} buckets, {args.latency * 1000:.0f} ms per call")
+    print(f"{'account PAB':<12} {'bucket PAB calls':>17} {'account calls':>14} {'skipped':>8} "
+          f"{'seconds':>8} {'PASS':>5} {'FAIL':>5}")
+    for name, account_pab in ACCOUNT_SETTINGS.items():
+        session, skipped, elapsed, findings = run(args.buckets, args.latency, account_pab)
+        statuses = [f.status for f in findings]
+        print(f"{name:<12} {session.s3.calls['get_public_access_block']:>17} "
+              f"{session.s3control.calls['get_public_access_block']:>14} {skipped:>8} {elapsed:>8.2f} "
+              f"{statuses.count('PASS'):>5} {statuses.count('FAIL'):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: per-finding update_asset_status vs set-based update_asset_statuses.
+
+Needs a reachable Postgres in DATABASE_URL. Everything runs inside the
+throwaway schema from benchmarks.pg, so the real tables are never touched.
+Reports wall time, statements, connection checkouts and commits for each
+approach.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_asset_status_update --assets 5000
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest import mock
+
+from sqlalchemy import text
+
+import database
+from benchmarks.pg import bench_engine, RoundTripCounter
+
+
+def prepare(engine, asset_count, account_id):
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT INTO "Asset" (id, "resourceId", "cloudAccountId", status)
+            SELECT 'asset_' || i, 'arn:aws:s3:::bench-bucket-' || i, :account, 'UNKNOWN'
+            FROM generate_series(1, :count) AS i
+        '''), {"account": account_id, "count": asset_count})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=5000)
+    args = parser.parse_args()
+
+    account_id = "bench-account"
+    statuses = {
+        f"arn:aws:s3:::bench-bucket-{i}": ("FAIL" if i % 4 == 0 else "PASS")
+        for i in range(1, args.assets + 1)
+    }
+
+    results = []
+    with bench_engine() as engine:
+        prepare(engine, args.assets, account_id)
+        counter = RoundTripCounter(engine)
+
+        with mock.patch.object(database, "engine", engine), contextlib.redirect_stdout(io.StringIO()):
+            counter.reset()
+            start = time.perf_counter()
+            for arn, status in statuses.items():
+                database.update_asset_status(account_id, arn, status)
+            results.append(("per-finding", time.perf_counter() - start,
+                            counter.statements, counter.checkouts, counter.commits))
+
+            counter.reset()
+            start = time.perf_counter()
+            database.update_asset_statuses(account_id, {arn: "ERROR" for arn in statuses})
+            results.append(("bulk", time.perf_counter() - start,
+                            counter.statements, counter.checkouts, counter.commits))
+
+        with engine.connect() as conn:
+            updated = conn.execute(text('SELECT count(*) FROM "Asset" WHERE status = \'ERROR\'')).scalar()
+
+    assert updated == args.assets, f"bulk update touched {updated} of {args.assets} assets"
+
+    print(f"{args.assets} assets")
+    print(f"{'approach':<12} {'seconds':>9} {'statements':>11} {'checkouts':>10} {'commits':>8}")
+    for name, elapsed, statements, checkouts, commits in results:
+        print(f"{name:<12} {elapsed:>9.3f} {statements:>11} {checkouts:>10} {commits:>8}")
+
+
+if __name__ == "__main__":
+    main()
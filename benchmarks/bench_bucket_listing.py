@@ -0,0 +1,75 @@
+"""
+Benchmark: one-shot ListBuckets vs paged, streaming enumeration.
+
+Runs EvidenceProcessor.iter_assets against the stub session, once with the
+whole listing in a single page (what a plain list_buckets() call returns)
+and once paged with MaxBuckets. ListBuckets latency grows with the page
+size, like the real API. Reports the time until the first inventory asset
+is ready, the total time and the peak memory traced while listing.
+
+    python -m benchmarks.bench_bucket_listing --buckets 10000 50000 --page-size 1000
+"""
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+from unittest import mock
+
+from connectors.aws_connector import AWSConnector
+from core.evidence_processor import EvidenceProcessor
+from benchmarks.stubs import StubS3Client, StubSession
+
+# ListBuckets cost per bucket returned
+PER_BUCKET_LATENCY = 0.00002
+
+
+class SizedListingS3Client(StubS3Client):
+    def list_buckets(self, MaxBuckets=None, ContinuationToken=None):
+        response = super().list_buckets(MaxBuckets=MaxBuckets, ContinuationToken=ContinuationToken)
+        time.sleep(PER_BUCKET_LATENCY * len(response["Buckets"]))
+        return response
+
+
+def run(bucket_count, page_size):
+    session = StubSession(bucket_count, latency=0)
+    session.s3 = SizedListingS3Client(bucket_count, latency=0.01)
+    session.s3.get_bucket_location = lambda Bucket: {"LocationConstraint": None}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with mock.patch.object(AWSConnector, "_create_session", return_value=session):
+            processor = EvidenceProcessor(role_arn="arn:aws:iam::123456789012:role/bench",
+                                          external_id="bench", region="us-east-1", max_workers=1)
+        processor.snapshot.page_size = page_size
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        first_asset = None
+        count = 0
+        for _ in processor.iter_assets():
+            if first_asset is None:
+                first_asset = time.perf_counter() - started
+            count += 1
+        total = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    assert count == bucket_count
+    return first_asset, total, peak, session.s3.calls["list_buckets"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'buckets':>8} {'listing':<12} {'pages':>6} {'first asset s':>14} {'total s':>8} {'peak MiB':>9}")
+    for count in args.buckets:
+        for name, page_size in (("one page", count), (f"paged {args.page_size}", args.page_size)):
+            first_asset, total, peak, pages = run(count, page_size)
+            print(f"{count:>8} {name:<12} {pages:>6} {first_asset:>14.3f} {total:>8.2f} {peak / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
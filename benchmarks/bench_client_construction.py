@@ -0,0 +1,59 @@
+"""
+Microbenchmark: cost of obtaining an S3 client.
+
+"before" builds a fresh client from the session on every call, as
+RulesEngine, collect_assets and list_s3_buckets each used to. "after"
+goes through AWSConnector.client(), which builds once per
+(service, region) and then returns the pooled instance. No network
+calls are made; this is purely client-construction overhead.
+
+    python -m benchmarks.bench_client_construction --iterations 50
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest import mock
+
+import boto3
+
+from connectors.aws_connector import AWSConnector
+
+
+def offline_session():
+    return boto3.Session(aws_access_key_id="AKIABENCH", aws_secret_access_key="bench",
+                         aws_session_token="bench", region_name="us-east-1")
+
+
+def time_calls(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    session = offline_session()
+    # Warm botocore's loader cache so both sides measure steady-state construction
+    session.client("s3")
+
+    before = time_calls(lambda: session.client("s3"), args.iterations)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with mock.patch.object(AWSConnector, "_create_session", return_value=offline_session()):
+            connector = AWSConnector(role_arn="arn:aws:iam::000000000000:role/bench", external_id="bench")
+    first = time_calls(lambda: connector.client("s3"), 1)
+    after = time_calls(lambda: connector.client("s3"), args.iterations)
+
+    print(f"session.client('s3') per call:      {before * 1000:8.3f} ms")
+    print(f"connector.client('s3') first call:  {first * 1000:8.3f} ms")
+    print(f"connector.client('s3') pooled call: {after * 1000:8.3f} ms")
+    print(f"speedup on repeat calls:            {before / after:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
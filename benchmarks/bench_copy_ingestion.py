@@ -0,0 +1,117 @@
+"""
+Benchmark: multi-row INSERT ... VALUES vs chunked COPY ingestion.
+
+"values" is the previous upsert_assets implementation: one
+insert(...).values(records) statement with ON CONFLICT. "copy" is the
+current streaming path (COPY into a staging table, then merge). Reports
+wall time and peak Python memory for asset upserts and finding inserts.
+
+Needs a reachable Postgres in DATABASE_URL; runs in the throwaway schema
+from benchmarks.pg.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_copy_ingestion --rows 1000 10000 100000
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+import database
+from benchmarks.pg import bench_engine
+
+ACCOUNT_ID = "bench-account"
+
+
+def asset_stream(count):
+    for i in range(count):
+        yield {
+            "name": f"bench-bucket-{i}",
+            "resourceId": f"arn:aws:s3:::bench-bucket-{i}",
+            "type": "AWS::S3::Bucket",
+            "provider": "AWS",
+            "region": "us-east-1",
+            "status": "UNKNOWN",
+            "metadata": {"creation_date": "2024-01-01T00:00:00", "owner_id": "bench-owner"},
+            "updatedAt": datetime.now(),
+        }
+
+
+def finding_stream(asset_ids):
+    for asset_id in asset_ids:
+        yield {
+            "id": f"find_{uuid.uuid4().hex}",
+            "controlId": "CC6.1",
+            "status": "FAIL",
+            "description": "S3 bucket Public Access Block is not fully enabled.",
+            "severity": "HIGH",
+            "assetId": asset_id,
+            "scanId": "bench-scan",
+            "updatedAt": datetime.now(),
+        }
+
+
+def values_upsert_assets(conn, assets):
+    records = list(database._asset_records(assets, ACCOUNT_ID))
+    stmt = insert(database.asset_table).values(records)
+    update_dict = {col.name: col for col in stmt.excluded if col.name not in ['id', 'resourceId', 'cloudAccountId']}
+    conn.execute(stmt.on_conflict_do_update(index_elements=['cloudAccountId', 'resourceId'], set_=update_dict))
+
+
+def values_insert_findings(conn, findings):
+    conn.execute(insert(database.finding_table).values(list(findings)))
+
+
+def copy_upsert_assets(conn, assets):
+    database._upsert_assets(conn, database._asset_records(assets, ACCOUNT_ID))
+
+
+def copy_insert_findings(conn, findings):
+    database._insert_findings(conn, findings)
+
+
+def measure(engine, fn, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            fn(conn, rows)
+        error = ""
+    except Exception as e:
+        error = type(e).__name__
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, error
+
+
+def reset(engine):
+    with engine.begin() as conn:
+        conn.execute(text('TRUNCATE "Finding", "Asset"'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>7} {'table':<8} {'path':<7} {'seconds':>8} {'peak MiB':>9}")
+    with bench_engine() as engine:
+        for count in args.rows:
+            for name, upsert, insert_findings in [("values", values_upsert_assets, values_insert_findings),
+                                                  ("copy", copy_upsert_assets, copy_insert_findings)]:
+                reset(engine)
+                elapsed, peak, error = measure(engine, upsert, asset_stream(count))
+                print(f"{count:>7} {'Asset':<8} {name:<7} {elapsed:>8.2f} {peak / 2 ** 20:>9.1f} {error}")
+
+                with engine.connect() as conn:
+                    asset_ids = [row[0] for row in conn.execute(text('SELECT id FROM "Asset"'))]
+                elapsed, peak, error = measure(engine, insert_findings, finding_stream(asset_ids))
+                print(f"{count:>7} {'Finding':<8} {name:<7} {elapsed:>8.2f} {peak / 2 ** 20:>9.1f} {error}")
+
+
+if __name__ == "__main__":
+    main()
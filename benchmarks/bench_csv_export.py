@@ -0,0 +1,155 @@
+"""
+Benchmark: pandas CSV export vs the streaming /download/{scan_id} path.
+
+"pandas" is the previous download_report: load the whole Scan.findings
+blob, build a DataFrame, write the CSV into a StringIO and send it as one
+chunk. "streaming" is the current api.download_report (server-side cursor
+over the "ScanResult" rows, csv module, chunked StreamingResponse).
+
+Each approach runs in its own process so peak RSS is not shared. Reports
+module import time, time to first byte, total time and peak RSS above the
+process baseline.
+
+Needs a reachable Postgres in DATABASE_URL; runs in the throwaway schema
+from benchmarks.pg.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_csv_export --results 10000 100000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from sqlalchemy import text
+
+SCAN_ID = "bench-scan"
+
+
+def rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def pandas_download(scan_id):
+    import pandas as pd
+    from fastapi.responses import StreamingResponse
+    from database import engine
+
+    with engine.connect() as conn:
+        result = conn.execute(text('SELECT findings FROM "Scan" WHERE id = :id'), {"id": scan_id}).fetchone()
+
+    data = result[0]
+    if isinstance(data, str):
+        data = json.loads(data)
+
+    df = pd.DataFrame(data.get("results", []))
+    df = df.reindex(columns=['control_id', 'status', 'resource', 'description'])
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False)
+    return StreamingResponse(iter([csv_buffer.getvalue()]), media_type="text/csv")
+
+
+def streaming_download(scan_id):
+    import api
+    return api.download_report(scan_id)
+
+
+async def consume(response):
+    first_byte = None
+    size = 0
+    async for chunk in response.body_iterator:
+        if first_byte is None:
+            first_byte = time.perf_counter()
+        size += len(chunk)
+    return first_byte, size
+
+
+def run_child(mode):
+    import database  # noqa: F401  (engine setup is part of the baseline)
+    import fastapi.responses  # noqa: F401
+    baseline = rss_mib()
+
+    started = time.perf_counter()
+    if mode == "pandas":
+        import pandas  # noqa: F401
+        handler = pandas_download
+    else:
+        import api  # noqa: F401
+        handler = streaming_download
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = handler(SCAN_ID)
+    first_byte, size = asyncio.run(consume(response))
+    finished = time.perf_counter()
+
+    print(json.dumps({
+        "import": import_seconds,
+        "ttfb": first_byte - started,
+        "total": finished - started,
+        "bytes": size,
+        "rss": rss_mib() - baseline,
+    }))
+
+
+def seed(engine, count):
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT INTO "Scan" (id, status, score, findings)
+            SELECT :id, 'COMPLETED', 50, jsonb_build_object('results', jsonb_agg(jsonb_build_object(
+                'control_id', 'CC6.1',
+                'resource', 'bench-bucket-' || i,
+                'status', CASE WHEN i % 2 = 0 THEN 'FAIL' ELSE 'PASS' END,
+                'description', 'S3 bucket Public Access Block is not fully enabled.',
+                'evidence', jsonb_build_object('BlockPublicAcls', true, 'IgnorePublicAcls', true,
+                                               'BlockPublicPolicy', true, 'RestrictPublicBuckets', false)
+            )))
+            FROM generate_series(1, :count) AS i
+        '''), {"id": SCAN_ID, "count": count})
+        # The streaming path reads the per-result rows
+        conn.execute(text('''
+            INSERT INTO "ScanResult" ("scanId", position, "controlId", status, resource, description, evidence)
+            SELECT :id, r.ordinality - 1, r.value->>'control_id', r.value->>'status', r.value->>'resource',
+                   r.value->>'description', r.value->'evidence'
+            FROM "Scan", jsonb_array_elements(findings->'results') WITH ORDINALITY AS r
+            WHERE id = :id
+        '''), {"id": SCAN_ID})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--child", choices=["pandas", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    from benchmarks.pg import bench_engine, SCHEMA
+
+    env = dict(os.environ, PGOPTIONS=f"-csearch_path={SCHEMA}")
+    print(f"{'results':>8} {'path':<10} {'import s':>9} {'ttfb s':>8} {'total s':>8} {'MiB out':>8} {'peak RSS MiB':>13}")
+    with bench_engine() as engine:
+        for count in args.results:
+            with engine.begin() as conn:
+                conn.execute(text('TRUNCATE "Scan" CASCADE'))
+            seed(engine, count)
+
+            for mode in ("pandas", "streaming"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_csv_export", "--child", mode],
+                    env=env, capture_output=True, text=True, check=True
+                ).stdout
+                stats = json.loads(output.strip().splitlines()[-1])
+                print(f"{count:>8} {mode:<10} {stats['import']:>9.3f} {stats['ttfb']:>8.3f} {stats['total']:>8.3f} "
+                      f"{stats['bytes'] / 2 ** 20:>8.1f} {stats['rss']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Microbenchmark: overhead of the AWS call instrumentation behind /metrics.
+
+Makes --calls GetPublicAccessBlock calls on a real boto3 S3 client whose
+requests are answered in-process by a before-send handler (no network),
+with and without connectors.aws_connector.instrument_client, and reports
+the best per-call cost over --rounds interleaved rounds (single runs are
+noisy). Also times a bare Histogram.observe for reference.
+
+    python -m benchmarks.bench_instrumentation --calls 2000 --rounds 5
+"""
+import argparse
+import time
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from connectors.aws_connector import CallStats, instrument_client
+from core.metrics import Histogram
+
+PAB_BODY = (b'<PublicAccessBlockConfiguration xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            b"<BlockPublicAcls>true</BlockPublicAcls></PublicAccessBlockConfiguration>")
+
+
+class RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def answer(request, **kwargs):
+    return AWSResponse(request.url, 200, {}, RawBody(PAB_BODY))
+
+
+def s3_client(instrumented):
+    client = boto3.Session(aws_access_key_id="x", aws_secret_access_key="y").client("s3", region_name="us-east-1")
+    client.meta.events.register("before-send", answer)
+    if instrumented:
+        instrument_client(client, "s3", CallStats())
+    return client
+
+
+def per_call(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    plain = s3_client(instrumented=False)
+    instrumented = s3_client(instrumented=True)
+    plain.get_public_access_block(Bucket="bench")
+    instrumented.get_public_access_block(Bucket="bench")
+
+    before = after = float("inf")
+    for _ in range(args.rounds):
+        before = min(before, per_call(lambda: plain.get_public_access_block(Bucket="bench"), args.calls))
+        after = min(after, per_call(lambda: instrumented.get_public_access_block(Bucket="bench"), args.calls))
+
+    histogram = Histogram("bench_seconds", "bench", ("operation",))
+    observe = per_call(lambda: histogram.observe(0.01, "GetPublicAccessBlock"), args.calls * 20)
+
+    print(f"{args.calls} GetPublicAccessBlock calls x {args.rounds} rounds, answered in-process")
+    print(f"{'':<14} {'us/call':>9}")
+    print(f"{'plain':<14} {before * 1e6:>9.1f}")
+    print(f"{'instrumented':<14} {after * 1e6:>9.1f}  ({(after - before) * 1e6:+.1f} us, "
+          f"{(after - before) / before:+.1%})")
+    print(f"{'observe()':<14} {observe * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: organization scan wall-clock time vs worker processes.
+
+Starts the local stub AWS endpoint from benchmarks.load_test_async_scans
+(Organizations ListAccounts, STS and the S3 calls, each delayed by
+--latency) and runs scan_pipeline.run_org_scan for --accounts member
+accounts with 1, 2, 4, ... processes. Each member scan is a full scan
+writing Assets, Findings and ScanResult rows.
+
+Needs a reachable Postgres in DATABASE_URL; runs in the throwaway schema
+from benchmarks.pg.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_org_scan --accounts 16 --buckets 100
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from sqlalchemy import text
+
+ORG_SCAN_ID = "bench-org"
+
+
+def member_scan(*args):
+    """
+    scan_pipeline._scan_member_account, but answering the account-level
+    Public Access Block lookup locally: s3-control puts the account ID in the
+    hostname, which the stub endpoint cannot serve.
+    """
+    import scan_pipeline
+    from core.rules_engine import ApiResult, RulesEngine
+
+    RulesEngine._fetch_account = lambda self, call: ApiResult(
+        error_code="NoSuchPublicAccessBlockConfiguration", error="none"
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ORIGINAL_MEMBER_SCAN(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--buckets", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stubbed API call")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    from benchmarks.load_test_async_scans import start_stub_endpoint
+    from benchmarks.pg import bench_engine, SCHEMA
+
+    stub, port = start_stub_endpoint(args.buckets, args.latency, account_count=args.accounts)
+    # Read by the spawned member processes too
+    os.environ.update({
+        "AWS_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "PGOPTIONS": f"-csearch_path={SCHEMA}",
+        "LOXE_EVIDENCE_CACHE": "0",
+        # run_org_scan never uses more processes than this
+        "LOXE_ORG_SCAN_PROCESSES": str(max(args.processes)),
+    })
+
+    import scan_pipeline
+
+    print(f"{args.accounts} accounts x {args.buckets} buckets, {args.latency * 1000:.0f} ms per call")
+    print(f"{'processes':>9} {'seconds':>8} {'completed':>10} {'results':>8}")
+    try:
+        with bench_engine() as engine:
+            for processes in args.processes:
+                with engine.begin() as conn:
+                    conn.execute(text('TRUNCATE "Scan", "Asset", "ScanResult" CASCADE'))
+                    conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (:id, \'RUNNING\')'), {"id": ORG_SCAN_ID})
+
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    asyncio.run(scan_pipeline.run_org_scan(
+                        "arn:aws:iam::000000000001:role/loxe", ORG_SCAN_ID, "bench-org-account", "bench-external",
+                        processes=processes
+                    ))
+                elapsed = time.perf_counter() - started
+
+                with engine.connect() as conn:
+                    findings = conn.execute(text('SELECT findings FROM "Scan" WHERE id = :id'),
+                                            {"id": ORG_SCAN_ID}).scalar()
+                summary = findings.get("organization", {})
+                print(f"{processes:>9} {elapsed:>8.2f} {summary.get('completed', 0):>10} "
+                      f"{findings.get('result_count', 0):>8}")
+    finally:
+        stub.terminate()
+
+
+# Spawned member processes import this module to find member_scan
+import scan_pipeline as _scan_pipeline  # noqa: E402
+
+ORIGINAL_MEMBER_SCAN = _scan_pipeline._scan_member_account
+_scan_pipeline._scan_member_account = member_scan
+
+if __name__ == "__main__":
+    main()
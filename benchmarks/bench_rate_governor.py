@@ -0,0 +1,80 @@
+"""
+Benchmark: concurrent scans of one account against an API limit, with and
+without the rate governor.
+
+Starts the local stub AWS endpoint from benchmarks.load_test_async_scans
+with GetPublicAccessBlock limited to --limit requests per second (beyond
+that it answers SlowDown, like S3). Then runs --scans
+EvidenceProcessor.run_s3_checks at once for the same account, first with
+the governor effectively off and then paced at --rate. Reports the
+throttled requests the stub saw, ERROR findings (false errors: every
+bucket is readable), the time spent queueing in the governor and the
+wall time.
+
+    python -m benchmarks.bench_rate_governor --scans 8 --buckets 200 --limit 100 --rate 90
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=8)
+    parser.add_argument("--buckets", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100, help="requests per second the stub allows")
+    parser.add_argument("--rate", type=float, default=90, help="governor rate per account")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per stubbed API call")
+    args = parser.parse_args()
+
+    from benchmarks.load_test_async_scans import start_stub_endpoint
+
+    stub, port = start_stub_endpoint(args.buckets, args.latency, throttle_rate=args.limit)
+    os.environ.update({
+        "AWS_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    })
+
+    from connectors import aws_connector
+    from connectors.rate_governor import RateGovernor
+    from core.evidence_processor import EvidenceProcessor
+    from core.rules_engine import ApiResult, RulesEngine
+
+    def scan(_):
+        processor = EvidenceProcessor(role_arn="arn:aws:iam::000000000123:role/bench",
+                                      external_id="bench-external", region="us-east-1")
+        return processor.run_s3_checks()
+
+    # s3-control puts the account ID in the hostname, which the stub cannot serve
+    no_account_block = mock.patch.object(
+        RulesEngine, "_fetch_account",
+        lambda self, call: ApiResult(error_code="NoSuchPublicAccessBlockConfiguration", error="none")
+    )
+
+    print(f"{args.scans} scans x {args.buckets} buckets, stub limit {args.limit} req/s")
+    print(f"{'governor':<12} {'throttled':>10} {'ERROR':>6} {'queued s':>9} {'seconds':>8}")
+    try:
+        for name, rate in (("off", 1e9), (f"{args.rate:g} req/s", args.rate)):
+            governor = RateGovernor(rate=rate, burst=int(min(rate, args.limit)))
+            with no_account_block, mock.patch.object(aws_connector, "GOVERNOR", governor), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.scans) as pool:
+                    findings = [f for result in pool.map(scan, range(args.scans)) for f in result]
+                elapsed = time.perf_counter() - started
+
+            metrics = governor.metrics("000000000123")["000000000123/s3/us-east-1"]
+            errors = sum(1 for f in findings if f.status == "ERROR")
+            print(f"{name:<12} {metrics['throttles']:>10} {errors:>6} {metrics['wait_seconds']:>9.1f} {elapsed:>8.2f}")
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: EvidenceProcessor.run_s3_checks at different worker counts.
+
+Runs against a stubbed S3 client that sleeps on every call, so the numbers
+show how well the thread pool hides per-bucket round-trip latency.
+
+    python -m benchmarks.bench_s3_checks --buckets 500 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import time
+from unittest import mock
+
+from connectors.aws_connector import AWSConnector
+from core.evidence_processor import EvidenceProcessor
+from benchmarks.stubs import StubSession
+
+
+def run(bucket_count, latency, workers):
+    session = StubSession(bucket_count, latency)
+    # The processor narrates every step; keep the results table readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        with mock.patch.object(AWSConnector, "_create_session", return_value=session):
+            processor = EvidenceProcessor(role_arn="arn:aws:iam::000000000000:role/bench",
+                                          external_id="bench", region="us-east-1")
+
+        start = time.perf_counter()
+        findings = processor.run_s3_checks(max_workers=workers)
+        elapsed = time.perf_counter() - start
+    return elapsed, findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stubbed API call")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    baseline = None
+    reference = None
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    for workers in args.workers:
+        elapsed, findings = run(args.buckets, args.latency, workers)
+        signature = [(f.resource, f.status) for f in findings]
+        if reference is None:
+            reference = signature
+        assert signature == reference, "finding order/content changed with worker count"
+
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
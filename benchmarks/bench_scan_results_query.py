@@ -0,0 +1,104 @@
+"""
+Benchmark: page latency over "ScanResult" rows vs decoding the Scan.findings blob.
+
+For each scan size, seeds one scan both ways and reports the median time
+to serve a 100-row page:
+- "blob" loads Scan.findings and filters in Python (the old only option).
+- The other rows use database.get_scan_results_page with the named filter
+  (first page, a deep keyset page, status, control and resource prefix).
+
+Needs a reachable Postgres in DATABASE_URL; runs in the throwaway schema
+from benchmarks.pg.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_scan_results_query --results 10000 100000 500000
+"""
+import argparse
+import statistics
+import time
+from unittest import mock
+
+from sqlalchemy import text
+
+import database
+from benchmarks.pg import bench_engine
+
+SCAN_ID = "bench-scan"
+PAGE = 100
+REPEAT = 20
+
+
+def seed(engine, count):
+    with engine.begin() as conn:
+        conn.execute(text('TRUNCATE "Scan" CASCADE'))
+        conn.execute(text('INSERT INTO "Scan" (id, status, score) VALUES (:id, \'COMPLETED\', 0)'), {"id": SCAN_ID})
+        conn.execute(text('''
+            INSERT INTO "ScanResult" ("scanId", position, "controlId", status, resource, description, evidence)
+            SELECT :id, i, CASE WHEN i % 5 = 0 THEN 'CC8.1' ELSE 'CC6.1' END,
+                   CASE WHEN i % 7 = 0 THEN 'FAIL' ELSE 'PASS' END,
+                   -- Listing order is not name order, as in a real account
+                   'bench-bucket-' || lpad(((i::bigint * 7919) % :count)::text, 7, '0'),
+                   'S3 bucket Public Access Block is enabled.',
+                   jsonb_build_object('BlockPublicAcls', true, 'RestrictPublicBuckets', i % 7 <> 0)
+            FROM generate_series(0, :count - 1) AS i
+        '''), {"id": SCAN_ID, "count": count})
+        conn.execute(text('''
+            UPDATE "Scan" SET findings = (
+                SELECT jsonb_build_object('results', jsonb_agg(jsonb_build_object(
+                    'control_id', "controlId", 'status', status, 'resource', resource,
+                    'description', description, 'evidence', evidence) ORDER BY position))
+                FROM "ScanResult" WHERE "scanId" = :id
+            ) WHERE id = :id
+        '''), {"id": SCAN_ID})
+        conn.execute(text('ANALYZE "ScanResult"'))
+
+
+def blob_page(engine):
+    with engine.connect() as conn:
+        data = conn.execute(text('SELECT findings FROM "Scan" WHERE id = :id'), {"id": SCAN_ID}).scalar()
+    return [row for row in data["results"] if row["status"] == "FAIL"][:PAGE]
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, nargs="+", default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    print(f"{'results':>8} {'query':<16} {'median ms':>10}")
+    with bench_engine() as engine, mock.patch.object(database, "engine", engine):
+        for count in args.results:
+            seed(engine, count)
+            cases = [
+                ("blob (FAIL)", lambda: blob_page(engine)),
+                ("first page", lambda: database.get_scan_results_page(SCAN_ID, PAGE)),
+                ("deep page", lambda: database.get_scan_results_page(SCAN_ID, PAGE, after=count - PAGE * 2)),
+                ("status=FAIL", lambda: database.get_scan_results_page(SCAN_ID, PAGE, status="FAIL",
+                                                                       after=count // 2)),
+                ("control=CC8.1", lambda: database.get_scan_results_page(SCAN_ID, PAGE, control_id="CC8.1",
+                                                                         after=count // 2)),
+                ("resource prefix", lambda: database.get_scan_results_page(
+                    SCAN_ID, PAGE, resource_prefix=f"bench-bucket-{count // 2:07d}"[:-2])),
+                # Matches every row; a deep page of it
+                ("wide prefix", lambda: database.get_scan_results_page(
+                    SCAN_ID, PAGE, resource_prefix="bench-bucket-", after=count // 2)),
+                ("1k-row prefix", lambda: database.get_scan_results_page(
+                    SCAN_ID, PAGE, resource_prefix=f"bench-bucket-{count // 2:07d}"[:-3])),
+                ("10k-row prefix", lambda: database.get_scan_results_page(
+                    SCAN_ID, PAGE, resource_prefix=f"bench-bucket-{count // 2:07d}"[:-4])),
+                ("100k-row prefix", lambda: database.get_scan_results_page(
+                    SCAN_ID, PAGE, resource_prefix=f"bench-bucket-{count // 2:07d}"[:-5], after=count // 2)),
+            ]
+            for name, fn in cases:
+                print(f"{count:>8} {name:<16} {timed(fn) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
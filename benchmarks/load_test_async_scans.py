@@ -0,0 +1,276 @@
+"""
+Load test: API responsiveness while many scans run at once.
+
+Starts a local stub AWS endpoint (STS AssumeRole plus the S3 calls a scan
+makes, each delayed by --latency) and points boto3 at it through
+AWS_ENDPOINT_URL. It then starts --scans scan_pipeline.run_scan tasks on
+the FastAPI app's event loop and polls GET / until every scan has finished,
+reporting health-check latency percentiles. Postgres is replaced by in-memory no-ops with a small
+delay, so only the scan engine is under test.
+
+    python -m benchmarks.load_test_async_scans --scans 50 --buckets 200
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+BUCKET_COUNT = 200
+ACCOUNT_COUNT = 3
+LATENCY = 0.02
+DB_LATENCY = 0.005
+# GetPublicAccessBlock requests per second the stub serves before answering SlowDown (None: no limit)
+THROTTLE_RATE = None
+_throttle_window = [0, 0]
+_throttle_lock = threading.Lock()
+
+
+def _over_limit():
+    with _throttle_lock:
+        second = int(time.monotonic())
+        if _throttle_window[0] != second:
+            _throttle_window[:] = [second, 0]
+        _throttle_window[1] += 1
+        return _throttle_window[1] > THROTTLE_RATE
+
+
+class StubAWSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200, content_type="text/xml"):
+        time.sleep(LATENCY)
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("X-Amz-Target", "").endswith(".ListAccounts"):
+            # Organizations ListAccounts (JSON protocol)
+            accounts = ",".join(
+                f'{{"Id": "{i:012d}", "Name": "member-{i}", "Status": "ACTIVE"}}' for i in range(1, ACCOUNT_COUNT + 1)
+            )
+            self._reply(f'{{"Accounts": [{accounts}]}}', content_type="application/x-amz-json-1.1")
+            return
+
+        # STS AssumeRole (query protocol)
+        expiration = (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._reply(
+            '<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/"><AssumeRoleResult>'
+            "<Credentials><AccessKeyId>AKIASTUB</AccessKeyId><SecretAccessKey>stub</SecretAccessKey>"
+            f"<SessionToken>stub</SessionToken><Expiration>{expiration}</Expiration></Credentials>"
+            "<AssumedRoleUser><Arn>arn:aws:sts::000000000000:assumed-role/stub/stub</Arn>"
+            "<AssumedRoleId>AROASTUB:stub</AssumedRoleId></AssumedRoleUser>"
+            "</AssumeRoleResult></AssumeRoleResponse>"
+        )
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        bucket = url.path.strip("/")
+
+        if not bucket:
+            start = int(query.get("continuation-token", ["0"])[0])
+            end = min(start + int(query.get("max-buckets", [BUCKET_COUNT])[0]), BUCKET_COUNT)
+            buckets = "".join(
+                f"<Bucket><Name>load-bucket-{i:05d}</Name><CreationDate>2024-01-01T00:00:00.000Z</CreationDate></Bucket>"
+                for i in range(start, end)
+            )
+            token = f"<ContinuationToken>{end}</ContinuationToken>" if end < BUCKET_COUNT else ""
+            self._reply(
+                '<ListAllMyBucketsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                f"<Owner><ID>stub-owner</ID></Owner><Buckets>{buckets}</Buckets>{token}</ListAllMyBucketsResult>"
+            )
+        elif "location" in query:
+            self._reply('<LocationConstraint xmlns="http://s3.amazonaws.com/doc/2006-03-01/"/>')
+        elif "publicAccessBlock" in query:
+            if THROTTLE_RATE is not None and _over_limit():
+                self._reply("<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>",
+                            status=503)
+                return
+            # A mix of compliant, partially configured and unconfigured buckets
+            index = int(bucket.rsplit("-", 1)[1])
+            if index % 10 == 0:
+                self._reply(
+                    "<Error><Code>NoSuchPublicAccessBlockConfiguration</Code>"
+                    "<Message>The public access block configuration was not found</Message></Error>",
+                    status=404
+                )
+                return
+            restrict = "false" if index % 3 == 0 else "true"
+            self._reply(
+                '<PublicAccessBlockConfiguration xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                "<BlockPublicAcls>true</BlockPublicAcls><IgnorePublicAcls>true</IgnorePublicAcls>"
+                f"<BlockPublicPolicy>true</BlockPublicPolicy><RestrictPublicBuckets>{restrict}</RestrictPublicBuckets>"
+                "</PublicAccessBlockConfiguration>"
+            )
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+
+def serve_stub_endpoint(bucket_count, latency, ready, account_count=ACCOUNT_COUNT, throttle_rate=None):
+    global BUCKET_COUNT, LATENCY, ACCOUNT_COUNT, THROTTLE_RATE
+    BUCKET_COUNT, LATENCY, ACCOUNT_COUNT, THROTTLE_RATE = bucket_count, latency, account_count, throttle_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAWSHandler)
+    server.daemon_threads = True
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def start_stub_endpoint(bucket_count, latency, account_count=ACCOUNT_COUNT, throttle_rate=None):
+    """
+    Runs the stub in its own process so its CPU time is not charged to the API under test.
+    Returns (process, port).
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_stub_endpoint,
+                                      args=(bucket_count, latency, ready, account_count, throttle_rate), daemon=True)
+    process.start()
+    return process, ready.get(timeout=10)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run_load(scans):
+    import httpx
+    import api
+    import scan_pipeline
+    from core.rules_engine import ApiResult, RulesEngine
+
+    finished = asyncio.Event()
+    completed = []
+    loop = asyncio.get_running_loop()
+
+    def db_call(*args, **kwargs):
+        time.sleep(DB_LATENCY)
+        return {}
+
+    class FakeUnitOfWork:
+        def __init__(self, scan_id, cloud_account_id):
+            self.scan_id = scan_id
+            self.db_stats = {"statements": 0, "seconds": 0.0, "rows_written": {}}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            time.sleep(DB_LATENCY)
+            completed.append((self.scan_id, "COMPLETED" if exc[0] is None else "FAILED"))
+            if len(completed) == scans:
+                loop.call_soon_threadsafe(finished.set)
+
+        upsert_assets = get_asset_map = update_asset_statuses = sync_findings = db_call
+        save_results = save_scan_state = db_call
+
+        # Read by incremental scans: no earlier scan, so they fall back to a full scan
+        def get_scan_state(self):
+            time.sleep(DB_LATENCY)
+            return None
+
+        def get_asset_regions(self):
+            time.sleep(DB_LATENCY)
+            return {}
+
+        def get_scan_results(self, scan_id):
+            time.sleep(DB_LATENCY)
+            return []
+
+    # s3-control puts the account ID in the hostname, which the local stub
+    # cannot serve; answer as if no account-level block is set.
+    def no_account_block(self, call):
+        return ApiResult(error_code="NoSuchPublicAccessBlockConfiguration", error="none")
+
+    patches = [
+        mock.patch.object(scan_pipeline, "ScanUnitOfWork", FakeUnitOfWork),
+        mock.patch.object(scan_pipeline, "update_scan_results", db_call),
+        mock.patch.object(RulesEngine, "_fetch_account", no_account_block),
+        # Every scan should really call the stub, not the evidence cache
+        mock.patch.object(scan_pipeline, "EVIDENCE_CACHE_ENABLED", False),
+    ]
+
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loxe") as client:
+            idle = []
+            for _ in range(20):
+                started = time.perf_counter()
+                await client.get("/")
+                idle.append(time.perf_counter() - started)
+
+            # Run the scans on the API's own event loop, as an embedded worker would
+            load_started = time.perf_counter()
+            scan_tasks = [
+                asyncio.create_task(scan_pipeline.run_scan(
+                    f"arn:aws:iam::{i:012d}:role/loxe", f"scan-{i}", f"acct-{i}", "load-test"
+                ))
+                for i in range(scans)
+            ]
+
+            loaded = []
+            while not finished.is_set():
+                started = time.perf_counter()
+                await client.get("/")
+                loaded.append(time.perf_counter() - started)
+                await asyncio.sleep(0.02)
+            elapsed = time.perf_counter() - load_started
+            await asyncio.gather(*scan_tasks)
+
+    return idle, loaded, elapsed, completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=50)
+    parser.add_argument("--buckets", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stubbed AWS call")
+    args = parser.parse_args()
+
+    stub, port = start_stub_endpoint(args.buckets, args.latency)
+    endpoint = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_ACCESS_KEY_ID": "AKIALOADTEST",
+        "AWS_SECRET_ACCESS_KEY": "load-test",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    })
+    # api imports database, which needs a URL; nothing ever connects to it here
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        idle, loaded, elapsed, completed = asyncio.run(run_load(args.scans))
+    stub.terminate()
+
+    failed = [scan_id for scan_id, status in completed if status != "COMPLETED"]
+    print(f"scans: {args.scans} x {args.buckets} buckets, {args.latency * 1000:.0f} ms per AWS call")
+    print(f"all scans finished in {elapsed:.2f}s ({len(failed)} failed)")
+    print(f"GET / idle:      p50 {statistics.median(idle) * 1000:7.2f} ms   max {max(idle) * 1000:7.2f} ms")
+    print(f"GET / under load p50 {statistics.median(loaded) * 1000:7.2f} ms   "
+          f"p99 {percentile(loaded, 0.99) * 1000:7.2f} ms   max {max(loaded) * 1000:7.2f} ms   ({len(loaded)} probes)")
+
+
+if __name__ == "__main__":
+    main()
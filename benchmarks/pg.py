@@ -0,0 +1,77 @@
+"""
+Helpers for benchmarks that need a real Postgres (DATABASE_URL).
+Everything happens inside a throwaway schema so the real tables are never touched.
+"""
+import contextlib
+import io
+from contextlib import contextmanager
+from unittest import mock
+
+from sqlalchemy import create_engine, event, text
+
+import database
+
+SCHEMA = "loxe_bench"
+
+TABLES = f'''
+    CREATE TABLE {SCHEMA}."Asset" (
+        id TEXT PRIMARY KEY, "resourceId" TEXT NOT NULL, "cloudAccountId" TEXT NOT NULL, name TEXT, type TEXT,
+        provider TEXT, region TEXT, status TEXT, metadata JSONB, "updatedAt" TIMESTAMP,
+        UNIQUE ("cloudAccountId", "resourceId")
+    );
+    CREATE TABLE {SCHEMA}."Finding" (
+        id TEXT PRIMARY KEY, "controlId" TEXT, status TEXT, description TEXT, severity TEXT,
+        "assetId" TEXT REFERENCES {SCHEMA}."Asset" (id) ON DELETE CASCADE, "scanId" TEXT, "updatedAt" TIMESTAMP
+    );
+    CREATE TABLE {SCHEMA}."Scan" (
+        id TEXT PRIMARY KEY, status TEXT, score INTEGER, findings JSONB, "cloudAccountId" TEXT
+    );
+'''
+
+
+@contextmanager
+def bench_engine():
+    """
+    Yields an engine whose search_path is a freshly created bench schema
+    holding empty copies of the app tables (including "ScanResult"). The schema is dropped afterwards.
+    """
+    engine = create_engine(database.DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+        conn.execute(text(TABLES))
+    # Tables the app creates itself at start-up are made by the app's own code
+    with mock.patch.object(database, "engine", engine), contextlib.redirect_stdout(io.StringIO()):
+        database.ensure_scan_queue_schema()
+        database.ensure_scan_results_schema()
+        database.ensure_scan_state_schema()
+    try:
+        yield engine
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        engine.dispose()
+
+
+class RoundTripCounter:
+    """
+    Counts statements, pool checkouts and commits on an engine.
+    """
+
+    def __init__(self, engine):
+        self.statements = self.checkouts = self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._statement)
+        event.listen(engine, "commit", self._commit)
+        event.listen(engine.pool, "checkout", self._checkout)
+
+    def reset(self):
+        self.statements = self.checkouts = self.commits = 0
+
+    def _statement(self, *args):
+        self.statements += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def _checkout(self, *args):
+        self.checkouts += 1
@@ -0,0 +1,84 @@
+"""
+Offline stand-ins for boto3 used by the benchmarks.
+Every API call sleeps for `latency` seconds to mimic a network round trip.
+"""
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+REGIONS = [None, "us-east-2", "eu-west-1", "ap-southeast-2"]
+
+
+class StubS3Client:
+    def __init__(self, bucket_count, latency=0.02):
+        self.bucket_count = bucket_count
+        self.latency = latency
+        self.calls = Counter()
+
+    def list_buckets(self, MaxBuckets=None, ContinuationToken=None):
+        # Pages like the real API when MaxBuckets is given; the token is the next index
+        self.calls["list_buckets"] += 1
+        time.sleep(self.latency)
+        created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        start = int(ContinuationToken or 0)
+        end = min(start + MaxBuckets, self.bucket_count) if MaxBuckets else self.bucket_count
+        response = {
+            "Buckets": [{"Name": f"bench-bucket-{i:05d}", "CreationDate": created} for i in range(start, end)],
+            "Owner": {"ID": "bench-owner"},
+        }
+        if end < self.bucket_count:
+            response["ContinuationToken"] = str(end)
+        return response
+
+    def get_bucket_location(self, Bucket):
+        self.calls["get_bucket_location"] += 1
+        time.sleep(self.latency)
+        index = int(Bucket.rsplit("-", 1)[1])
+        # us-east-1 comes back as None, like the real API
+        return {"LocationConstraint": REGIONS[index % len(REGIONS)]}
+
+    def get_public_access_block(self, Bucket):
+        self.calls["get_public_access_block"] += 1
+        time.sleep(self.latency)
+        index = int(Bucket.rsplit("-", 1)[1])
+        if index % 10 == 0:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchPublicAccessBlockConfiguration", "Message": "none"}},
+                "GetPublicAccessBlock",
+            )
+        return {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": True,
+            "IgnorePublicAcls": True,
+            "BlockPublicPolicy": True,
+            "RestrictPublicBuckets": index % 3 != 0,
+        }}
+
+
+class StubS3ControlClient:
+    """Account-level Public Access Block; `config` None means none is set."""
+
+    def __init__(self, config=None, latency=0.02):
+        self.config = config
+        self.latency = latency
+        self.calls = Counter()
+
+    def get_public_access_block(self, AccountId):
+        self.calls["get_public_access_block"] += 1
+        time.sleep(self.latency)
+        if self.config is None:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchPublicAccessBlockConfiguration", "Message": "none"}},
+                "GetPublicAccessBlock",
+            )
+        return {"PublicAccessBlockConfiguration": dict(self.config)}
+
+
+class StubSession:
+    def __init__(self, bucket_count, latency=0.02, account_pab=None):
+        self.s3 = StubS3Client(bucket_count, latency)
+        self.s3control = StubS3ControlClient(account_pab, latency)
+
+    def client(self, service_name, *args, **kwargs):
+        return self.s3control if service_name == "s3control" else self.s3
@@ -1,7 +1,184 @@
 # connectors/aws_connector.py
 
+import os
+import threading
+import time
 import boto3
-from botocore.exceptions import ClientError
+import botocore.loaders
+import botocore.session
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from .credential_cache import CredentialCache
+from .rate_governor import RateGovernor, THROTTLING_CODES
+from core.metrics import REGISTRY, AWS_REQUESTS, AWS_REQUEST_SECONDS
+
+# Shared by every AWSConnector in the process, so repeat scans of an account skip AssumeRole
+CREDENTIAL_CACHE = CredentialCache(max_entries=int(os.getenv("LOXE_STS_CACHE_SIZE", "256")))
+
+# Paces every client's requests per (account, service, region), shared by concurrent scans
+GOVERNOR = RateGovernor()
+
+# Applied to every pooled client. The connection pool must be at least as large
+# as the scan thread pools, otherwise workers queue on urllib3 instead of AWS.
+CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.getenv("LOXE_AWS_MAX_POOL_CONNECTIONS", "64")),
+    retries={"mode": "adaptive", "max_attempts": 5},
+    connect_timeout=5,
+    read_timeout=30,
+)
+
+# Buckets per ListBuckets page (the API allows up to 10000)
+LIST_BUCKETS_PAGE_SIZE = int(os.getenv("LOXE_LIST_BUCKETS_PAGE_SIZE", "1000"))
+
+# Parsed service models are shared by every per-scan session. Without this each
+# new session re-reads and JSON-decodes the S3/STS models, which costs far more
+# CPU than the API calls a typical scan makes.
+_shared_loader = botocore.loaders.create_loader()
+
+_sts_client = None
+_sts_client_lock = threading.Lock()
+
+
+class BucketListingError(ConnectionError):
+    """
+    A ListBuckets page failed. `continuation_token` is the token of that
+    page (None for the first one); pass it back to resume the listing
+    without re-reading the pages that succeeded.
+    """
+
+    def __init__(self, message, continuation_token=None):
+        super().__init__(message)
+        self.continuation_token = continuation_token
+
+
+def get_sts_client():
+    """
+    The process-wide STS client used for AssumeRole (clients are thread-safe).
+    """
+    global _sts_client
+    with _sts_client_lock:
+        if _sts_client is None:
+            _sts_client = boto3.Session(botocore_session=_new_botocore_session()).client('sts', config=CLIENT_CONFIG)
+            # AssumeRole runs against Loxe's own account, whatever the customer
+            GOVERNOR.attach(_sts_client, 'self', 'sts', _sts_client.meta.region_name)
+            instrument_client(_sts_client, 'sts')
+        return _sts_client
+
+
+class CallStats:
+    """
+    Counts the AWS calls made through one connector's clients (one scan),
+    per "service:Operation". Seconds include retries and rate-governor waits.
+    """
+
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, service_name, operation_name, outcome, seconds):
+        key = f"{service_name}:{operation_name}"
+        with self._lock:
+            stats = self._operations.setdefault(key, {"calls": 0, "errors": 0, "throttles": 0, "seconds": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if outcome == "error":
+                stats["errors"] += 1
+            elif outcome == "throttled":
+                stats["throttles"] += 1
+
+    def summary(self):
+        with self._lock:
+            operations = {key: dict(stats, seconds=round(stats["seconds"], 3))
+                          for key, stats in self._operations.items()}
+        return {
+            "calls": sum(stats["calls"] for stats in operations.values()),
+            "errors": sum(stats["errors"] for stats in operations.values()),
+            "throttles": sum(stats["throttles"] for stats in operations.values()),
+            "operations": operations
+        }
+
+
+def instrument_client(client, service_name, call_stats=None):
+    """
+    Times every API call `client` makes (from before-call to after-call, so
+    retries are included) into AWS_REQUESTS / AWS_REQUEST_SECONDS and, if
+    given, call_stats. Clients without botocore events are returned unchanged.
+    """
+    events = getattr(getattr(client, 'meta', None), 'events', None)
+    if events is None:
+        return client
+
+    def before_call(model=None, context=None, **kwargs):
+        if context is not None:
+            context['loxe_call'] = (model.name, time.perf_counter())
+        # None lets botocore make the call
+
+    def record(context, outcome):
+        operation_name, started = (context or {}).pop('loxe_call', (None, None))
+        if operation_name is None:
+            return
+        seconds = time.perf_counter() - started
+        AWS_REQUESTS.inc(service_name, operation_name, outcome)
+        AWS_REQUEST_SECONDS.observe(seconds, service_name, operation_name)
+        if call_stats is not None:
+            call_stats.record(service_name, operation_name, outcome, seconds)
+
+    def after_call(http_response=None, parsed=None, context=None, **kwargs):
+        status = getattr(http_response, 'status_code', None)
+        code = ((parsed or {}).get('Error') or {}).get('Code')
+        if code in THROTTLING_CODES or status == 429:
+            outcome = "throttled"
+        elif status is not None and status >= 300:
+            outcome = "error"
+        else:
+            outcome = "ok"
+        record(context, outcome)
+
+    def after_call_error(context=None, **kwargs):
+        record(context, "error")
+
+    events.register('before-call', before_call)
+    events.register('after-call', after_call)
+    events.register('after-call-error', after_call_error)
+    return client
+
+
+def _governor_metrics():
+    """GOVERNOR's counters summed per (service, region), for the /metrics endpoint."""
+    totals = {}
+    for key, metrics in GOVERNOR.metrics().items():
+        _, service_name, region = key.split("/")
+        series = totals.setdefault((service_name, region), {"calls": 0, "delayed_calls": 0, "throttles": 0,
+                                                            "wait_seconds": 0.0})
+        for name in series:
+            series[name] += metrics[name]
+
+    help_text = {
+        "calls": "Requests paced by the rate governor.",
+        "delayed_calls": "Requests the rate governor made wait.",
+        "throttles": "Throttling responses seen by the rate governor.",
+        "wait_seconds": "Seconds requests spent waiting in the rate governor."
+    }
+    return [
+        {
+            "name": f"loxe_aws_governor_{name}_total",
+            "type": "counter",
+            "help": help_text[name],
+            "labels": ["service", "region"],
+            "buckets": [],
+            "samples": [[list(labels), round(series[name], 3)] for labels, series in totals.items()]
+        }
+        for name in help_text
+    ]
+
+
+REGISTRY.add_collector(_governor_metrics)
+
+
+def _new_botocore_session():
+    session = botocore.session.get_session()
+    session.register_component('data_loader', _shared_loader)
+    return session
 
 
 class AWSConnector:
@@ -9,25 +186,35 @@ class AWSConnector:
         self.role_arn = role_arn
         self.external_id = external_id
         self.region_name = region
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self.call_stats = CallStats()
         self.session = self._create_session()
 
         if self.session:
             print(f"✅ AWS session established successfully in region '{self.region_name}'.")
 
+    def _assume_role(self):
+        sts_client = get_sts_client()
+        assumed_role_object = sts_client.assume_role(
+            RoleArn=self.role_arn,
+            RoleSessionName="LoxeEvidenceTracerSession",
+            ExternalId=self.external_id
+        )
+        return assumed_role_object['Credentials']
+
     def _create_session(self):
         try:
-            sts_client = boto3.client('sts')
-            assumed_role_object = sts_client.assume_role(
-                RoleArn=self.role_arn,
-                RoleSessionName="LoxeEvidenceTracerSession",
-                ExternalId=self.external_id
+            credentials = CREDENTIAL_CACHE.get(
+                (self.role_arn, self.external_id, self.region_name),
+                self._assume_role
             )
-            credentials = assumed_role_object['Credentials']
             return boto3.Session(
                 aws_access_key_id=credentials['AccessKeyId'],
                 aws_secret_access_key=credentials['SecretAccessKey'],
                 aws_session_token=credentials['SessionToken'],
-                region_name=self.region_name
+                region_name=self.region_name,
+                botocore_session=_new_botocore_session()
             )
         except ClientError as e:
             # --- NEW: Granular Error Analysis ---
@@ -53,13 +240,67 @@ class AWSConnector:
             # Catch non-AWS errors
             raise ValueError(f"An unexpected error occurred: {e}")
 
+    @property
+    def account_id(self):
+        """
+        The customer's AWS account ID, taken from the role ARN
+        (arn:aws:iam::<account-id>:role/<name>). None if the ARN is malformed.
+        """
+        parts = (self.role_arn or '').split(':')
+        return parts[4] if len(parts) > 5 and parts[4] else None
+
+    def client(self, service_name, region=None):
+        """
+        Returns the pooled client for (service_name, region), building it on first use.
+        boto3 clients are thread-safe, so one instance is shared by every caller.
+        Every request the client sends is paced by GOVERNOR, and every call is
+        timed into the process metrics and self.call_stats.
+        """
+        if not self.session:
+            raise ConnectionError(f"Cannot create a {service_name} client because the AWS session was not established.")
+
+        key = (service_name, region or self.region_name)
+        client = self._clients.get(key)
+        if client is None:
+            # Sessions are not thread-safe; build clients one at a time
+            with self._clients_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self.session.client(service_name, region_name=key[1], config=CLIENT_CONFIG)
+                    GOVERNOR.attach(client, self.account_id, service_name, key[1])
+                    instrument_client(client, service_name, self.call_stats)
+                    self._clients[key] = client
+        return client
+
     def list_s3_buckets(self):
+        return [bucket['Name'] for page in self.iter_s3_bucket_pages() for bucket in page['Buckets']]
+
+    def iter_s3_bucket_pages(self, page_size=LIST_BUCKETS_PAGE_SIZE, continuation_token=None, s3_client=None):
+        """
+        Pages through ListBuckets with MaxBuckets/ContinuationToken, yielding
+        each response as it arrives, so only one page is held at a time.
+        Starts from `continuation_token` when resuming an interrupted listing;
+        a failed page raises BucketListingError carrying the token to resume from.
+        """
         if not self.session:
             # This will now be caught by the processor
             raise ConnectionError("Cannot list S3 buckets because the AWS session was not established.")
-        try:
-            s3_client = self.session.client('s3')
-            response = s3_client.list_buckets()
-            return [bucket['Name'] for bucket in response['Buckets']]
-        except ClientError as e:
-            raise ConnectionError(f"An AWS error occurred while listing buckets: {e.response['Error']['Message']}")
\ No newline at end of file
+        s3_client = s3_client or self.client('s3')
+
+        while True:
+            params = {'MaxBuckets': page_size}
+            if continuation_token:
+                params['ContinuationToken'] = continuation_token
+            try:
+                response = s3_client.list_buckets(**params)
+            except ClientError as e:
+                raise BucketListingError(
+                    f"An AWS error occurred while listing buckets: {e.response['Error']['Message']}", continuation_token
+                )
+            except BotoCoreError as e:
+                raise BucketListingError(f"An AWS error occurred while listing buckets: {e}", continuation_token)
+
+            yield response
+            continuation_token = response.get('ContinuationToken')
+            if not continuation_token:
+                return
\ No newline at end of file
@@ -0,0 +1,114 @@
+# connectors/credential_cache.py
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _start_daemon(target):
+    threading.Thread(target=target, name="sts-refresh", daemon=True).start()
+
+
+class CredentialCache:
+    """
+    Process-wide LRU cache for temporary STS credentials.
+
+    Entries are keyed by (role_arn, external_id, region) and stored with the
+    `Expiration` AssumeRole returned. Once an entry is inside the refresh
+    window it is still served, while a replacement is fetched in the
+    background. An entry that is close to expiring (or missing) is fetched
+    in the foreground. Only one fetch per key is in flight at a time.
+    """
+
+    def __init__(self, max_entries=256, refresh_ahead=timedelta(minutes=10),
+                 min_remaining=timedelta(minutes=2), clock=_utcnow, spawn=_start_daemon):
+        self.max_entries = max_entries
+        self.refresh_ahead = refresh_ahead
+        self.min_remaining = min_remaining
+        self._clock = clock
+        self._spawn = spawn
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """
+        Returns credentials for key, calling fetch() (which must return an STS
+        `Credentials` dict) only on a miss or when the cached copy is too old.
+        """
+        with self._lock:
+            credentials = self._entries.get(key)
+            if credentials is not None:
+                self._entries.move_to_end(key)
+
+        if credentials is not None:
+            remaining = credentials['Expiration'] - self._clock()
+            if remaining > self.refresh_ahead:
+                return credentials
+            if remaining > self.min_remaining:
+                self._refresh_in_background(key, fetch)
+                return credentials
+
+        return self._refresh(key, fetch)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key, fetch):
+        with self._key_lock(key):
+            # Another caller may have refreshed the entry while we waited
+            with self._lock:
+                credentials = self._entries.get(key)
+            if credentials is not None and credentials['Expiration'] - self._clock() > self.min_remaining:
+                return credentials
+
+            credentials = fetch()
+            self._store(key, credentials)
+            return credentials
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                with self._key_lock(key):
+                    self._store(key, fetch())
+            except Exception as e:
+                # The current credentials are still valid; the next get() retries
+                print(f"⚠️ Background STS refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._spawn(run)
+
+    def _store(self, key, credentials):
+        with self._lock:
+            self._entries[key] = credentials
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted, None)
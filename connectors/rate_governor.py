@@ -0,0 +1,193 @@
+import os
+import random
+import threading
+import time
+
+# Requests per second (and burst) allowed per (account, service, region)
+DEFAULT_RATE = float(os.getenv("LOXE_AWS_RATE", "100"))
+DEFAULT_BURST = int(os.getenv("LOXE_AWS_BURST", "100"))
+SERVICE_RATES = {
+    # LookupEvents is limited to 2 requests per second per account and region
+    'cloudtrail': 2.0,
+}
+
+# Throttled buckets halve their rate down to this floor, then creep back up
+MIN_RATE = 1.0
+RECOVERY_FRACTION = 0.01
+
+# Requests already in flight are throttled together; only one cut per window
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+# Full-jitter backoff after a throttle: a random pause up to BASE * 2**streak
+BACKOFF_BASE_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 20.0
+
+THROTTLING_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'RequestThrottled', 'SlowDown',
+    'BandwidthLimitExceeded', 'LimitExceededException', 'ProvisionedThroughputExceededException',
+}
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. acquire() takes a token, sleeping first if
+    the bucket is empty; tokens may go negative so concurrent callers queue
+    up behind each other instead of all retrying at once.
+
+    The rate adapts AIMD-style: a throttle halves it (down to min_rate, at
+    most once per DECREASE_COOLDOWN_SECONDS) and pauses every caller for a
+    jittered backoff, each success adds back a small fraction of max_rate.
+    """
+
+    def __init__(self, rate, burst, min_rate=MIN_RATE, clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._backoff_until = 0.0
+        self._decreased_at = None
+        self._throttle_streak = 0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.delayed_calls = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self):
+        """Blocks until a request may be sent. Returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, self._backoff_until - now, 0.0)
+
+            self.calls += 1
+            if wait > 0:
+                self.delayed_calls += 1
+                self.wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = self._clock()
+            if self._decreased_at is not None and now - self._decreased_at < DECREASE_COOLDOWN_SECONDS:
+                return
+            self._decreased_at = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._throttle_streak += 1
+            backoff = self._rng() * min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** self._throttle_streak)
+            self._backoff_until = max(self._backoff_until, now + backoff)
+
+    def on_success(self):
+        with self._lock:
+            self._throttle_streak = 0
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "delayed_calls": self.delayed_calls,
+                "throttles": self.throttles,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+                "rate": round(self.rate, 2)
+            }
+
+
+class RateGovernor:
+    """
+    One TokenBucket per (account, service, region), shared by every client
+    in the process, so concurrent scans of the same account share its API
+    budget. attach() wires a boto3 client to its bucket through botocore's
+    event hooks: every HTTP attempt (retries included) takes a token first,
+    and throttling responses slow the bucket down.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, service_rates=None, bucket_factory=TokenBucket):
+        self.rate = rate
+        self.burst = burst
+        self.service_rates = SERVICE_RATES if service_rates is None else service_rates
+        self._bucket_factory = bucket_factory
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account_id, service_name, region):
+        key = (account_id, service_name, region)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate = self.service_rates.get(service_name, self.rate)
+                bucket = self._bucket_factory(rate, max(1, min(self.burst, int(rate))))
+                self._buckets[key] = bucket
+        return bucket
+
+    def attach(self, client, account_id, service_name, region):
+        """
+        Paces `client` with the bucket for its key. Clients without botocore
+        events (e.g. benchmark stubs) are returned unchanged.
+        """
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is None:
+            return client
+        bucket = self.bucket(account_id, service_name, region)
+
+        def before_send(**kwargs):
+            bucket.acquire()
+            # None lets botocore send the request
+
+        def response_received(parsed_response=None, response_dict=None, exception=None, **kwargs):
+            if exception is not None:
+                return
+            code = ((parsed_response or {}).get('Error') or {}).get('Code')
+            status = (response_dict or {}).get('status_code')
+            if code in THROTTLING_CODES or status == 429:
+                bucket.on_throttle()
+            elif status is not None and status < 500:
+                bucket.on_success()
+
+        events.register('before-send', before_send)
+        events.register('response-received', response_received)
+        return client
+
+    def metrics(self, account_id=None):
+        """
+        {"account/service/region": bucket metrics}, optionally for one account only.
+        Counters are cumulative for the process.
+        """
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return {
+            "/".join(str(part) for part in key): bucket.metrics()
+            for key, bucket in buckets
+            if account_id is None or key[0] == account_id
+        }
+
+
+def metrics_delta(before, after):
+    """What happened between two metrics() snapshots (e.g. during one scan)."""
+    delta = {}
+    for key, current in after.items():
+        previous = before.get(key, {})
+        counters = {
+            name: round(current[name] - previous.get(name, 0), 3)
+            for name in ("calls", "delayed_calls", "throttles", "wait_seconds")
+        }
+        if counters["calls"]:
+            delta[key] = dict(counters, max_wait_seconds=current["max_wait_seconds"], rate=current["rate"])
+    return delta
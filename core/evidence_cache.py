@@ -0,0 +1,132 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .rules_engine import ApiResult
+
+# How long a cached API response stays valid, per API call
+DEFAULT_TTL = timedelta(seconds=int(os.getenv("LOXE_EVIDENCE_TTL_SECONDS", "3600")))
+API_TTLS = {
+    # Buckets practically never move region
+    'get_bucket_location': timedelta(hours=24),
+}
+
+# Errors that are evidence in their own right (the setting does not exist).
+# Anything else, e.g. throttling or AccessDenied, is retried on the next scan.
+CACHEABLE_ERROR_PREFIX = 'NoSuch'
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class EvidenceCache:
+    """
+    One scan's view of the persistent evidence cache, keyed by
+    (resource ARN, API call) within one cloud account.
+
+    It is loaded from the "EvidenceCache" table when the scan starts and
+    answers lookups from memory; responses fetched during the scan are
+    collected and written back in one batch when it ends (see
+    database.save_evidence_cache). With force_refresh every lookup misses,
+    so AWS is called for everything and the fresh responses replace the
+    cached ones.
+    """
+
+    def __init__(self, cloud_account_id, entries=(), force_refresh=False, clock=_utcnow):
+        self.cloud_account_id = cloud_account_id
+        self.force_refresh = force_refresh
+        self._clock = clock
+        self._entries = {}
+        self._pending = {}
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        for entry in entries:
+            self._entries[(entry['resourceArn'], entry['apiCall'])] = entry
+
+    def get(self, resource_arn, api_call):
+        """
+        The cached ApiResult for this resource and call, or None on a miss.
+        """
+        key = (resource_arn, api_call)
+        with self._lock:
+            entry = None if self.force_refresh else self._entries.get(key)
+            if entry is not None and entry['expiresAt'] <= self._clock():
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._used.add(key)
+
+        return ApiResult(response=entry['response'], error_code=entry['errorCode'], error=entry['error'])
+
+    def put(self, resource_arn, api_call, result):
+        """
+        Records a fresh ApiResult to be saved. Transient errors are not cached.
+        """
+        if not result.ok and not (result.error_code or '').startswith(CACHEABLE_ERROR_PREFIX):
+            return
+
+        now = self._clock()
+        response = result.response
+        if isinstance(response, dict):
+            response = {k: v for k, v in response.items() if k != 'ResponseMetadata'}
+
+        entry = {
+            'cloudAccountId': self.cloud_account_id,
+            'resourceArn': resource_arn,
+            'apiCall': api_call,
+            'response': response,
+            'errorCode': result.error_code,
+            'error': result.error,
+            'fetchedAt': now,
+            'expiresAt': now + API_TTLS.get(api_call, DEFAULT_TTL),
+            'lastUsedAt': now
+        }
+        with self._lock:
+            self._entries[(resource_arn, api_call)] = entry
+            self._pending[(resource_arn, api_call)] = entry
+
+    def fetch(self, resource_arn, api_call, fetch):
+        """
+        Returns the cached ApiResult, or calls fetch() and caches what it returns.
+        """
+        result = self.get(resource_arn, api_call)
+        if result is None:
+            result = fetch()
+            self.put(resource_arn, api_call, result)
+        return result
+
+    def invalidate(self, resource_arn):
+        """
+        Drops every cached response for a resource (e.g. one CloudTrail says
+        has changed), so its next lookups go to AWS.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == resource_arn]:
+                del self._entries[key]
+
+    def pending(self):
+        """Entries fetched during this scan, to be written back."""
+        with self._lock:
+            return list(self._pending.values())
+
+    def used_keys(self):
+        """(resource ARN, API call) pairs served from the cache, to refresh their LRU position."""
+        with self._lock:
+            return list(self._used)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "api_calls_saved": self.hits,
+            "force_refresh": self.force_refresh
+        }
@@ -1,13 +1,47 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from botocore.exceptions import BotoCoreError, ClientError
 from connectors.aws_connector import AWSConnector
-from .rules_engine import RulesEngine
+from .resource_snapshot import ResourceSnapshot
+from .rules_engine import RulesEngine, ApiResult
 from .data_models import EvidenceFinding
 from datetime import datetime
 
+# Per-bucket checks are network bound, so a modest pool hides most of the
+# round-trip latency without hammering the customer's account.
+DEFAULT_CHECK_WORKERS = int(os.getenv("LOXE_S3_CHECK_WORKERS", "16"))
+
+# How many inventory rows are handed to upsert_assets at a time.
+ASSET_BATCH_SIZE = 500
+
+# LocationConstraint values that are not region names
+LEGACY_LOCATIONS = {'EU': 'eu-west-1'}
+
+
+def location_to_region(location):
+    """
+    The region name for a GetBucketLocation LocationConstraint: us-east-1
+    comes back as None (or ''), and old eu-west-1 buckets as 'EU'.
+    """
+    if not location:
+        return 'us-east-1'
+    return LEGACY_LOCATIONS.get(location, location)
+
 
 class EvidenceProcessor:
-    def __init__(self, role_arn, external_id, region):
+    def __init__(self, role_arn, external_id, region, max_workers=DEFAULT_CHECK_WORKERS, evidence_cache=None):
         self.connector = AWSConnector(role_arn=role_arn, external_id=external_id, region=region)
-        self.rules_engine = RulesEngine(self.connector)
+        # One snapshot per processor: inventory and checks share a single enumeration
+        self.snapshot = ResourceSnapshot(self.connector)
+        # Optional EvidenceCache consulted before AWS by inventory and the rules
+        self.evidence_cache = evidence_cache
+        self.rules_engine = RulesEngine(self.connector, s3_client=self.snapshot.s3_client(),
+                                        evidence_cache=evidence_cache)
+        self.max_workers = max_workers
+        self.region_timings = {}
         print("✅ EvidenceProcessor initialized.")
 
     def collect_assets(self):
@@ -15,70 +49,157 @@ class EvidenceProcessor:
         Scans the environment to build a complete Inventory of assets.
         Returns a list of dictionaries ready for the 'Asset' DB table.
         """
+        return list(self.iter_assets())
+
+    def iter_assets(self, max_workers=None):
+        """
+        Streams inventory assets as their bucket regions are resolved, one
+        listing page at a time. get_bucket_location runs on a bounded thread
+        pool sharing the connector's pooled S3 client. Assets are yielded in
+        listing order.
+        The bucket listing and resolved regions are kept on self.snapshot.
+        """
         if not self.connector.session:
-            return []
+            return
+
+        workers = max_workers if max_workers is not None else self.max_workers
+        workers = max(1, workers or 1)
+
+        count = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-inventory") as executor:
+            try:
+                # Each listing page is resolved as soon as it arrives
+                for page in self.snapshot.iter_bucket_pages():
+                    for asset in executor.map(self.build_asset, page):
+                        count += 1
+                        yield asset
+            except ConnectionError as e:
+                print(f"⚠️ Error collecting assets: {e}")
+                return
+
+        print(f"✅ Collected {count} assets for inventory.")
+
+    def build_asset(self, bucket):
+        """
+        Resolves one bucket's region and returns its 'Asset' row.
+        The region is also recorded on the scan snapshot for the checks phase.
+        """
+        name = bucket['Name']
+
+        # Get Region (Crucial for Context)
+        arn = f"arn:aws:s3:::{name}"
+        # Paginated ListBuckets already reports the region
+        region = bucket.get('BucketRegion') or self._bucket_location(name, arn)
+        self.snapshot.set_location(name, region)
 
-        assets = []
-        s3_client = self.connector.session.client('s3')
+        # Construct the Asset Dictionary
+        return {
+            "name": name,
+            "resourceId": arn,  # Unique ID
+            "type": "AWS::S3::Bucket",
+            "provider": "AWS",
+            "region": region,
+            "status": "UNKNOWN",  # Will be updated by the scan later
+            "metadata": {
+                "creation_date": bucket['CreationDate'].isoformat(),
+                "owner_id": self.snapshot.owner_id
+            },
+            "updatedAt": datetime.now()
+        }
 
+    def _bucket_location(self, name, arn):
+        """
+        Looks up a bucket's region with get_bucket_location (through the evidence cache).
+        """
+        cached = self.evidence_cache.get(arn, 'get_bucket_location') if self.evidence_cache else None
+        if cached is not None:
+            return location_to_region(cached.response.get('LocationConstraint'))
         try:
-            # List all buckets
-            response = s3_client.list_buckets()
-            for bucket in response.get('Buckets', []):
-                name = bucket['Name']
-                creation_date = bucket['CreationDate']
-
-                # Get Region (Crucial for Context)
-                # API quirk: us-east-1 often returns None
-                try:
-                    loc_resp = s3_client.get_bucket_location(Bucket=name)
-                    region = loc_resp.get('LocationConstraint') or 'us-east-1'
-                except:
-                    region = 'unknown'
-
-                # Construct the Asset Dictionary
-                asset = {
-                    "name": name,
-                    "resourceId": f"arn:aws:s3:::{name}",  # Unique ID
-                    "type": "AWS::S3::Bucket",
-                    "provider": "AWS",
-                    "region": region,
-                    "status": "UNKNOWN",  # Will be updated by the scan later
-                    "metadata": {
-                        "creation_date": creation_date.isoformat(),
-                        "owner_id": response.get('Owner', {}).get('ID')
-                    },
-                    "updatedAt": datetime.now()
-                }
-                assets.append(asset)
-
-        except Exception as e:
-            print(f"⚠️ Error collecting assets: {e}")
-
-        print(f"✅ Collected {len(assets)} assets for inventory.")
-        return assets
-
-    def run_s3_checks(self):
-        """
-        Runs all S3 checks and returns findings.
+            loc_resp = self.snapshot.s3_client().get_bucket_location(Bucket=name)
+            if self.evidence_cache:
+                self.evidence_cache.put(arn, 'get_bucket_location', ApiResult(response=loc_resp))
+            return location_to_region(loc_resp.get('LocationConstraint'))
+        except (ClientError, BotoCoreError) as e:
+            print(f"⚠️ Could not resolve region for bucket '{name}': {e}")
+            return 'unknown'
+
+    def run_s3_checks(self, max_workers=None):
+        """
+        Runs all S3 checks and returns findings in the same order as the
+        bucket listing. Each bucket is checked with a client local to the
+        region recorded during inventory, on a bounded pool of max_workers
+        threads (defaulting to the processor's setting; 1 runs serially).
+        Per-region timings are kept on self.region_timings.
         """
+        self.region_timings = {}
         if not self.connector.session:
             return []  # Return empty list on connection failure
 
-        # We use the connector's list method or the one we just built
-        # For simplicity, let's use the connector's existing method
+        # Reuses the listing from collect_assets when inventory already ran
         try:
-            s3_buckets = self.connector.list_s3_buckets()
-        except:
+            s3_buckets = self.snapshot.bucket_names()
+        except ConnectionError as e:
+            print(f"⚠️ Error listing S3 buckets: {e}")
             return []
 
         if not s3_buckets:
             return []
 
-        all_findings = []
-        for bucket in s3_buckets:
-            finding = self.rules_engine.check_s3_public_access_block(bucket)
-            all_findings.append(finding)
+        workers = max_workers if max_workers is not None else self.max_workers
+        workers = max(1, min(workers or 1, len(s3_buckets)))
+        return asyncio.run(self._check_on_pool(s3_buckets, workers))
+
+    async def _check_on_pool(self, bucket_names, workers):
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-check") as executor:
+            return await self.check_buckets(bucket_names, partial(loop.run_in_executor, executor))
+
+    async def check_buckets(self, bucket_names, run):
+        """
+        Checks every bucket in `bucket_names` as its own task. `run(fn, *args)`
+        awaits a blocking call off the event loop and decides how many run at
+        once (a thread pool, or a scan-wide limit shared with other phases).
+        Returns the findings in bucket order and records each region's bucket
+        count and wall-clock span on self.region_timings.
+        """
+        spans = {}
+
+        async def timed_check(bucket):
+            region = self.bucket_region(bucket)
+            started = time.perf_counter()
+            bucket_findings = await run(self.check_bucket, bucket)
+            spans.setdefault(region, []).append((started, time.perf_counter()))
+            return bucket_findings
+
+        # gather keeps submission order, so the report stays deterministic
+        per_bucket = await asyncio.gather(*(timed_check(bucket) for bucket in bucket_names))
+        findings = [finding for bucket_findings in per_bucket for finding in bucket_findings]
+
+        self.region_timings = {
+            region: {
+                "buckets": len(region_spans),
+                "seconds": round(max(end for _, end in region_spans) - min(start for start, _ in region_spans), 3)
+            }
+            for region, region_spans in spans.items()
+        }
+        print(f"✅ S3 checks complete. Found {len(findings)} items across {len(self.region_timings)} region(s).")
+        return findings
+
+    def bucket_region(self, bucket_name):
+        """
+        The region recorded for a bucket during inventory.
+        Unresolved buckets fall back to the connector's default and let S3 redirect.
+        Regions stored by earlier scans as a raw 'EU' constraint are mapped too.
+        """
+        region = self.snapshot.get_location(bucket_name)
+        if not region or region == 'unknown':
+            return self.connector.region_name
+        return location_to_region(region)
 
-        print(f"✅ S3 checks complete. Found {len(all_findings)} items.")
-        return all_findings
\ No newline at end of file
+    def check_bucket(self, bucket_name):
+        """
+        Runs every active rule for one bucket with a client local to its region.
+        Returns the bucket's findings, one per rule.
+        """
+        s3_client = self.connector.client('s3', self.bucket_region(bucket_name))
+        return self.rules_engine.evaluate_bucket(bucket_name, s3_client=s3_client)
@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+
+# Columns that make a stored finding "changed" when they differ
+COMPARED_FIELDS = ('status', 'description', 'severity')
+
+
+@dataclass
+class FindingsDiff:
+    """What has to change in the Finding table to match the current scan."""
+    inserts: list = field(default_factory=list)
+    updates: list = field(default_factory=list)
+    resolved_ids: list = field(default_factory=list)
+    unchanged: int = 0
+
+    def summary(self):
+        return {
+            "inserted": len(self.inserts),
+            "updated": len(self.updates),
+            "unchanged": self.unchanged,
+            "resolved": len(self.resolved_ids)
+        }
+
+
+def diff_findings(existing, current):
+    """
+    Compares stored findings with the current scan's, keyed by (assetId, controlId).
+
+    `existing` are rows already in the Finding table (with their `id`),
+    `current` are the records this scan would write. New keys are inserted,
+    keys whose compared fields differ are updated in place (keeping the
+    stored id), and stored keys the scan no longer reports are resolved.
+    """
+    stored = {}
+    diff = FindingsDiff()
+    for row in existing:
+        key = (row['assetId'], row['controlId'])
+        if key in stored:
+            # Duplicates left over from the old wipe-and-reinsert flow
+            diff.resolved_ids.append(row['id'])
+        else:
+            stored[key] = row
+
+    seen = set()
+    for record in current:
+        key = (record['assetId'], record['controlId'])
+        if key in seen:
+            continue
+        seen.add(key)
+
+        row = stored.get(key)
+        if row is None:
+            diff.inserts.append(record)
+        elif any(row.get(name) != record.get(name) for name in COMPARED_FIELDS):
+            diff.updates.append({**record, 'id': row['id']})
+        else:
+            diff.unchanged += 1
+
+    diff.resolved_ids.extend(row['id'] for key, row in stored.items() if key not in seen)
+    return diff
@@ -0,0 +1,107 @@
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import BotoCoreError, ClientError
+from .data_models import EvidenceFinding
+
+# CloudTrail can take several minutes to make an event visible to LookupEvents,
+# so every incremental scan looks back this far past the previous watermark.
+CLOUDTRAIL_LAG = timedelta(seconds=int(os.getenv("LOXE_CLOUDTRAIL_LAG_SECONDS", "900")))
+
+S3_EVENT_SOURCE = 's3.amazonaws.com'
+
+# Bucket-level management events that can change a rule's outcome
+BUCKET_EVENT_PREFIXES = ('Create', 'Delete', 'Put')
+
+# Account-wide settings change the outcome for every bucket
+ACCOUNT_EVENTS = {'PutAccountPublicAccessBlock', 'DeleteAccountPublicAccessBlock'}
+
+
+@dataclass
+class BucketChanges:
+    """What CloudTrail reports as changed since the watermark."""
+    buckets: set = field(default_factory=set)
+    account_changed: bool = False
+    events: int = 0
+
+
+def _event_bucket(event):
+    for resource in event.get('Resources') or []:
+        if resource.get('ResourceType') == 'AWS::S3::Bucket' and resource.get('ResourceName'):
+            return resource['ResourceName']
+    try:
+        details = json.loads(event.get('CloudTrailEvent') or '{}')
+    except ValueError:
+        return None
+    return (details.get('requestParameters') or {}).get('bucketName')
+
+
+def find_bucket_changes(aws_connector, since, regions, until=None):
+    """
+    Reads S3 management events from CloudTrail LookupEvents in each region,
+    starting CLOUDTRAIL_LAG before `since`. Only write events are looked up
+    (LookupEvents takes a single attribute, so the S3 event source is checked
+    here); read events, such as the previous scan's own calls, would
+    otherwise page in 50 at a time. Returns a BucketChanges, or None
+    if CloudTrail could not be read (the caller should then do a full scan).
+    """
+    start = since - CLOUDTRAIL_LAG
+    end = until or datetime.now(timezone.utc)
+    changes = BucketChanges()
+
+    try:
+        for region in sorted(regions):
+            paginator = aws_connector.client('cloudtrail', region).get_paginator('lookup_events')
+            pages = paginator.paginate(
+                LookupAttributes=[{'AttributeKey': 'ReadOnly', 'AttributeValue': 'false'}],
+                StartTime=start,
+                EndTime=end
+            )
+            for page in pages:
+                for event in page.get('Events', []):
+                    if event.get('EventSource') != S3_EVENT_SOURCE:
+                        continue
+                    changes.events += 1
+                    name = event.get('EventName', '')
+                    if name in ACCOUNT_EVENTS:
+                        changes.account_changed = True
+                    elif name.startswith(BUCKET_EVENT_PREFIXES):
+                        bucket = _event_bucket(event)
+                        if bucket:
+                            changes.buckets.add(bucket)
+    except (ClientError, BotoCoreError, ConnectionError) as e:
+        print(f"⚠️ Could not read CloudTrail events: {e}")
+        return None
+
+    print(f"🛰️ CloudTrail: {changes.events} S3 event(s) since {start.isoformat()}, "
+          f"{len(changes.buckets)} bucket(s) changed{', account settings changed' if changes.account_changed else ''}.")
+    return changes
+
+
+def merge_results(bucket_names, previous_results, fresh_findings, rechecked):
+    """
+    Builds the full finding list for an incremental scan, in listing order:
+    rechecked buckets get their fresh findings, every other bucket keeps its
+    previous results, and buckets no longer listed are dropped.
+    `previous_results` are report rows (control_id, resource, status, ...).
+    """
+    fresh = {}
+    for finding in fresh_findings:
+        fresh.setdefault(finding.resource, []).append(finding)
+
+    previous = {}
+    for row in previous_results:
+        previous.setdefault(row['resource'], []).append(EvidenceFinding(
+            control_id=row['control_id'],
+            resource=row['resource'],
+            status=row['status'],
+            description=row['description'],
+            evidence=row.get('evidence') or {}
+        ))
+
+    merged = []
+    for bucket in bucket_names:
+        merged.extend(fresh.get(bucket, []) if bucket in rechecked else previous.get(bucket, []))
+    return merged
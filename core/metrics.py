@@ -0,0 +1,221 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set to 0 to stop recording process metrics (per-scan timings are always kept)
+METRICS_ENABLED = os.getenv("LOXE_METRICS", "1") != "0"
+
+# Histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class Counter:
+    """
+    A counter per label-value tuple. inc() is a dict update under a lock,
+    cheap enough to call on every AWS request and DB statement.
+    """
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label-value tuple, as Prometheus expects.
+    """
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[list(labels), list(series)] for labels, series in self._values.items()]
+
+
+class Registry:
+    """
+    The metrics of this process. snapshot() is JSON-serializable, so another
+    process (the API) can render a worker's metrics next to its own.
+    Collectors are called at snapshot time for values kept elsewhere.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns a list of snapshot entries (see snapshot())."""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        """[{"name", "type", "help", "labels", "buckets", "samples"}] for every metric."""
+        entries = [
+            {
+                "name": metric.name,
+                "type": metric.type,
+                "help": metric.help,
+                "labels": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples()
+            }
+            for metric in self._metrics
+        ]
+        for collect in self._collectors:
+            try:
+                entries.extend(collect())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        return entries
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(sources):
+    """
+    Prometheus text format for a list of (extra labels, snapshot) pairs.
+    A metric present in several snapshots is written as one family.
+    """
+    families = {}
+    for extra, snapshot in sources:
+        for entry in snapshot:
+            families.setdefault(entry["name"], (entry, []))[1].append((extra, entry))
+
+    lines = []
+    for name, (first, parts) in families.items():
+        lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['type']}")
+        for extra, entry in parts:
+            for labelvalues, value in entry["samples"]:
+                if entry["type"] != "histogram":
+                    lines.append(f"{name}{_labels(entry['labels'], labelvalues, extra)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(entry["buckets"]) + [float("inf")], value[:-1]):
+                    cumulative += count
+                    le = dict(extra or {}, le=_number(float(bound)))
+                    lines.append(f"{name}_bucket{_labels(entry['labels'], labelvalues, le)} {cumulative}")
+                labels = _labels(entry['labels'], labelvalues, extra)
+                lines.append(f"{name}_sum{labels} {_number(value[-1])}")
+                lines.append(f"{name}_count{labels} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SCAN_PHASE_SECONDS = REGISTRY.histogram(
+    "loxe_scan_phase_seconds", "Time scans spent in each phase.", ("phase",), PHASE_BUCKETS
+)
+SCAN_SECONDS = REGISTRY.histogram(
+    "loxe_scan_duration_seconds", "Wall-clock time of whole scans by outcome.", ("kind", "status"), PHASE_BUCKETS
+)
+AWS_REQUESTS = REGISTRY.counter(
+    "loxe_aws_requests_total", "AWS API calls (retries included) by outcome: ok, error or throttled.",
+    ("service", "operation", "outcome")
+)
+AWS_REQUEST_SECONDS = REGISTRY.histogram(
+    "loxe_aws_request_duration_seconds", "AWS API call latency, retries and rate-governor waits included.",
+    ("service", "operation")
+)
+DB_STATEMENT_SECONDS = REGISTRY.histogram(
+    "loxe_db_statement_duration_seconds", "Database statement latency by statement kind and table.",
+    ("statement",)
+)
+DB_ROWS_WRITTEN = REGISTRY.counter(
+    "loxe_db_rows_written_total", "Rows inserted, updated, deleted or copied, by table.", ("table",)
+)
+
+
+class PhaseTimer:
+    """
+    Times the phases of one scan. Each phase goes into SCAN_PHASE_SECONDS
+    and into summary(), which is stored with the scan.
+
+        timer = PhaseTimer()
+        with timer.phase("inventory"):
+            ...
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = self._clock()
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - started
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            SCAN_PHASE_SECONDS.observe(elapsed, name)
+
+    def elapsed(self):
+        return self._clock() - self.started
+
+    def summary(self):
+        return {
+            "total_seconds": round(self.elapsed(), 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()}
+        }
@@ -0,0 +1,91 @@
+from botocore.exceptions import BotoCoreError, ClientError
+
+
+def list_member_accounts(aws_connector):
+    """
+    Pages through Organizations ListAccounts with the management account's
+    session. Returns the ACTIVE accounts as {"id", "name"} dicts, sorted by id.
+    Raises ConnectionError if the organization cannot be read.
+    """
+    if not aws_connector.session:
+        raise ConnectionError("Cannot list member accounts because the AWS session was not established.")
+
+    accounts = []
+    try:
+        for page in aws_connector.client('organizations').get_paginator('list_accounts').paginate():
+            for account in page.get('Accounts', []):
+                if account.get('Status', 'ACTIVE') == 'ACTIVE':
+                    accounts.append({"id": account['Id'], "name": account.get('Name', account['Id'])})
+    except ClientError as e:
+        raise ConnectionError(f"An AWS error occurred while listing member accounts: {e.response['Error']['Message']}")
+    except BotoCoreError as e:
+        raise ConnectionError(f"An AWS error occurred while listing member accounts: {e}")
+
+    return sorted(accounts, key=lambda account: account['id'])
+
+
+def member_role_arn(management_role_arn, account_id, role_name=None):
+    """
+    The role to assume in a member account. Defaults to the management
+    role's own name, as deployed to every account by a StackSet.
+    """
+    role_name = role_name or management_role_arn.split(':role/', 1)[-1]
+    partition = management_role_arn.split(':')[1] if management_role_arn.count(':') >= 5 else 'aws'
+    return f"arn:{partition}:iam::{account_id}:role/{role_name}"
+
+
+def member_scan_id(org_scan_id, account_id):
+    return f"{org_scan_id}-{account_id}"
+
+
+def member_cloud_account_id(org_cloud_account_id, account_id):
+    """Assets and findings of a member account are stored under this cloudAccountId."""
+    return f"{org_cloud_account_id}:{account_id}"
+
+
+def rollup(accounts, member_scans):
+    """
+    Combines the member scans into the organization's summary.
+    `member_scans` maps account id to that scan's (status, score, findings).
+    The org score weighs each completed account by its result count.
+    """
+    by_status = {}
+    by_control = {}
+    per_account = []
+    total_results = 0
+    weighted_score = 0
+
+    for account in accounts:
+        status, score, findings = member_scans.get(account['id'], ('FAILED', 0, None))
+        findings = findings or {}
+        result_count = findings.get('result_count', 0) if status == 'COMPLETED' else 0
+        per_account.append({
+            "account_id": account['id'],
+            "name": account['name'],
+            "status": status,
+            "score": score,
+            "result_count": result_count,
+            "error": findings.get('error')
+        })
+        if status != 'COMPLETED':
+            continue
+
+        total_results += result_count
+        weighted_score += (score or 0) * result_count
+        counts = findings.get('counts') or {}
+        for key, count in counts.get('by_status', {}).items():
+            by_status[key] = by_status.get(key, 0) + count
+        for control, statuses in counts.get('by_control', {}).items():
+            control_counts = by_control.setdefault(control, {})
+            for key, count in statuses.items():
+                control_counts[key] = control_counts.get(key, 0) + count
+
+    completed = sum(1 for account in per_account if account['status'] == 'COMPLETED')
+    return {
+        "accounts": len(accounts),
+        "completed": completed,
+        "failed": len(accounts) - completed,
+        "score": int(weighted_score / total_results) if total_results else (100 if completed else 0),
+        "counts": {"total": total_results, "by_status": by_status, "by_control": by_control},
+        "per_account": per_account
+    }
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+from connectors.aws_connector import BucketListingError, LIST_BUCKETS_PAGE_SIZE
+
+# A failed listing page is retried from its continuation token this many
+# times (on top of botocore's own retries) before the error is raised
+LIST_RESUME_ATTEMPTS = int(os.getenv("LOXE_LIST_RESUME_ATTEMPTS", "3"))
+LIST_RESUME_BACKOFF_SECONDS = 2
+
+
+def print_progress(listed, pages):
+    print(f"📄 Listed {listed} bucket(s) from {pages} page(s)...")
+
+
+class ResourceSnapshot:
+    """
+    Per-scan view of the account's S3 resources.
+    Enumerates buckets once and caches the listing, resolved bucket regions
+    and the client handle so the inventory and rules phases share them instead
+    of each calling list_buckets with their own client.
+
+    The listing is paged (see iter_bucket_pages). Only each bucket's name,
+    creation date and region are kept, not the raw pages.
+    """
+
+    def __init__(self, aws_connector, progress=print_progress, page_size=LIST_BUCKETS_PAGE_SIZE):
+        self.connector = aws_connector
+        self.locations = {}
+        self.page_size = page_size
+        # Called as progress(buckets listed so far, pages read) after every page
+        self.progress = progress
+        self._buckets = []
+        self._owner = None
+        self._next_token = None
+        self._pages = 0
+        self._complete = False
+        self._s3_client = None
+        self._lock = threading.Lock()
+
+    def s3_client(self):
+        """
+        The connector's pooled S3 client, shared by every phase and worker thread.
+        Returns None when the connector has no session.
+        """
+        if not self.connector or not self.connector.session:
+            return None
+        if self._s3_client is None:
+            self._s3_client = self.connector.client('s3')
+        return self._s3_client
+
+    def iter_bucket_pages(self):
+        """
+        Yields the bucket listing a page at a time as ListBuckets returns it,
+        so callers can start work on the first page while later ones load.
+        Buckets this snapshot already listed come back first as one page.
+        A failed page is retried from its continuation token, so pages
+        already read are not fetched again; after LIST_RESUME_ATTEMPTS the
+        error is raised and the next call resumes from the same token.
+        Meant for one consumer at a time.
+        """
+        with self._lock:
+            listed = list(self._buckets)
+        if listed:
+            yield listed
+
+        attempts = 0
+        while not self._complete:
+            if self.s3_client() is None:
+                raise ConnectionError("Cannot list S3 buckets because the AWS session was not established.")
+
+            try:
+                pages = self.connector.iter_s3_bucket_pages(
+                    page_size=self.page_size, continuation_token=self._next_token, s3_client=self.s3_client()
+                )
+                for response in pages:
+                    page = [
+                        {key: bucket[key] for key in ('Name', 'CreationDate', 'BucketRegion') if key in bucket}
+                        for bucket in response.get('Buckets', [])
+                    ]
+                    with self._lock:
+                        self._buckets.extend(page)
+                        self._owner = self._owner or response.get('Owner', {}).get('ID')
+                        self._next_token = response.get('ContinuationToken')
+                        self._complete = not self._next_token
+                        self._pages += 1
+                    if self.progress:
+                        self.progress(len(self._buckets), self._pages)
+                    attempts = 0
+                    yield page
+            except BucketListingError as e:
+                with self._lock:
+                    self._next_token = e.continuation_token
+                attempts += 1
+                if attempts > LIST_RESUME_ATTEMPTS:
+                    raise
+                print(f"⚠️ {e}; resuming the listing at page {self._pages + 1}...")
+                time.sleep(LIST_RESUME_BACKOFF_SECONDS * attempts)
+
+    def buckets(self):
+        """
+        Every bucket in the account, listing all remaining pages first.
+        """
+        for _ in self.iter_bucket_pages():
+            pass
+        with self._lock:
+            return list(self._buckets)
+
+    def bucket_names(self):
+        return [bucket['Name'] for bucket in self.buckets()]
+
+    @property
+    def owner_id(self):
+        if self._pages == 0:
+            next(self.iter_bucket_pages(), None)
+        return self._owner
+
+    def set_location(self, bucket_name, region):
+        self.locations[bucket_name] = region
+
+    def get_location(self, bucket_name):
+        return self.locations.get(bucket_name)
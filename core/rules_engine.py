@@ -1,76 +1,300 @@
-from botocore.exceptions import ClientError
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import yaml
+from botocore.exceptions import BotoCoreError, ClientError
 from .data_models import EvidenceFinding
 
+# config.yaml at the project root, unless LOXE_CONFIG_PATH points elsewhere
+CONFIG_PATH = os.getenv(
+    "LOXE_CONFIG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.yaml")
+)
+
+
+@dataclass
+class ApiResult:
+    """The outcome of one API call for one resource, shared by every rule that needs it."""
+    response: Optional[dict] = None
+    error_code: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.error_code is None
+
+
+@dataclass
+class Rule:
+    """
+    A registered check. `keyword` is how config.yaml's soc2_controls enable it,
+    `requires` lists the per-bucket S3 client methods whose responses it reads,
+    and `evaluate(bucket_name, data)` returns (status, description, evidence)
+    where data maps each required call to its ApiResult.
+
+    `account_requires` lists account-wide calls as "service:method" (called
+    once per scan with AccountId). If `covered_by_account(data)` is true the
+    account settings already decide the rule, so its per-bucket calls are
+    skipped and left out of data.
+    """
+    keyword: str
+    requires: Tuple[str, ...]
+    evaluate: Callable
+    control_id: Optional[str] = None
+    account_requires: Tuple[str, ...] = ()
+    covered_by_account: Optional[Callable] = None
+
+    def bind(self, control_id):
+        return Rule(self.keyword, self.requires, self.evaluate, control_id,
+                    self.account_requires, self.covered_by_account)
+
+
+# keyword -> Rule, filled by @register_rule
+RULES = {}
+
+
+def register_rule(keyword, requires, account_requires=(), covered_by_account=None):
+    """
+    Decorator that adds an evaluate function to the registry.
+
+        @register_rule('s3_versioning', requires=['get_bucket_versioning'])
+        def s3_versioning(bucket_name, data):
+            ...
+            return status, description, evidence
+    """
+    def decorator(evaluate):
+        RULES[keyword] = Rule(keyword=keyword, requires=tuple(requires), evaluate=evaluate,
+                              account_requires=tuple(account_requires), covered_by_account=covered_by_account)
+        return evaluate
+    return decorator
+
+
+def load_controls(path=CONFIG_PATH):
+    """
+    Returns the soc2_controls entries from config.yaml. A missing or
+    unreadable file is an error: without it no rule would run and every
+    bucket would pass.
+    """
+    try:
+        with open(path) as f:
+            return (yaml.safe_load(f) or {}).get('soc2_controls') or []
+    except (OSError, yaml.YAMLError) as e:
+        raise ValueError(f"Cannot read the compliance controls from {path}: {e}")
+
+
+def active_rules(controls, registry=None):
+    """
+    The registered rules enabled by `controls`, each bound to the control
+    whose keywords list it. Keywords without a registered rule are ignored.
+    """
+    registry = RULES if registry is None else registry
+    rules = []
+    for control in controls:
+        for keyword in control.get('keywords', []):
+            rule = registry.get(keyword)
+            if rule:
+                rules.append(rule.bind(control['control_id']))
+    return rules
+
+
+# --- Rules ---
+
+PAB_SETTINGS = ['BlockPublicAcls', 'IgnorePublicAcls', 'BlockPublicPolicy', 'RestrictPublicBuckets']
+
+ACCOUNT_PAB_CALL = 's3control:get_public_access_block'
+
+
+def _account_pab(data):
+    """
+    The account-wide PublicAccessBlockConfiguration, or None if it is unset or could not be read.
+    """
+    result = data.get(ACCOUNT_PAB_CALL)
+    if result is None or not result.ok:
+        return None
+    return result.response.get('PublicAccessBlockConfiguration', {})
+
+
+def account_blocks_public_access(data):
+    config = _account_pab(data)
+    return bool(config) and all(config.get(setting, False) for setting in PAB_SETTINGS)
+
+
+@register_rule('s3_public_access', requires=['get_public_access_block'],
+               account_requires=[ACCOUNT_PAB_CALL], covered_by_account=account_blocks_public_access)
+def s3_public_access_block(bucket_name, data):
+    """
+    Checks that public access to a bucket is blocked by its own Public Access
+    Block, the account-wide one, or both (each setting applies if either
+    layer enables it). Evidence always records both layers.
+    """
+    account_config = _account_pab(data)
+    account_result = data.get(ACCOUNT_PAB_CALL)
+    if account_config is not None:
+        account_evidence = account_config
+    else:
+        account_evidence = {'error': account_result.error_code if account_result else 'NotChecked'}
+
+    if 'get_public_access_block' not in data:
+        # covered_by_account: all four settings are enforced account-wide
+        return ('PASS', 'Public access is blocked by the account-level Public Access Block.',
+                {'account': account_evidence, 'bucket': {'skipped': 'Covered by the account-level setting.'}})
+
+    result = data['get_public_access_block']
+    if not result.ok:
+        if result.error_code == 'NoSuchPublicAccessBlockConfiguration':
+            return ('FAIL', 'S3 bucket does not have a Public Access Block configured.',
+                    {'account': account_evidence, 'bucket': {'error': 'NoSuchPublicAccessBlockConfiguration'}})
+        return ('ERROR', f"Could not check bucket '{bucket_name}'.",
+                {'account': account_evidence, 'bucket': {'error': result.error}})
+
+    config = result.response.get('PublicAccessBlockConfiguration', {})
+    account_config = account_config or {}
+    is_compliant = all(config.get(setting, False) or account_config.get(setting, False) for setting in PAB_SETTINGS)
+
+    evidence = {'account': account_evidence, 'bucket': config}
+    if is_compliant:
+        return 'PASS', 'S3 bucket Public Access Block is enabled.', evidence
+    return 'FAIL', 'S3 bucket Public Access Block is not fully enabled.', evidence
+
 
 class RulesEngine:
     """
     Contains a set of rules to check for SOC 2 compliance evidence in AWS.
+    Rules come from the registry above and are enabled by config.yaml's
+    soc2_controls; each bucket's API calls are made once and shared by
+    every rule that needs them.
     """
 
-    def __init__(self, aws_connector):
+    def __init__(self, aws_connector, s3_client=None, controls=None, evidence_cache=None, registry=None):
         """
         Initializes the RulesEngine with a pre-configured AWSConnector.
+        An existing S3 client (e.g. the scan snapshot's) can be passed in to avoid building another.
+        `controls` overrides the soc2_controls read from config.yaml, and
+        `registry` the registered rules they enable.
+        Raises ValueError if no rule is enabled.
+        With an EvidenceCache, every API call is looked up there before AWS is called.
         """
         self.connector = aws_connector
+        self.evidence_cache = evidence_cache
         # IMPORTANT: Check if the session is valid before creating clients.
-        self.s3_client = None
-        if self.connector and self.connector.session:
-            self.s3_client = self.connector.session.client('s3')
+        self.s3_client = s3_client
+        if self.s3_client is None and self.connector and self.connector.session:
+            self.s3_client = self.connector.client('s3')
+
+        self.rules = active_rules(load_controls() if controls is None else controls, registry)
+        if not self.rules:
+            raise ValueError("No compliance rules are enabled; check soc2_controls in config.yaml.")
 
-        print("✅ RulesEngine initialized.")
+        # Account-wide API results are fetched once and shared by every bucket
+        self._account_results = {}
+        self._account_lock = threading.Lock()
+        self.skipped_calls = 0
+        print(f"✅ RulesEngine initialized with {len(self.rules)} rule(s).")
 
-    def check_s3_public_access_block(self, bucket_name):
+    def evaluate_bucket(self, bucket_name, s3_client=None, rules=None):
         """
-        Checks if a specific S3 bucket has the Public Access Block enabled.
+        Runs every active rule (or just `rules`) against one bucket in a single
+        pass. Each required API call is made once, however many rules read it.
+        Pass s3_client to use a client local to the bucket's region.
+        Returns one EvidenceFinding per rule, in rule order.
         """
-        # If the s3_client couldn't be created, we can't run the check.
-        if not self.s3_client:
-            return EvidenceFinding(
-                control_id='CC6.1',
+        rules = self.rules if rules is None else rules
+        s3_client = s3_client or self.s3_client
+
+        # If the s3_client couldn't be created, we can't run the checks.
+        if not s3_client:
+            return [
+                EvidenceFinding(
+                    control_id=rule.control_id,
+                    resource=bucket_name,
+                    status='ERROR',
+                    description='Could not run check because the S3 client is not available.',
+                    evidence={'error': 'Invalid AWS session.'}
+                )
+                for rule in rules
+            ]
+
+        data = {}
+        for rule in rules:
+            for call in rule.account_requires:
+                if call not in data:
+                    data[call] = self.account_result(call)
+
+        bucket_calls = set()
+        for rule in rules:
+            if rule.covered_by_account and rule.covered_by_account(data):
+                continue
+            bucket_calls.update(rule.requires)
+
+        for rule in rules:
+            for call in rule.requires:
+                if call in bucket_calls and call not in data:
+                    data[call] = self._cached(
+                        f"arn:aws:s3:::{bucket_name}", call, lambda: self._fetch(s3_client, call, bucket_name)
+                    )
+
+        skipped = len({call for rule in rules for call in rule.requires} - bucket_calls)
+        if skipped:
+            with self._account_lock:
+                self.skipped_calls += skipped
+
+        findings = []
+        for rule in rules:
+            status, description, evidence = rule.evaluate(bucket_name, data)
+            findings.append(EvidenceFinding(
+                control_id=rule.control_id,
                 resource=bucket_name,
-                status='ERROR',
-                description='Could not run check because the S3 client is not available.',
-                evidence={'error': 'Invalid AWS session.'}
-            )
+                status=status,
+                description=description,
+                evidence=evidence
+            ))
+        return findings
 
-        status = ''
-        description = ''
-        evidence_details = {}
+    def check_s3_public_access_block(self, bucket_name, s3_client=None):
+        """
+        Checks if a specific S3 bucket has the Public Access Block enabled.
+        Pass s3_client to use a client local to the bucket's region.
+        """
+        rule = next((rule for rule in self.rules if rule.keyword == 's3_public_access'), None)
+        if rule is None:
+            rule = RULES['s3_public_access'].bind('CC6.1')
+        return self.evaluate_bucket(bucket_name, s3_client=s3_client, rules=[rule])[0]
 
-        try:
-            pab_config = self.s3_client.get_public_access_block(Bucket=bucket_name)
-            config = pab_config.get('PublicAccessBlockConfiguration', {})
+    def account_result(self, call):
+        """
+        The ApiResult of an account-wide "service:method" call, made on first
+        use with the account ID from the connector's role ARN.
+        """
+        with self._account_lock:
+            if call not in self._account_results:
+                self._account_results[call] = self._cached('account', call, lambda: self._fetch_account(call))
+            return self._account_results[call]
 
-            is_compliant = all([
-                config.get('BlockPublicAcls', False),
-                config.get('IgnorePublicAcls', False),
-                config.get('BlockPublicPolicy', False),
-                config.get('RestrictPublicBuckets', False)
-            ])
+    def _cached(self, resource_arn, call, fetch):
+        if self.evidence_cache is None:
+            return fetch()
+        return self.evidence_cache.fetch(resource_arn, call, fetch)
 
-            if is_compliant:
-                status = 'PASS'
-                description = 'S3 bucket Public Access Block is enabled.'
-            else:
-                status = 'FAIL'
-                description = 'S3 bucket Public Access Block is not fully enabled.'
+    def _fetch_account(self, call):
+        account_id = self.connector.account_id if self.connector else None
+        if not account_id or not self.connector.session:
+            return ApiResult(error_code='NoAccount', error='No AWS session or account ID to query.')
 
-            evidence_details = config
+        service, method = call.split(':')
+        try:
+            return ApiResult(response=getattr(self.connector.client(service), method)(AccountId=account_id))
+        except ClientError as e:
+            return ApiResult(error_code=e.response['Error']['Code'], error=str(e))
+        except BotoCoreError as e:
+            return ApiResult(error_code=type(e).__name__, error=str(e))
 
+    @staticmethod
+    def _fetch(s3_client, call, bucket_name):
+        try:
+            return ApiResult(response=getattr(s3_client, call)(Bucket=bucket_name))
         except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchPublicAccessBlockConfiguration':
-                status = 'FAIL'
-                description = 'S3 bucket does not have a Public Access Block configured.'
-                evidence_details = {'error': 'NoSuchPublicAccessBlockConfiguration'}
-            else:
-                status = 'ERROR'
-                description = f"Could not check bucket '{bucket_name}'."
-                evidence_details = {'error': str(e)}
-
-        return EvidenceFinding(
-            control_id='CC6.1',
-            resource=bucket_name,
-            status=status,
-            description=description,
-            evidence=evidence_details
-        )
\ No newline at end of file
+            return ApiResult(error_code=e.response['Error']['Code'], error=str(e))
+        except BotoCoreError as e:
+            return ApiResult(error_code=type(e).__name__, error=str(e))
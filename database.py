@@ -1,24 +1,225 @@
+import io
 import os
+import re
+import time
 import uuid  # <-- Import UUID
-from sqlalchemy import create_engine, text
-from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import create_engine, event, text, select, tuple_, Table, MetaData, Column, String, Integer, DateTime, \
+    JSON
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import JSONB
 from dotenv import load_dotenv
 import json
 
+from core.findings_diff import diff_findings
+from core.metrics import DB_STATEMENT_SECONDS, DB_ROWS_WRITTEN
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+# Every running scan holds one pooled connection for its unit of work, so the
+# pool is sized for LOXE_MAX_ACTIVE_SCANS of them plus the short-lived
+# connections used around them (queue, heartbeats, evidence cache).
+DB_POOL_SIZE = int(os.getenv("LOXE_DB_POOL_SIZE", str(int(os.getenv("LOXE_MAX_ACTIVE_SCANS", "50")) + 5)))
+DB_MAX_OVERFLOW = int(os.getenv("LOXE_DB_MAX_OVERFLOW", "10"))
 
+# A scan's transaction sits idle while it talks to AWS. Postgres ends any
+# transaction idle for longer than this (0 = never), so a hung scan cannot
+# hold its Asset row locks and its connection indefinitely.
+DB_IDLE_IN_TRANSACTION_SECONDS = int(os.getenv("LOXE_DB_IDLE_IN_TRANSACTION_SECONDS", "3600"))
 
-def upsert_assets(assets: list, cloud_account_id: str):
-    if not assets:
-        return
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_session_timeouts(dbapi_connection, connection_record):
+    # Set per session rather than in connect_args, which would replace PGOPTIONS
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute(f"SET idle_in_transaction_session_timeout = {DB_IDLE_IN_TRANSACTION_SECONDS * 1000}")
+    dbapi_connection.commit()
+
+# --- Instrumentation ---
+# Every statement on any engine is timed into core.metrics by kind and
+# table ("UPDATE Scan"). A ScanUnitOfWork also totals its own statements,
+# for the timing breakdown stored with the scan.
+
+STATEMENT_TABLE = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?:\w+\.)?"?(\w+)', re.IGNORECASE
+)
+WRITE_VERBS = {"INSERT", "UPDATE", "DELETE", "COPY"}
+
+_statement_labels = {}
+
+
+def _statement_label(statement):
+    """(verb, table) of a SQL statement, memoized since the app reuses a few hundred statements."""
+    label = _statement_labels.get(statement)
+    if label is None:
+        words = statement.split(None, 1)
+        match = STATEMENT_TABLE.search(statement)
+        label = (words[0].upper() if words else "", match.group(1) if match else "")
+        if len(_statement_labels) < 1000:
+            _statement_labels[statement] = label
+    return label
+
+
+def _record_statement(conn, verb, table, seconds, rowcount):
+    DB_STATEMENT_SECONDS.observe(seconds, f"{verb} {table}".strip())
+    written = rowcount if verb in WRITE_VERBS and rowcount and rowcount > 0 else 0
+    if written:
+        DB_ROWS_WRITTEN.inc(table, amount=written)
+
+    stats = conn.info.get("scan_db_stats")
+    if stats is not None:
+        stats["statements"] += 1
+        stats["seconds"] += seconds
+        if written:
+            stats["rows_written"][table] = stats["rows_written"].get(table, 0) + written
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("statement_started", None)
+    if started is not None:
+        verb, table = _statement_label(statement)
+        _record_statement(conn, verb, table, time.perf_counter() - started, cursor.rowcount)
+
+
+# --- Table metadata and statements ---
+# Built once at import so every call (and SQLAlchemy's compiled cache) reuses them.
+metadata_obj = MetaData()
+
+# We MUST include the 'id' column in the table definition now
+asset_table = Table('Asset', metadata_obj,
+                    Column('id', String, primary_key=True),
+                    Column('resourceId', String),
+                    Column('cloudAccountId', String),
+                    Column('name', String),
+                    Column('type', String),
+                    Column('provider', String),
+                    Column('region', String),
+                    Column('status', String),
+                    Column('metadata', JSON),
+                    Column('updatedAt', DateTime)
+                    )
+
+finding_table = Table('Finding', metadata_obj,
+                      Column('id', String, primary_key=True),
+                      Column('controlId', String),
+                      Column('status', String),
+                      Column('description', String),
+                      Column('severity', String),
+                      Column('assetId', String),
+                      Column('scanId', String),
+                      Column('updatedAt', DateTime)
+                      )
+
+# One row per check result, keyed by (scanId, position) in report order
+scan_result_table = Table('ScanResult', metadata_obj,
+                          Column('scanId', String, primary_key=True),
+                          Column('position', Integer, primary_key=True),
+                          Column('controlId', String),
+                          Column('status', String),
+                          Column('resource', String),
+                          Column('description', String),
+                          Column('evidence', JSONB)
+                          )
+
+UPDATE_SCAN_RESULTS = text("""
+    UPDATE "Scan"
+    SET status = :status, score = :score, findings = :findings
+    WHERE id = :scan_id
+""")
+
+UPDATE_ASSET_STATUS = text("""
+    UPDATE "Asset"
+    SET status = :status
+    WHERE "cloudAccountId" = :cloud_account_id 
+    AND "resourceId" = :resource_id
+""")
+
+UPDATE_ASSET_STATUSES = text("""
+    UPDATE "Asset" AS a
+    SET status = v.status
+    FROM unnest(CAST(:resource_ids AS TEXT[]), CAST(:statuses AS TEXT[])) AS v("resourceId", status)
+    WHERE a."cloudAccountId" = :cloud_account_id
+    AND a."resourceId" = v."resourceId"
+""")
+
+# Fetch only the ID and resourceId for this account
+SELECT_ASSET_MAP = text('SELECT id, "resourceId" FROM "Asset" WHERE "cloudAccountId" = :id')
 
-    records = []
+SELECT_ASSET_REGIONS = text('SELECT "resourceId", region FROM "Asset" WHERE "cloudAccountId" = :id')
+
+SELECT_SCAN_STATE = text("""
+    SELECT "lastScanId", watermark FROM "AccountScanState" WHERE "cloudAccountId" = :id
+""")
+
+UPSERT_SCAN_STATE = text("""
+    INSERT INTO "AccountScanState" ("cloudAccountId", "lastScanId", watermark)
+    VALUES (:id, :scan_id, :watermark)
+    ON CONFLICT ("cloudAccountId") DO UPDATE SET "lastScanId" = EXCLUDED."lastScanId", watermark = EXCLUDED.watermark
+""")
+
+# Postgres syntax for "Delete where ID is in this list"
+DELETE_ASSET_FINDINGS = text('DELETE FROM "Finding" WHERE "assetId" = ANY(:ids)')
+
+SELECT_ASSET_FINDINGS = text("""
+    SELECT id, "assetId", "controlId", status, description, severity
+    FROM "Finding"
+    WHERE "assetId" = ANY(:ids)
+""")
+
+UPDATE_FINDINGS = text("""
+    UPDATE "Finding" AS f
+    SET status = v.status, description = v.description, severity = v.severity,
+        "scanId" = :scan_id, "updatedAt" = :updated_at
+    FROM unnest(CAST(:ids AS TEXT[]), CAST(:statuses AS TEXT[]),
+                CAST(:descriptions AS TEXT[]), CAST(:severities AS TEXT[]))
+         AS v(id, status, description, severity)
+    WHERE f.id = v.id
+""")
+
+DELETE_FINDINGS = text('DELETE FROM "Finding" WHERE id = ANY(:ids)')
+
+DELETE_SCAN_RESULTS = text('DELETE FROM "ScanResult" WHERE "scanId" = :scan_id')
+
+# Scans attached to a leader (see enqueue_scan) get its outcome and a copy of its results
+COMPLETE_FOLLOWERS = text("""
+    UPDATE "Scan" AS f
+    SET status = l.status, score = l.score, findings = l.findings
+    FROM "Scan" AS l
+    WHERE l.id = :scan_id AND f."coalescedInto" = l.id AND f.status = 'QUEUED'
+    RETURNING f.id
+""")
+
+COPY_FOLLOWER_RESULTS = text("""
+    INSERT INTO "ScanResult" ("scanId", position, "controlId", status, resource, description, evidence)
+    SELECT f.id, r.position, r."controlId", r.status, r.resource, r.description, r.evidence
+    FROM "ScanResult" AS r CROSS JOIN unnest(CAST(:ids AS text[])) AS f(id)
+    WHERE r."scanId" = :scan_id
+""")
+
+
+def _asset_records(assets, cloud_account_id):
+    """
+    Lazily turns inventory dicts into 'Asset' rows, so large inventories never sit in memory twice.
+    """
     for asset in assets:
         record = asset.copy()
         record['cloudAccountId'] = cloud_account_id
@@ -31,44 +232,206 @@ def upsert_assets(assets: list, cloud_account_id: str):
 
         if isinstance(record.get('metadata'), dict):
             record['metadata'] = json.dumps(record['metadata'], default=str)
-        records.append(record)
+        yield record
+
+
+# --- COPY ingestion ---
+# Rows are streamed into a session-local staging table with COPY, one chunk at
+# a time, and merged into the real table with a single INSERT ... SELECT per
+# chunk. Memory stays flat in the number of rows, and there are no bind
+# parameters at all, so Postgres' 65k parameter limit never applies.
+
+COPY_CHUNK_SIZE = int(os.getenv("LOXE_COPY_CHUNK_SIZE", "5000"))
+
+ASSET_COLUMNS = [column.name for column in asset_table.columns]
+FINDING_COLUMNS = [column.name for column in finding_table.columns]
+SCAN_RESULT_COLUMNS = [column.name for column in scan_result_table.columns]
+
+
+def _quoted(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _copy_value(value):
+    """
+    Encodes one value for COPY's text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, default=str)
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
 
+def _copy_chunks(conn, records, target, columns, chunk_size, after_chunk=None, staging=False):
+    """
+    COPYs `records` (any iterable of dicts) into `target` chunk by chunk,
+    calling after_chunk() once each chunk is in. Returns the number of rows read.
+    Rows copied into a `staging` table are not counted as written; the merge
+    that moves them into the real table is.
+    """
+    copy_sql = f'COPY {target} ({_quoted(columns)}) FROM STDIN'
+    cursor = conn.connection.cursor()
+
+    total = 0
+    iterator = iter(records)
+    while chunk := list(islice(iterator, chunk_size)):
+        buffer = io.StringIO()
+        for record in chunk:
+            buffer.write('\t'.join(_copy_value(record.get(column)) for column in columns))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        started = time.perf_counter()
+        cursor.copy_expert(copy_sql, buffer)
+        _record_statement(conn, "COPY", target.strip('"'), time.perf_counter() - started,
+                          0 if staging else len(chunk))
+        if after_chunk:
+            after_chunk()
+        total += len(chunk)
+    return total
+
+
+def _copy_merge(conn, records, table_name, staging_name, columns, merge_sql, chunk_size):
+    """
+    COPYs `records` into a temp staging table chunk by chunk, running
+    merge_sql after each chunk. Returns the number of rows read.
+    """
+    # ON COMMIT DELETE ROWS keeps the table empty between transactions, and it
+    # lives as long as the pooled connection, so it is only created once.
+    conn.execute(text(
+        f'CREATE TEMP TABLE IF NOT EXISTS {staging_name} (LIKE "{table_name}" INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+    ))
+
+    def merge():
+        conn.execute(merge_sql)
+        conn.execute(text(f'TRUNCATE {staging_name}'))
+
+    return _copy_chunks(conn, records, staging_name, columns, chunk_size, after_chunk=merge, staging=True)
+
+
+MERGE_ASSETS = text(f"""
+    INSERT INTO "Asset" ({_quoted(ASSET_COLUMNS)})
+    SELECT DISTINCT ON ("cloudAccountId", "resourceId") {_quoted(ASSET_COLUMNS)}
+    FROM asset_staging
+    ON CONFLICT ("cloudAccountId", "resourceId") DO UPDATE SET
+    {", ".join(f'"{column}" = EXCLUDED."{column}"' for column in ASSET_COLUMNS
+               if column not in ['id', 'resourceId', 'cloudAccountId'])}
+""")
+
+MERGE_FINDINGS = text(f"""
+    INSERT INTO "Finding" ({_quoted(FINDING_COLUMNS)})
+    SELECT {_quoted(FINDING_COLUMNS)} FROM finding_staging
+    ON CONFLICT (id) DO NOTHING
+""")
+
+
+def _upsert_assets(conn, records, chunk_size=COPY_CHUNK_SIZE):
+    return _copy_merge(conn, records, 'Asset', 'asset_staging', ASSET_COLUMNS, MERGE_ASSETS, chunk_size)
+
+
+def _update_scan_results(conn, scan_id, status, score, findings):
+    findings_json = json.dumps(findings) if isinstance(findings, dict) else findings
+
+    conn.execute(UPDATE_SCAN_RESULTS, {
+        "status": status,
+        "score": score,
+        "findings": findings_json,
+        "scan_id": scan_id
+    })
+    _complete_followers(conn, scan_id)
+
+
+def _complete_followers(conn, scan_id):
+    follower_ids = [row[0] for row in conn.execute(COMPLETE_FOLLOWERS, {"scan_id": scan_id})]
+    if follower_ids:
+        conn.execute(text('DELETE FROM "ScanResult" WHERE "scanId" = ANY(:ids)'), {"ids": follower_ids})
+        conn.execute(COPY_FOLLOWER_RESULTS, {"ids": follower_ids, "scan_id": scan_id})
+        print(f"🔗 Shared results of scan {scan_id} with {len(follower_ids)} attached scan(s).")
+    return follower_ids
+
+
+def _update_asset_statuses(conn, cloud_account_id, statuses):
+    result = conn.execute(UPDATE_ASSET_STATUSES, {
+        "resource_ids": list(statuses.keys()),
+        "statuses": list(statuses.values()),
+        "cloud_account_id": cloud_account_id
+    })
+    return result.rowcount
+
+
+def _get_asset_map(conn, cloud_account_id):
+    asset_map = {}
+    result = conn.execute(SELECT_ASSET_MAP, {"id": cloud_account_id})
+
+    for row in result:
+        # row[0] is id, row[1] is resourceId
+        asset_map[row[1]] = row[0]
+    return asset_map
+
+
+def _insert_findings(conn, findings_data, chunk_size=COPY_CHUNK_SIZE):
+    return _copy_merge(conn, findings_data, 'Finding', 'finding_staging', FINDING_COLUMNS, MERGE_FINDINGS, chunk_size)
+
+
+def _scan_result_records(scan_id, results):
+    for position, result in enumerate(results):
+        yield {
+            "scanId": scan_id,
+            "position": position,
+            "controlId": result.get("control_id"),
+            "status": result.get("status"),
+            "resource": result.get("resource"),
+            "description": result.get("description"),
+            "evidence": result.get("evidence")
+        }
+
+
+def _replace_scan_results(conn, scan_id, results, chunk_size=COPY_CHUNK_SIZE):
+    # A retried scan replaces whatever an earlier attempt stored
+    conn.execute(DELETE_SCAN_RESULTS, {"scan_id": scan_id})
+    return _copy_chunks(conn, _scan_result_records(scan_id, results), '"ScanResult"', SCAN_RESULT_COLUMNS, chunk_size)
+
+
+def _clear_asset_findings(conn, asset_ids):
+    conn.execute(DELETE_ASSET_FINDINGS, {"ids": asset_ids})
+
+
+def _sync_findings(conn, scan_id, asset_ids, findings_data):
+    existing = conn.execute(SELECT_ASSET_FINDINGS, {"ids": asset_ids}).mappings()
+    diff = diff_findings(existing, findings_data)
+
+    if diff.inserts:
+        _insert_findings(conn, diff.inserts)
+    if diff.updates:
+        conn.execute(UPDATE_FINDINGS, {
+            "ids": [record['id'] for record in diff.updates],
+            "statuses": [record['status'] for record in diff.updates],
+            "descriptions": [record['description'] for record in diff.updates],
+            "severities": [record['severity'] for record in diff.updates],
+            "scan_id": scan_id,
+            "updated_at": datetime.now()
+        })
+    if diff.resolved_ids:
+        conn.execute(DELETE_FINDINGS, {"ids": diff.resolved_ids})
+    return diff.summary()
+
+
+def upsert_assets(assets, cloud_account_id: str):
+    """
+    Inserts or updates inventory assets. `assets` may be any iterable,
+    including a generator; it is streamed to Postgres in COPY chunks.
+    """
     try:
         with engine.connect() as conn:
-            from sqlalchemy import Table, MetaData, Column, String, DateTime, JSON
-            metadata_obj = MetaData()
-
-            # We MUST include the 'id' column in the table definition now
-            asset_table = Table('Asset', metadata_obj,
-                                Column('id', String, primary_key=True),
-                                Column('resourceId', String),
-                                Column('cloudAccountId', String),
-                                Column('name', String),
-                                Column('type', String),
-                                Column('provider', String),
-                                Column('region', String),
-                                Column('status', String),
-                                Column('metadata', JSON),
-                                Column('updatedAt', DateTime)
-                                )
-
-            # We pass the full record (INCLUDING 'id') to the insert statement
-            stmt = insert(asset_table).values(records)
-
-            update_dict = {
-                col.name: col
-                for col in stmt.excluded
-                if col.name not in ['id', 'resourceId', 'cloudAccountId']
-            }
-
-            on_conflict_stmt = stmt.on_conflict_do_update(
-                index_elements=['cloudAccountId', 'resourceId'],
-                set_=update_dict
-            )
-
-            conn.execute(on_conflict_stmt)
+            count = _upsert_assets(conn, _asset_records(assets, cloud_account_id))
             conn.commit()
-            print(f"✅ Successfully upserted {len(records)} assets.")
+            if count:
+                print(f"✅ Successfully upserted {count} assets.")
 
     except Exception as e:
         print(f"❌ Failed to upsert assets: {e}")
@@ -77,21 +440,7 @@ def upsert_assets(assets: list, cloud_account_id: str):
 def update_scan_results(scan_id: str, status: str, score: int, findings: dict):
     try:
         with engine.connect() as connection:
-            query = text("""
-                UPDATE "Scan"
-                SET status = :status, score = :score, findings = :findings
-                WHERE id = :scan_id
-            """)
-
-            findings_json = json.dumps(findings) if isinstance(findings, dict) else findings
-
-            connection.execute(query, {
-                "status": status,
-                "score": score,
-                "findings": findings_json,
-                "scan_id": scan_id
-            })
-
+            _update_scan_results(connection, scan_id, status, score, findings)
             connection.commit()
             print(f"✅ Successfully saved results for Scan {scan_id}")
 
@@ -106,14 +455,7 @@ def update_asset_status(cloud_account_id: str, resource_id: str, status: str):
     """
     try:
         with engine.connect() as connection:
-            query = text("""
-                UPDATE "Asset"
-                SET status = :status
-                WHERE "cloudAccountId" = :cloud_account_id 
-                AND "resourceId" = :resource_id
-            """)
-
-            connection.execute(query, {
+            connection.execute(UPDATE_ASSET_STATUS, {
                 "status": status,
                 "cloud_account_id": cloud_account_id,
                 "resource_id": resource_id
@@ -124,58 +466,49 @@ def update_asset_status(cloud_account_id: str, resource_id: str, status: str):
         print(f"⚠️ Failed to update asset status for {resource_id}: {e}")
 
 
+def update_asset_statuses(cloud_account_id: str, statuses: dict):
+    """
+    Applies every asset status from a scan in one set-based UPDATE.
+    `statuses` maps Resource IDs (ARNs) to their new status. The pairs are
+    sent as two array parameters and joined with unnest, so the statement
+    and its bind count stay the same size however many assets there are.
+    """
+    if not statuses:
+        return
+    try:
+        with engine.connect() as connection:
+            updated = _update_asset_statuses(connection, cloud_account_id, statuses)
+            connection.commit()
+            print(f"✅ Updated status for {updated} assets.")
+
+    except Exception as e:
+        print(f"⚠️ Failed to update asset statuses: {e}")
+
+
 def get_asset_map(cloud_account_id: str):
     """
     Returns a dictionary mapping Resource IDs (ARNs) to Internal Database IDs.
     Example: {'arn:aws:s3:::my-bucket': 'asset_12345uuid'}
     """
-    asset_map = {}
     try:
         with engine.connect() as conn:
-            # Fetch only the ID and resourceId for this account
-            query = text('SELECT id, "resourceId" FROM "Asset" WHERE "cloudAccountId" = :id')
-            result = conn.execute(query, {"id": cloud_account_id})
-
-            for row in result:
-                # row[0] is id, row[1] is resourceId
-                asset_map[row[1]] = row[0]
-
-        return asset_map
+            return _get_asset_map(conn, cloud_account_id)
     except Exception as e:
         print(f"⚠️ Failed to fetch asset map: {e}")
         return {}
 
 
-def insert_findings_bulk(findings_data: list):
+def insert_findings_bulk(findings_data):
     """
     Bulk inserts finding records into the Finding table.
+    `findings_data` may be any iterable; it is streamed in COPY chunks.
     """
-    if not findings_data:
-        return
-
     try:
         with engine.connect() as conn:
-            from sqlalchemy import Table, MetaData, Column, String, DateTime
-            metadata_obj = MetaData()
-
-            finding_table = Table('Finding', metadata_obj,
-                                  Column('id', String, primary_key=True),
-                                  Column('controlId', String),
-                                  Column('status', String),
-                                  Column('description', String),
-                                  Column('severity', String),
-                                  Column('assetId', String),
-                                  Column('scanId', String),
-                                  Column('updatedAt', DateTime)
-                                  )
-
-            # Use generic insert
-            stmt = insert(finding_table).values(findings_data)
-
-            # Execute
-            conn.execute(stmt)
+            count = _insert_findings(conn, findings_data)
             conn.commit()
-            print(f"✅ Successfully inserted {len(findings_data)} finding records.")
+            if count:
+                print(f"✅ Successfully inserted {count} finding records.")
 
     except Exception as e:
         print(f"❌ Failed to insert findings: {e}")
@@ -191,11 +524,908 @@ def clear_asset_findings(asset_ids: list):
         return
     try:
         with engine.connect() as connection:
-            # Postgres syntax for "Delete where ID is in this list"
-            query = text('DELETE FROM "Finding" WHERE "assetId" = ANY(:ids)')
-            connection.execute(query, {"ids": asset_ids})
+            _clear_asset_findings(connection, asset_ids)
             connection.commit()
             print(f"🧹 Cleared old findings for {len(asset_ids)} assets.")
 
     except Exception as e:
-        print(f"⚠️ Failed to clear old findings: {e}")
\ No newline at end of file
+        print(f"⚠️ Failed to clear old findings: {e}")
+
+
+class ScanUnitOfWork:
+    """
+    Runs all persistence for one scan on a single connection inside a single
+    transaction, committed once when the block exits cleanly.
+
+    Unlike the standalone helpers above, errors are not swallowed: any
+    failure rolls back everything, so a half-failed scan never leaves
+    findings deleted but not replaced.
+
+        with ScanUnitOfWork(scan_id, cloud_account_id) as uow:
+            uow.upsert_assets(assets)
+            ...
+            uow.save_results("COMPLETED", score, findings)
+    """
+
+    def __init__(self, scan_id: str, cloud_account_id: str):
+        self.scan_id = scan_id
+        self.cloud_account_id = cloud_account_id
+        self.conn = None
+        # Statements run on this unit of work's connection
+        self.db_stats = {"statements": 0, "seconds": 0.0, "rows_written": {}}
+
+    def __enter__(self):
+        self.conn = engine.connect()
+        # info lives on the pooled DBAPI connection, which outlives this scan
+        self._conn_info = self.conn.info
+        self._conn_info["scan_db_stats"] = self.db_stats
+        self.conn.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+                print(f"✅ Committed scan {self.scan_id} in one transaction.")
+            else:
+                self.conn.rollback()
+                print(f"↩️ Rolled back scan {self.scan_id}: {exc}")
+        finally:
+            self._conn_info.pop("scan_db_stats", None)
+            self.conn.close()
+        return False
+
+    def upsert_assets(self, assets):
+        return _upsert_assets(self.conn, _asset_records(assets, self.cloud_account_id))
+
+    def get_asset_map(self):
+        return _get_asset_map(self.conn, self.cloud_account_id)
+
+    def update_asset_statuses(self, statuses: dict):
+        if statuses:
+            _update_asset_statuses(self.conn, self.cloud_account_id, statuses)
+
+    def sync_findings(self, asset_ids: list, findings_data: list):
+        """
+        Brings the stored findings for asset_ids in line with findings_data,
+        touching only rows that actually changed. Returns counts of
+        inserted/updated/unchanged/resolved findings.
+        """
+        summary = _sync_findings(self.conn, self.scan_id, asset_ids, findings_data)
+        print(f"🔁 Findings: {summary['inserted']} new, {summary['updated']} updated, "
+              f"{summary['unchanged']} unchanged, {summary['resolved']} resolved.")
+        return summary
+
+    def get_asset_regions(self):
+        """{resourceId: region} for every asset already stored for the account."""
+        rows = self.conn.execute(SELECT_ASSET_REGIONS, {"id": self.cloud_account_id})
+        return {resource_id: region for resource_id, region in rows}
+
+    def get_scan_results(self, scan_id: str):
+        """All stored report rows (with evidence) of an earlier scan."""
+        return [dict(row) for row in self.conn.execute(_scan_results_query(scan_id, with_evidence=True)).mappings()]
+
+    def get_scan_state(self):
+        """(lastScanId, watermark) of the account's last completed scan, or None."""
+        return self.conn.execute(SELECT_SCAN_STATE, {"id": self.cloud_account_id}).fetchone()
+
+    def save_scan_state(self, watermark):
+        """Records this scan as the base for the account's next incremental scan."""
+        self.conn.execute(UPSERT_SCAN_STATE, {
+            "id": self.cloud_account_id,
+            "scan_id": self.scan_id,
+            "watermark": watermark
+        })
+
+    def save_results(self, status: str, score: int, findings: dict, results=None):
+        """
+        Stores the scan summary on the Scan row and, if given, every check
+        result as its own "ScanResult" row.
+        """
+        if results is not None:
+            _replace_scan_results(self.conn, self.scan_id, results)
+        _update_scan_results(self.conn, self.scan_id, status, score, findings)
+
+
+# --- Scan job queue ---
+# Scans are queued on their own "Scan" row. Workers claim rows with
+# FOR UPDATE SKIP LOCKED, hold a lease while running and extend it with
+# heartbeats, so a crashed worker's scans are picked up again once the
+# lease expires. At most one scan per cloud account runs at a time: an
+# equivalent request for an account with a scan in flight is attached to
+# that scan ("coalescedInto") and gets its results, anything else waits.
+
+# Payload fields that must match for a scan to be attached to another
+COALESCE_KEYS = ("role_arn", "external_id", "force_refresh", "incremental", "organization", "member_role_name")
+
+def ensure_scan_queue_schema():
+    """
+    Adds the job queue columns to the "Scan" table if they are missing.
+    Safe to run on every start-up.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("""
+                ALTER TABLE "Scan"
+                ADD COLUMN IF NOT EXISTS "jobPayload" JSONB,
+                ADD COLUMN IF NOT EXISTS "queuedAt" TIMESTAMPTZ,
+                ADD COLUMN IF NOT EXISTS "leaseOwner" TEXT,
+                ADD COLUMN IF NOT EXISTS "leaseExpiresAt" TIMESTAMPTZ,
+                ADD COLUMN IF NOT EXISTS "attempts" INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS "parentScanId" TEXT,
+                ADD COLUMN IF NOT EXISTS "coalescedInto" TEXT
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "Scan_coalesced_idx"
+                ON "Scan" ("coalescedInto")
+                WHERE "coalescedInto" IS NOT NULL
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "Scan_queue_idx"
+                ON "Scan" ("queuedAt")
+                WHERE status IN ('QUEUED', 'RUNNING')
+            """))
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to prepare scan queue schema: {e}")
+
+
+def enqueue_scan(scan_id: str, payload: dict):
+    """
+    Marks an existing Scan row as QUEUED with everything a worker needs to run it.
+
+    If an equivalent scan (same cloud account and COALESCE_KEYS) is already
+    queued or running, the scan is attached to it instead of being run again.
+    A scan that is already queued or running is left as it is, so a repeated
+    request never resets a lease a worker holds.
+    Returns the id of the scan that will produce the results (scan_id itself,
+    or the scan it was attached to), or None if there is no Scan with that id.
+    """
+    cloud_account_id = payload.get("cloud_account_id")
+    try:
+        with engine.connect() as connection:
+            # Serializes enqueues per account across every API process
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                               {"key": f"scan:{cloud_account_id}"})
+
+            current = connection.execute(text("""
+                SELECT status, "coalescedInto" FROM "Scan" WHERE id = :scan_id FOR UPDATE
+            """), {"scan_id": scan_id}).fetchone()
+            if current is None:
+                connection.rollback()
+                return None
+            status, coalesced_into = current
+            if status in ('QUEUED', 'RUNNING'):
+                connection.rollback()
+                print(f"ℹ️ Scan {scan_id} is already {status.lower()}; not queueing it again.")
+                return coalesced_into or scan_id
+
+            # FOR SHARE: a leader finishing right now waits for us, then sees us as its follower
+            in_flight = connection.execute(text("""
+                SELECT id, "jobPayload" FROM "Scan"
+                WHERE "cloudAccountId" = :cloud_account_id AND id <> :scan_id
+                AND status IN ('QUEUED', 'RUNNING') AND "coalescedInto" IS NULL
+                ORDER BY "queuedAt"
+                FOR SHARE
+            """), {"cloud_account_id": cloud_account_id, "scan_id": scan_id}).fetchall()
+
+            leader_id = None
+            for candidate_id, candidate_payload in in_flight:
+                if isinstance(candidate_payload, str):
+                    candidate_payload = json.loads(candidate_payload)
+                if all((candidate_payload or {}).get(key) == payload.get(key) for key in COALESCE_KEYS):
+                    leader_id = candidate_id
+                    break
+
+            query = text("""
+                UPDATE "Scan"
+                SET status = 'QUEUED', "jobPayload" = :payload, "queuedAt" = now(),
+                    "leaseOwner" = NULL, "leaseExpiresAt" = NULL, attempts = 0,
+                    "cloudAccountId" = COALESCE("cloudAccountId", :cloud_account_id), "coalescedInto" = :leader_id
+                WHERE id = :scan_id
+            """)
+            result = connection.execute(query, {
+                "payload": json.dumps(payload),
+                "cloud_account_id": cloud_account_id,
+                "leader_id": leader_id,
+                "scan_id": scan_id
+            })
+            connection.commit()
+            if result.rowcount == 0:
+                return None
+            if leader_id:
+                print(f"🔗 Scan {scan_id} attached to in-flight scan {leader_id} for account {cloud_account_id}.")
+            return leader_id or scan_id
+
+    except Exception as e:
+        print(f"❌ Failed to queue scan {scan_id}: {e}")
+        raise e
+
+
+def claim_scan_jobs(worker_id: str, limit: int, lease_seconds: int, max_attempts: int):
+    """
+    Atomically leases up to `limit` queued scans (or running scans whose lease
+    expired) to worker_id, at most one per cloud account and none for an
+    account that already has a scan running. Attached scans are never
+    claimed. Returns a list of (scan_id, payload, attempts).
+    """
+    if limit <= 0:
+        return []
+    try:
+        with engine.connect() as connection:
+            query = text("""
+                WITH candidates AS (
+                    SELECT DISTINCT ON (COALESCE(s."cloudAccountId", s.id)) s.id
+                    FROM "Scan" s
+                    WHERE s.attempts < :max_attempts AND s."coalescedInto" IS NULL
+                    AND (s.status = 'QUEUED' OR (s.status = 'RUNNING' AND s."leaseExpiresAt" < now()))
+                    AND NOT EXISTS (
+                        SELECT 1 FROM "Scan" r
+                        WHERE r."cloudAccountId" = s."cloudAccountId" AND r.status = 'RUNNING'
+                        AND r."leaseExpiresAt" >= now()
+                    )
+                    ORDER BY COALESCE(s."cloudAccountId", s.id), s."queuedAt"
+                ),
+                next_jobs AS (
+                    SELECT id FROM "Scan"
+                    WHERE id IN (SELECT id FROM candidates)
+                    AND attempts < :max_attempts
+                    AND (status = 'QUEUED' OR (status = 'RUNNING' AND "leaseExpiresAt" < now()))
+                    ORDER BY "queuedAt"
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE "Scan" s
+                SET status = 'RUNNING', "leaseOwner" = :worker_id,
+                    "leaseExpiresAt" = now() + make_interval(secs => :lease_seconds),
+                    attempts = s.attempts + 1
+                FROM next_jobs
+                WHERE s.id = next_jobs.id
+                RETURNING s.id, s."jobPayload", s.attempts
+            """)
+            rows = connection.execute(query, {
+                "worker_id": worker_id,
+                "limit": limit,
+                "lease_seconds": lease_seconds,
+                "max_attempts": max_attempts
+            }).fetchall()
+            connection.commit()
+
+        jobs = []
+        for scan_id, payload, attempts in rows:
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            jobs.append((scan_id, payload, attempts))
+        return jobs
+
+    except Exception as e:
+        print(f"⚠️ Failed to claim scan jobs: {e}")
+        return []
+
+
+def heartbeat_scan_leases(worker_id: str, scan_ids: list, lease_seconds: int):
+    """
+    Extends the leases worker_id still holds on the given scans.
+    """
+    if not scan_ids:
+        return
+    try:
+        with engine.connect() as connection:
+            query = text("""
+                UPDATE "Scan"
+                SET "leaseExpiresAt" = now() + make_interval(secs => :lease_seconds)
+                WHERE id = ANY(:ids) AND "leaseOwner" = :worker_id AND status = 'RUNNING'
+            """)
+            connection.execute(query, {"ids": scan_ids, "worker_id": worker_id, "lease_seconds": lease_seconds})
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to heartbeat scan leases: {e}")
+
+
+def release_scan_leases(worker_id: str, scan_ids: list):
+    """
+    Puts scans this worker is abandoning (e.g. on shutdown) straight back on
+    the queue. A release is not a lost worker, so it gives back the attempt.
+    """
+    if not scan_ids:
+        return
+    try:
+        with engine.connect() as connection:
+            query = text("""
+                UPDATE "Scan"
+                SET status = 'QUEUED', "leaseOwner" = NULL, "leaseExpiresAt" = NULL,
+                    attempts = GREATEST(attempts - 1, 0)
+                WHERE id = ANY(:ids) AND "leaseOwner" = :worker_id AND status = 'RUNNING'
+            """)
+            connection.execute(query, {"ids": scan_ids, "worker_id": worker_id})
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to release scan leases: {e}")
+
+
+def fail_exhausted_scan_jobs(max_attempts: int):
+    """
+    Marks scans that keep losing their worker as FAILED instead of retrying
+    forever, including queued ones that can no longer be claimed.
+    """
+    try:
+        with engine.connect() as connection:
+            query = text("""
+                UPDATE "Scan"
+                SET status = 'FAILED', score = 0, findings = :findings, "leaseOwner" = NULL
+                WHERE attempts >= :max_attempts AND "coalescedInto" IS NULL
+                AND (status = 'QUEUED' OR (status = 'RUNNING' AND "leaseExpiresAt" < now()))
+                RETURNING id
+            """)
+            findings = json.dumps({"error": f"Scan abandoned after {max_attempts} attempts."})
+            failed = connection.execute(query, {"max_attempts": max_attempts, "findings": findings}).fetchall()
+            for (scan_id,) in failed:
+                _complete_followers(connection, scan_id)
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to expire abandoned scans: {e}")
+
+
+# --- Organization scans ---
+# An organization scan runs one member scan per account. Each member scan
+# gets its own "Scan" row (linked by "parentScanId") so its results are
+# stored and served like any other scan.
+
+def create_member_scans(parent_scan_id: str, member_scans: list):
+    """
+    Creates (or resets, when an organization scan is retried) a RUNNING
+    "Scan" row per (scan_id, cloud_account_id). Rows without a lease are
+    never claimed by workers.
+    """
+    if not member_scans:
+        return
+    try:
+        with engine.connect() as connection:
+            query = text("""
+                INSERT INTO "Scan" (id, status, "cloudAccountId", "parentScanId")
+                SELECT * FROM unnest(CAST(:ids AS text[]), CAST(:statuses AS text[]),
+                                     CAST(:accounts AS text[]), CAST(:parents AS text[]))
+                ON CONFLICT (id) DO UPDATE
+                SET status = 'RUNNING', findings = NULL, "parentScanId" = EXCLUDED."parentScanId"
+            """)
+            connection.execute(query, {
+                "ids": [scan_id for scan_id, _ in member_scans],
+                "statuses": ['RUNNING'] * len(member_scans),
+                "accounts": [cloud_account_id for _, cloud_account_id in member_scans],
+                "parents": [parent_scan_id] * len(member_scans)
+            })
+            connection.commit()
+
+    except Exception as e:
+        print(f"❌ Failed to create member scans for {parent_scan_id}: {e}")
+        raise e
+
+
+def get_scan_outcomes(scan_ids: list):
+    """
+    {scan_id: (status, score, findings)} for the given scans.
+    """
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text('SELECT id, status, score, findings FROM "Scan" WHERE id = ANY(:ids)'), {"ids": list(scan_ids)}
+            )
+            outcomes = {}
+            for scan_id, status, score, findings in rows:
+                if isinstance(findings, str):
+                    findings = json.loads(findings)
+                outcomes[scan_id] = (status, score, findings)
+            return outcomes
+
+    except Exception as e:
+        print(f"⚠️ Failed to read scan outcomes: {e}")
+        return {}
+
+
+# --- Worker metrics ---
+# Scans run in worker processes, but /metrics is served by the API. Each
+# worker publishes a snapshot of its core.metrics registry here and the API
+# renders the recent ones next to its own.
+
+# Snapshots not refreshed for this long belong to stopped workers
+WORKER_METRICS_MAX_AGE_SECONDS = int(os.getenv("LOXE_WORKER_METRICS_MAX_AGE_SECONDS", "300"))
+
+
+def ensure_worker_metrics_schema():
+    """
+    Creates the "WorkerMetrics" table if it is missing. Safe to run on every start-up.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS "WorkerMetrics" (
+                    "workerId" TEXT PRIMARY KEY,
+                    snapshot JSONB NOT NULL,
+                    "updatedAt" TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """))
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to prepare worker metrics schema: {e}")
+
+
+def publish_worker_metrics(worker_id: str, snapshot: list):
+    """
+    Stores worker_id's latest metrics snapshot and drops those of workers
+    that stopped publishing a day ago.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("""
+                INSERT INTO "WorkerMetrics" ("workerId", snapshot, "updatedAt")
+                VALUES (:worker_id, :snapshot, now())
+                ON CONFLICT ("workerId") DO UPDATE SET snapshot = EXCLUDED.snapshot, "updatedAt" = now()
+            """), {"worker_id": worker_id, "snapshot": json.dumps(snapshot)})
+            connection.execute(text("""
+                DELETE FROM "WorkerMetrics" WHERE "updatedAt" < now() - interval '1 day'
+            """))
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to publish worker metrics: {e}")
+
+
+def get_worker_metrics(max_age_seconds: int = WORKER_METRICS_MAX_AGE_SECONDS):
+    """
+    [(worker_id, snapshot)] for workers that published within max_age_seconds.
+    """
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(text("""
+                SELECT "workerId", snapshot FROM "WorkerMetrics"
+                WHERE "updatedAt" >= now() - make_interval(secs => :max_age)
+                ORDER BY "workerId"
+            """), {"max_age": max_age_seconds})
+            return [(worker_id, json.loads(snapshot) if isinstance(snapshot, str) else snapshot)
+                    for worker_id, snapshot in rows]
+
+    except Exception as e:
+        print(f"⚠️ Failed to read worker metrics: {e}")
+        return []
+
+
+# --- Evidence cache ---
+# AWS responses are cached per (cloud account, resource ARN, API call) so
+# repeat scans can skip unchanged configuration. A scan loads its account's
+# live entries once (core.evidence_cache.EvidenceCache) and writes new ones
+# back in one batch, then evicts its own expired entries and least recently
+# used ones beyond the per-account cap, so eviction never sorts the whole table.
+
+EVIDENCE_CACHE_MAX_ENTRIES_PER_ACCOUNT = int(os.getenv("LOXE_EVIDENCE_CACHE_MAX_ENTRIES_PER_ACCOUNT", "100000"))
+
+evidence_cache_table = Table('EvidenceCache', metadata_obj,
+                             Column('cloudAccountId', String, primary_key=True),
+                             Column('resourceArn', String, primary_key=True),
+                             Column('apiCall', String, primary_key=True),
+                             Column('response', JSONB),
+                             Column('errorCode', String),
+                             Column('error', String),
+                             Column('fetchedAt', DateTime(timezone=True)),
+                             Column('expiresAt', DateTime(timezone=True)),
+                             Column('lastUsedAt', DateTime(timezone=True))
+                             )
+
+EVIDENCE_CACHE_COLUMNS = [column.name for column in evidence_cache_table.columns]
+
+SELECT_EVIDENCE_CACHE = text("""
+    SELECT "resourceArn", "apiCall", response, "errorCode", error, "expiresAt"
+    FROM "EvidenceCache"
+    WHERE "cloudAccountId" = :cloud_account_id AND "expiresAt" > now()
+""")
+
+MERGE_EVIDENCE_CACHE = text(f"""
+    INSERT INTO "EvidenceCache" ({_quoted(EVIDENCE_CACHE_COLUMNS)})
+    SELECT DISTINCT ON ("cloudAccountId", "resourceArn", "apiCall") {_quoted(EVIDENCE_CACHE_COLUMNS)}
+    FROM evidence_cache_staging
+    ON CONFLICT ("cloudAccountId", "resourceArn", "apiCall") DO UPDATE SET
+    {", ".join(f'"{column}" = EXCLUDED."{column}"' for column in EVIDENCE_CACHE_COLUMNS
+               if column not in ['cloudAccountId', 'resourceArn', 'apiCall'])}
+""")
+
+TOUCH_EVIDENCE_CACHE = text("""
+    UPDATE "EvidenceCache" AS c
+    SET "lastUsedAt" = now()
+    FROM unnest(CAST(:arns AS TEXT[]), CAST(:calls AS TEXT[])) AS v(arn, call)
+    WHERE c."cloudAccountId" = :cloud_account_id AND c."resourceArn" = v.arn AND c."apiCall" = v.call
+""")
+
+EVICT_EVIDENCE_CACHE = text("""
+    DELETE FROM "EvidenceCache"
+    WHERE "cloudAccountId" = :cloud_account_id
+    AND ("expiresAt" <= now() OR ("resourceArn", "apiCall") IN (
+        SELECT "resourceArn", "apiCall"
+        FROM "EvidenceCache"
+        WHERE "cloudAccountId" = :cloud_account_id
+        ORDER BY "lastUsedAt" DESC
+        OFFSET :max_entries
+    ))
+""")
+
+
+def ensure_scan_state_schema():
+    """
+    Creates the "AccountScanState" table, which remembers each account's
+    last completed scan and CloudTrail watermark for incremental scans.
+    Safe to run on every start-up.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS "AccountScanState" (
+                    "cloudAccountId" TEXT PRIMARY KEY,
+                    "lastScanId" TEXT NOT NULL,
+                    watermark TIMESTAMPTZ NOT NULL
+                )
+            """))
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to prepare scan state schema: {e}")
+
+
+def ensure_evidence_cache_schema():
+    """
+    Creates the "EvidenceCache" table if it is missing. Safe to run on every start-up.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS "EvidenceCache" (
+                    "cloudAccountId" TEXT NOT NULL,
+                    "resourceArn" TEXT NOT NULL,
+                    "apiCall" TEXT NOT NULL,
+                    response JSONB,
+                    "errorCode" TEXT,
+                    error TEXT,
+                    "fetchedAt" TIMESTAMPTZ NOT NULL,
+                    "expiresAt" TIMESTAMPTZ NOT NULL,
+                    "lastUsedAt" TIMESTAMPTZ NOT NULL,
+                    PRIMARY KEY ("cloudAccountId", "resourceArn", "apiCall")
+                )
+            """))
+            # Eviction is per account (see EVICT_EVIDENCE_CACHE)
+            connection.execute(text('DROP INDEX IF EXISTS "EvidenceCache_lru_idx"'))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "EvidenceCache_account_lru_idx"
+                ON "EvidenceCache" ("cloudAccountId", "lastUsedAt")
+            """))
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to prepare evidence cache schema: {e}")
+
+
+def load_evidence_cache(cloud_account_id: str):
+    """
+    Returns the account's unexpired cache entries as dicts (empty on any error,
+    so a cache problem only costs API calls).
+    """
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(SELECT_EVIDENCE_CACHE, {"cloud_account_id": cloud_account_id}).mappings()
+            return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"⚠️ Failed to load evidence cache: {e}")
+        return []
+
+
+def save_evidence_cache(cloud_account_id: str, entries: list, used_keys: list):
+    """
+    Writes a scan's freshly fetched entries, bumps the LRU position of the
+    entries it reused and evicts the account's expired and least recently
+    used entries.
+    """
+    try:
+        with engine.connect() as connection:
+            if entries:
+                _copy_merge(connection, entries, 'EvidenceCache', 'evidence_cache_staging',
+                            EVIDENCE_CACHE_COLUMNS, MERGE_EVIDENCE_CACHE, COPY_CHUNK_SIZE)
+            if used_keys:
+                connection.execute(TOUCH_EVIDENCE_CACHE, {
+                    "cloud_account_id": cloud_account_id,
+                    "arns": [arn for arn, _ in used_keys],
+                    "calls": [call for _, call in used_keys]
+                })
+            evicted = connection.execute(EVICT_EVIDENCE_CACHE, {
+                "cloud_account_id": cloud_account_id,
+                "max_entries": EVIDENCE_CACHE_MAX_ENTRIES_PER_ACCOUNT
+            }).rowcount
+            connection.commit()
+            print(f"🗃️ Evidence cache: saved {len(entries)}, reused {len(used_keys)}, evicted {evicted}.")
+
+    except Exception as e:
+        print(f"⚠️ Failed to save evidence cache: {e}")
+
+
+# --- Scan results ---
+# Every check result is stored as a "ScanResult" row keyed by (scanId,
+# position), so reports can be filtered and paged with index scans instead
+# of decoding the whole Scan.findings blob. Pages are keyset-paginated on
+# position: pass the last position seen as `after`.
+
+REPORT_FETCH_SIZE = int(os.getenv("LOXE_REPORT_FETCH_SIZE", "1000"))
+
+SELECT_SCAN_HAS_FINDINGS = text('SELECT findings IS NOT NULL FROM "Scan" WHERE id = :id')
+
+# Every evidence key across the given scans with the JSON types seen for it
+# Objects nested deeper than this are exported as JSON text
+EVIDENCE_MAX_DEPTH = 3
+
+SELECT_EVIDENCE_KEY_TYPES = text("""
+    WITH RECURSIVE evidence (path, value) AS (
+        SELECT ARRAY[entry.key], entry.value
+        FROM "ScanResult" AS result
+        CROSS JOIN LATERAL jsonb_each(
+            CASE WHEN jsonb_typeof(result.evidence) = 'object' THEN result.evidence END
+        ) AS entry
+        WHERE result."scanId" = ANY(:ids)
+        UNION ALL
+        SELECT evidence.path || entry.key, entry.value
+        FROM evidence
+        CROSS JOIN LATERAL jsonb_each(
+            CASE WHEN jsonb_typeof(evidence.value) = 'object' THEN evidence.value END
+        ) AS entry
+        WHERE cardinality(evidence.path) < :max_depth
+    )
+    SELECT path, array_agg(DISTINCT jsonb_typeof(value)) AS types
+    FROM evidence
+    GROUP BY path
+    ORDER BY path
+""")
+
+
+def ensure_scan_results_schema():
+    """
+    Creates the "ScanResult" table and its indexes if they are missing.
+    When the table is new, results of earlier scans are copied out of their
+    Scan.findings blobs. Safe to run on every start-up.
+    """
+    try:
+        with engine.connect() as connection:
+            # Serialize concurrent start-ups so the backfill runs exactly once
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('loxe_scan_results_schema'))"))
+            is_new = connection.execute(text("""SELECT to_regclass('"ScanResult"') IS NULL""")).scalar()
+
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS "ScanResult" (
+                    "scanId" TEXT NOT NULL REFERENCES "Scan" (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    "controlId" TEXT,
+                    status TEXT,
+                    resource TEXT,
+                    description TEXT,
+                    evidence JSONB,
+                    PRIMARY KEY ("scanId", position)
+                )
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "ScanResult_status_idx" ON "ScanResult" ("scanId", status, position)
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "ScanResult_control_idx" ON "ScanResult" ("scanId", "controlId", position)
+            """))
+            # Serves prefix matches already in (resource, position) order; the
+            # "C" collation makes LIKE 'prefix%' a range scan like text_pattern_ops
+            connection.execute(text('DROP INDEX IF EXISTS "ScanResult_resource_idx"'))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS "ScanResult_resource_position_idx"
+                ON "ScanResult" ("scanId", resource COLLATE "C", position)
+            """))
+
+            if is_new:
+                backfilled = connection.execute(text("""
+                    INSERT INTO "ScanResult"
+                        ("scanId", position, "controlId", status, resource, description, evidence)
+                    SELECT s.id, r.ordinality - 1, r.value->>'control_id', r.value->>'status',
+                           r.value->>'resource', r.value->>'description', r.value->'evidence'
+                    FROM "Scan" AS s
+                    CROSS JOIN LATERAL jsonb_array_elements(
+                        CASE WHEN jsonb_typeof(CAST(s.findings AS JSONB) -> 'results') = 'array'
+                             THEN CAST(s.findings AS JSONB) -> 'results' END
+                    ) WITH ORDINALITY AS r
+                """)).rowcount
+                print(f"📦 Created ScanResult table; backfilled {backfilled} results from earlier scans.")
+            connection.commit()
+
+    except Exception as e:
+        print(f"⚠️ Failed to prepare scan results schema: {e}")
+
+
+def scan_has_findings(scan_id: str):
+    """
+    True if the scan exists and has stored findings (possibly an error blob).
+    """
+    with engine.connect() as connection:
+        return bool(connection.execute(SELECT_SCAN_HAS_FINDINGS, {"id": scan_id}).scalar())
+
+
+def _scan_results_query(scan_id, control_id=None, status=None, resource_prefix=None, after=None, limit=None,
+                        with_evidence=False):
+    """
+    Builds the keyset-paginated, filtered SELECT over "ScanResult".
+    Every filter combination is served by one of the table's indexes.
+    Rows come in report order, except with resource_prefix: those come in
+    resource name order, so a page never has to sort every match first.
+    `after` is the position of the last row of the previous page either way.
+    """
+    t = scan_result_table
+    columns = [
+        t.c.position,
+        t.c.controlId.label('control_id'),
+        t.c.status,
+        t.c.resource,
+        t.c.description
+    ]
+    if with_evidence:
+        columns.append(t.c.evidence)
+
+    query = select(*columns).where(t.c.scanId == scan_id)
+    if control_id:
+        query = query.where(t.c.controlId == control_id)
+    if status:
+        query = query.where(t.c.status == status)
+    if resource_prefix:
+        resource = t.c.resource.collate('C')
+        query = query.where(resource.startswith(resource_prefix, autoescape=True))
+        if after is not None:
+            after_resource = select(t.c.resource).where(t.c.scanId == scan_id, t.c.position == after)
+            query = query.where(tuple_(resource, t.c.position) > tuple_(after_resource.scalar_subquery(), after))
+        query = query.order_by(resource, t.c.position)
+    else:
+        if after is not None:
+            query = query.where(t.c.position > after)
+        query = query.order_by(t.c.position)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def iter_scan_results(scan_id: str, fetch_size: int = REPORT_FETCH_SIZE, with_evidence: bool = False, **filters):
+    """
+    Yields the scan's report rows in the order of _scan_results_query,
+    fetching fetch_size rows per round trip from a server-side cursor.
+    Accepts its filters (control_id, status, resource_prefix, after, limit).
+    The connection is held until the generator is exhausted or closed.
+    """
+    query = _scan_results_query(scan_id, with_evidence=with_evidence, **filters)
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=fetch_size).execute(query)
+        for row in result.mappings():
+            yield row
+
+
+def get_scan_results_page(scan_id: str, limit: int, with_evidence: bool = False, **filters):
+    """
+    Returns (rows, next_after) for one page; next_after is None on the last page.
+    """
+    with engine.connect() as connection:
+        query = _scan_results_query(scan_id, limit=limit + 1, with_evidence=with_evidence, **filters)
+        rows = list(connection.execute(query).mappings())
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]['position']
+    return rows, None
+
+
+SELECT_SCAN_SUMMARY = text('SELECT status, score, findings FROM "Scan" WHERE id = :id')
+
+SELECT_RESULT_COUNTS = text("""
+    SELECT "controlId", status, count(*)
+    FROM "ScanResult"
+    WHERE "scanId" = :id
+    GROUP BY "controlId", status
+""")
+
+
+def count_results(results):
+    """
+    Counts results by status and by control ({control: {status: n}}).
+    Works on report dicts and on "ScanResult" count rows alike.
+    """
+    by_status = {}
+    by_control = {}
+    for control_id, status, count in results:
+        by_status[status] = by_status.get(status, 0) + count
+        control = by_control.setdefault(control_id, {})
+        control[status] = control.get(status, 0) + count
+    return {"total": sum(by_status.values()), "by_status": by_status, "by_control": by_control}
+
+
+def get_scan_summary(scan_id: str):
+    """
+    Returns the scan's status, score and result counts, or None if there is no such scan.
+    Counts come from the summary stored with the scan; scans saved before
+    counts were stored fall back to one GROUP BY over "ScanResult".
+    """
+    with engine.connect() as connection:
+        row = connection.execute(SELECT_SCAN_SUMMARY, {"id": scan_id}).fetchone()
+        if row is None:
+            return None
+
+        status, score, findings = row
+        if isinstance(findings, str):
+            findings = json.loads(findings)
+        counts = (findings or {}).get("counts")
+        if counts is None:
+            counts = count_results(connection.execute(SELECT_RESULT_COUNTS, {"id": scan_id}))
+
+    return {"scan_id": scan_id, "status": status, "score": score, **counts}
+
+
+def _json_type(value):
+    if isinstance(value, dict):
+        return 'object'
+    if isinstance(value, (list, tuple)):
+        return 'array'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if value is None:
+        return 'null'
+    # Anything else is stored with json.dumps(default=str)
+    return 'string'
+
+
+def evidence_key_types(results, max_depth=EVIDENCE_MAX_DEPTH):
+    """
+    What get_evidence_key_types would find in these report dicts, as a
+    JSON-ready [[key path, sorted JSON types], ...] to store with the scan.
+    """
+    key_types = {}
+
+    def walk(evidence, path):
+        for key, value in evidence.items():
+            key_path = path + (str(key),)
+            key_types.setdefault(key_path, set()).add(_json_type(value))
+            if isinstance(value, dict) and len(key_path) < max_depth:
+                walk(value, key_path)
+
+    for result in results:
+        if isinstance(result.get("evidence"), dict):
+            walk(result["evidence"], ())
+    return [[list(path), sorted(types)] for path, types in sorted(key_types.items())]
+
+
+SELECT_STORED_EVIDENCE_KEY_TYPES = text("""
+    SELECT id, CAST(findings AS JSONB) -> 'evidence_key_types' FROM "Scan" WHERE id = ANY(:ids)
+""")
+
+
+def get_evidence_key_types(scan_ids: list):
+    """
+    Returns {evidence key path: set of JSON types} across the given scans,
+    keys of nested objects included, used to build a stable columnar schema
+    before any rows are streamed.
+    Example: {('account',): {'object'}, ('account', 'BlockPublicAcls'): {'boolean'}}
+    Comes from the key types stored with each scan; scans saved before they
+    were stored fall back to one recursive pass over their "ScanResult" rows.
+    """
+    key_types = {}
+    with engine.connect() as connection:
+        missing = []
+        for scan_id, stored in connection.execute(SELECT_STORED_EVIDENCE_KEY_TYPES, {"ids": list(scan_ids)}):
+            if isinstance(stored, str):
+                stored = json.loads(stored)
+            if stored is None:
+                missing.append(scan_id)
+                continue
+            for path, types in stored:
+                key_types.setdefault(tuple(path), set()).update(types)
+
+        if missing:
+            rows = connection.execute(SELECT_EVIDENCE_KEY_TYPES, {"ids": missing, "max_depth": EVIDENCE_MAX_DEPTH})
+            for path, types in rows:
+                key_types.setdefault(tuple(path), set()).update(types)
+    return key_types
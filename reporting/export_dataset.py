@@ -0,0 +1,33 @@
+"""
+Bulk export: writes the results of many scans into one Parquet dataset,
+hive-partitioned by scan_id, for loading into a warehouse.
+
+    python -m reporting.export_dataset --out ./loxe_reports scan_1 scan_2 ...
+"""
+import argparse
+
+from database import iter_scan_results, get_evidence_key_types
+from reporting.report_generator import write_partitioned_dataset
+
+
+def export_scans(scan_ids, base_dir):
+    """
+    Streams every scan's results into base_dir. All scans share one schema,
+    so the evidence struct has the union of their evidence keys.
+    """
+    evidence_key_types = get_evidence_key_types(scan_ids)
+    scans = ((scan_id, iter_scan_results(scan_id, with_evidence=True)) for scan_id in scan_ids)
+    write_partitioned_dataset(scans, evidence_key_types, base_dir)
+    print(f"✅ Exported {len(scan_ids)} scan(s) to {base_dir}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scan_ids", nargs="+")
+    parser.add_argument("--out", required=True, help="dataset directory")
+    args = parser.parse_args()
+    export_scans(args.scan_ids, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,41 @@
-import pandas as pd
+import csv
 import io
+import json
+
+# Columns (and their order) in every downloaded report
+REPORT_COLUMNS = ['control_id', 'status', 'resource', 'description']
+
+# Rows written per chunk handed to the response
+CSV_CHUNK_ROWS = 500
+
+
+def iter_csv_chunks(findings, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Takes an iterable of evidence findings (dicts or row mappings) and yields
+    the CSV report in chunks of chunk_rows rows, so the whole report never
+    sits in memory. Yields nothing when there are no findings.
+    """
+    buffer = io.StringIO()
+    # Same line endings the pandas-based export produced
+    writer = csv.writer(buffer, lineterminator='\n')
+    pending = 0
+    header_written = False
+
+    for finding in findings:
+        if not header_written:
+            writer.writerow(REPORT_COLUMNS)
+            header_written = True
+        writer.writerow([finding.get(col, 'N/A') for col in REPORT_COLUMNS])
+        pending += 1
+
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
 
 
 def generate_csv_string(findings_list):
@@ -7,25 +43,169 @@ def generate_csv_string(findings_list):
     Takes a list of evidence findings and returns a CSV string
     instead of saving to a file.
     """
-    if not findings_list:
-        return ""
+    return "".join(iter_csv_chunks(findings_list))
+
+
+# --- Columnar (Arrow / Parquet) export ---
+# pyarrow is imported lazily so CSV downloads don't pay for loading it.
+
+# Rows per record batch (and per Parquet row group)
+ARROW_BATCH_ROWS = 5000
+
+ARROW_MEDIA_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
 
-    # Create the DataFrame
-    df = pd.DataFrame(findings_list)
+# JSON types that map onto a native Arrow type; anything else is kept as JSON text
+_SCALAR_TYPES = {'boolean': 'bool_', 'number': 'float64', 'string': 'string'}
 
-    # Select and Reorder columns (Handle cases where columns might be missing)
-    report_columns = ['control_id', 'status', 'resource', 'description']
 
-    # Ensure all columns exist, fill with N/A if missing
-    for col in report_columns:
-        if col not in df.columns:
-            df[col] = 'N/A'
+def _json_text(value):
+    return None if value is None else json.dumps(value)
+
+
+def _struct_converter(fields):
+    """Builds one struct value (a dict of exactly `fields`) from an evidence object."""
+    def convert(value):
+        if not isinstance(value, dict):
+            return None
+        return {key: (to_arrow(value.get(key)) if to_arrow else value.get(key)) for key, _, to_arrow in fields}
+    return convert
+
+
+def _evidence_fields(evidence_key_types, prefix=()):
+    """
+    Turns {key path: set of JSON types} into [(key, arrow type, converter)]
+    for the keys directly under `prefix` (plain string keys are top-level
+    paths). Keys that always hold one scalar type keep it, keys that always
+    hold an object become a nested struct of their own keys; mixed or list
+    values are stored as JSON strings so nothing is lost.
+    """
+    import pyarrow as pa
+
+    children = {}
+    for path, types in evidence_key_types.items():
+        path = path if isinstance(path, tuple) else (path,)
+        if len(path) == len(prefix) + 1 and path[:len(prefix)] == prefix:
+            children[path[-1]] = set(types) - {'null'}
+
+    fields = []
+    for key in sorted(children):
+        types = children[key]
+        nested = _evidence_fields(evidence_key_types, prefix + (key,)) if types == {'object'} else []
+        if nested:
+            struct = pa.struct([pa.field(name, arrow_type) for name, arrow_type, _ in nested])
+            fields.append((key, struct, _struct_converter(nested)))
+        elif len(types) == 1 and next(iter(types)) in _SCALAR_TYPES:
+            arrow_type = getattr(pa, _SCALAR_TYPES[types.pop()])()
+            fields.append((key, arrow_type, None))
+        else:
+            fields.append((key, pa.string(), _json_text))
+    return fields
+
+
+def arrow_schema(evidence_key_types, partition_column=None):
+    """
+    Schema for a columnar report: the CSV columns plus `evidence` as a struct.
+    """
+    import pyarrow as pa
+
+    fields = _evidence_fields(evidence_key_types)
+    # Parquet cannot store a struct without children; fall back to JSON text
+    evidence = pa.struct([pa.field(key, arrow_type) for key, arrow_type, _ in fields]) if fields else pa.string()
+    columns = [pa.field(col, pa.string()) for col in REPORT_COLUMNS] + [pa.field('evidence', evidence)]
+    if partition_column:
+        columns.append(pa.field(partition_column, pa.string()))
+    return pa.schema(columns)
+
+
+def iter_record_batches(findings, evidence_key_types, batch_rows=ARROW_BATCH_ROWS, partition=None):
+    """
+    Yields pyarrow RecordBatches of at most batch_rows findings.
+    `partition` is an optional (column, value) pair stamped on every row.
+    """
+    import pyarrow as pa
+
+    schema = arrow_schema(evidence_key_types, partition and partition[0])
+    fields = _evidence_fields(evidence_key_types)
+    to_struct = _struct_converter(fields)
+    columns = {name: [] for name in schema.names}
+
+    def flush():
+        batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+        for values in columns.values():
+            values.clear()
+        return batch
+
+    for finding in findings:
+        for col in REPORT_COLUMNS:
+            columns[col].append(finding.get(col, 'N/A'))
+
+        evidence = finding.get('evidence')
+        columns['evidence'].append(to_struct(evidence) if fields else _json_text(evidence))
+
+        if partition:
+            columns[partition[0]].append(partition[1])
+
+        if len(columns['evidence']) >= batch_rows:
+            yield flush()
+
+    if columns['evidence']:
+        yield flush()
+
+
+def iter_arrow_chunks(findings, evidence_key_types, file_format='arrow', batch_rows=ARROW_BATCH_ROWS):
+    """
+    Yields an Arrow IPC stream or a Parquet file as bytes, one record batch
+    (row group) at a time, so the report is never built whole in memory.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(evidence_key_types)
+    sink = io.BytesIO()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    for batch in iter_record_batches(findings, evidence_key_types, batch_rows):
+        write(batch)
+        if sink.tell():
+            yield drain()
+
+    writer.close()
+    yield drain()
+
+
+def write_partitioned_dataset(scans, evidence_key_types, base_dir, batch_rows=ARROW_BATCH_ROWS):
+    """
+    Writes many scans into one Parquet dataset under base_dir, hive-partitioned
+    by scan_id (base_dir/scan_id=<id>/...). `scans` is an iterable of
+    (scan_id, findings) pairs; batches are written as they are produced.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
 
-    df = df.reindex(columns=report_columns)
+    schema = arrow_schema(evidence_key_types, partition_column='scan_id')
 
-    # Write to a memory buffer instead of a hard drive file
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
+    def batches():
+        for scan_id, findings in scans:
+            yield from iter_record_batches(findings, evidence_key_types, batch_rows, partition=('scan_id', scan_id))
 
-    # Return the text content of the CSV
-    return csv_buffer.getvalue()
\ No newline at end of file
+    ds.write_dataset(
+        pa.RecordBatchReader.from_batches(schema, batches()),
+        base_dir,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([('scan_id', pa.string())]), flavor='hive'),
+        existing_data_behavior='delete_matching'
+    )
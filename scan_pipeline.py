@@ -0,0 +1,510 @@
+import asyncio
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import partial
+
+from connectors.aws_connector import AWSConnector, GOVERNOR
+from connectors.rate_governor import metrics_delta
+from core.evidence_cache import EvidenceCache
+from core.evidence_processor import EvidenceProcessor, ASSET_BATCH_SIZE
+from core.incremental import find_bucket_changes, merge_results
+from core.metrics import PhaseTimer, SCAN_SECONDS
+from core.organization import list_member_accounts, member_role_arn, member_scan_id, member_cloud_account_id, rollup
+from database import update_scan_results, count_results, evidence_key_types, load_evidence_cache, \
+    save_evidence_cache, ScanUnitOfWork, create_member_scans, get_scan_outcomes
+
+# boto3 and SQLAlchemy calls block, so every scan sends them to this pool.
+# It is separate from Starlette's request threadpool, which keeps the API
+# responsive no matter how many scans are running. botocore spends ~1.5ms of
+# CPU per call, so more threads mostly add GIL contention with the event loop.
+SCAN_IO_THREADS = int(os.getenv("LOXE_SCAN_IO_THREADS", "16"))
+
+# Outstanding AWS calls allowed per scan, so one huge account cannot take every IO thread
+SCAN_CONCURRENCY = int(os.getenv("LOXE_SCAN_CONCURRENCY", "16"))
+
+# Scans beyond this wait for a slot instead of piling onto the IO pool
+MAX_ACTIVE_SCANS = int(os.getenv("LOXE_MAX_ACTIVE_SCANS", "50"))
+
+# Set to 0 to make every scan call AWS for everything
+EVIDENCE_CACHE_ENABLED = os.getenv("LOXE_EVIDENCE_CACHE", "1") != "0"
+
+# Member accounts of an organization scan run in this many processes at once.
+# Each process runs one account scan at a time with its own IO pool, so
+# wall-clock time scales with processes (and worker machines), not accounts.
+ORG_SCAN_PROCESSES = int(os.getenv("LOXE_ORG_SCAN_PROCESSES", str(os.cpu_count() or 4)))
+
+# When several rules check one asset, the asset takes the highest-ranked status
+STATUS_RANK = {"PASS": 0, "ERROR": 1, "FAIL": 2}
+
+_io_executor = ThreadPoolExecutor(max_workers=SCAN_IO_THREADS, thread_name_prefix="scan-io")
+_scan_slots = asyncio.Semaphore(MAX_ACTIVE_SCANS)
+
+
+async def _blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, partial(fn, *args, **kwargs))
+
+
+async def run_scan(role_arn: str, scan_id: str, cloud_account_id: str, external_id: str,
+                   force_refresh: bool = False, incremental: bool = False):
+    """
+    Runs one full scan (inventory, checks, persistence) on the event loop.
+    Waits for a free slot when MAX_ACTIVE_SCANS scans are already running.
+    force_refresh ignores cached evidence and calls AWS for everything.
+    incremental only re-checks buckets that are new or that CloudTrail reports
+    as changed since the account's last completed scan, and reuses the
+    previous results for the rest (falling back to a full scan if it can't).
+    """
+    async with _scan_slots:
+        await _run_scan(role_arn, scan_id, cloud_account_id, external_id, force_refresh, incremental)
+
+
+async def _run_scan(role_arn, scan_id, cloud_account_id, external_id, force_refresh=False, incremental=False):
+    print(f"🚀 Starting scan for {scan_id}...")
+    role_arn = role_arn.strip()
+    external_id = external_id.strip()
+    # Events after this are picked up by the next incremental scan
+    scan_started = datetime.now(timezone.utc)
+    timer = PhaseTimer()
+    processor = None
+
+    evidence_cache = None
+    if EVIDENCE_CACHE_ENABLED:
+        with timer.phase("evidence_cache_load"):
+            entries = [] if force_refresh else await _blocking(load_evidence_cache, cloud_account_id)
+        evidence_cache = EvidenceCache(cloud_account_id, entries, force_refresh=force_refresh)
+
+    try:
+        # A. Initialize (AssumeRole)
+        with timer.phase("connect"):
+            processor = await _blocking(EvidenceProcessor, role_arn=role_arn, external_id=external_id,
+                                        region='us-east-1', evidence_cache=evidence_cache)
+        account_id = processor.connector.account_id
+        governor_before = GOVERNOR.metrics(account_id)
+        limit = asyncio.Semaphore(SCAN_CONCURRENCY)
+
+        async def bounded(fn, *args):
+            async with limit:
+                return await _blocking(fn, *args)
+
+        # Every DB write below shares one connection and commits once at the end
+        async with _scan_transaction(scan_id, cloud_account_id) as uow:
+            plan = None
+            if incremental and not force_refresh:
+                with timer.phase("plan"):
+                    plan = await _blocking(_plan_incremental, processor, uow)
+
+            # B. INVENTORY
+            print("🔍 Collecting Inventory...")
+            with timer.phase("inventory"):
+                if plan is None:
+                    await _collect_inventory(processor, uow, bounded)
+                else:
+                    for arn in plan.pop("invalidate"):
+                        if evidence_cache:
+                            evidence_cache.invalidate(arn)
+                    await _collect_inventory(processor, uow, bounded, buckets=plan.pop("new_buckets"))
+
+                # Get the Map (ARN -> DB_ID)
+                asset_map = await _blocking(uow.get_asset_map)
+
+            # C. RUN CHECKS
+            with timer.phase("checks"):
+                if plan is None:
+                    raw_findings_objects, region_timings = await _run_checks(processor, bounded)
+                else:
+                    bucket_names = plan.pop("bucket_names")
+                    rechecked = plan.pop("recheck")
+                    fresh_findings, region_timings = await _run_checks(
+                        processor, bounded, [bucket for bucket in bucket_names if bucket in rechecked]
+                    )
+                    raw_findings_objects = merge_results(bucket_names, plan.pop("previous_results"),
+                                                         fresh_findings, rechecked)
+
+            # D + E. PROCESS AND SAVE FINDINGS
+            with timer.phase("persist"):
+                findings_json, failure_count, finding_changes = await _blocking(
+                    _persist_findings, uow, raw_findings_objects, asset_map, scan_id
+                )
+
+            # ... (Calculate Score and Save Results logic stays same) ...
+            total_items = len(findings_json)
+            if total_items == 0:
+                score = 100
+            else:
+                score = int(((total_items - failure_count) / total_items) * 100)
+
+            await _blocking(uow.save_scan_state, scan_started)
+            # Everything up to here; the save and commit themselves show up in /metrics
+            timings = _scan_timings(timer, processor, uow)
+            with timer.phase("save"):
+                await _blocking(
+                    uow.save_results,
+                    status="COMPLETED",
+                    score=score,
+                    findings={
+                        "result_count": total_items,
+                        # Served as-is by the summary endpoint, so it never scans the rows
+                        "counts": count_results(
+                            (row["control_id"], row["status"], 1) for row in findings_json
+                        ),
+                        # Read by every columnar download, so it never walks the evidence
+                        "evidence_key_types": evidence_key_types(findings_json),
+                        "region_timings": region_timings,
+                        "finding_changes": finding_changes,
+                        # Per-bucket API calls made unnecessary by account-level settings
+                        "skipped_api_calls": processor.rules_engine.skipped_calls,
+                        "evidence_cache": evidence_cache.stats() if evidence_cache else None,
+                        # None for a full scan
+                        "incremental": plan,
+                        # Requests paced or throttled during this scan, per service and region
+                        "rate_governor": metrics_delta(governor_before, GOVERNOR.metrics(account_id)),
+                        # Seconds per phase, AWS calls and DB statements of this scan
+                        "timings": timings
+                    },
+                    # Each result becomes a "ScanResult" row instead of part of the blob
+                    results=findings_json
+                )
+
+        SCAN_SECONDS.observe(timer.elapsed(), "account", "COMPLETED")
+        print(f"✅ Scan {scan_id} finished. Score: {score}")
+
+    except Exception as e:
+        print(f"💥 Scan failed: {e}")
+        SCAN_SECONDS.observe(timer.elapsed(), "account", "FAILED")
+        # The phases that did finish show where the scan got stuck
+        await _blocking(update_scan_results, scan_id, "FAILED", 0,
+                        {"error": str(e), "timings": _scan_timings(timer, processor)})
+
+    # Evidence fetched before a failure is still valid, so it is kept either way
+    if evidence_cache and (evidence_cache.pending() or evidence_cache.used_keys()):
+        await _blocking(save_evidence_cache, cloud_account_id, evidence_cache.pending(), evidence_cache.used_keys())
+
+
+async def run_org_scan(role_arn: str, scan_id: str, cloud_account_id: str, external_id: str,
+                       member_role_name: str = None, processes: int = None,
+                       force_refresh: bool = False, incremental: bool = False):
+    """
+    Scans every active account of an AWS Organization. role_arn is the
+    management account's role, used to list the member accounts. Each
+    member is scanned as its own child scan (its own Scan row, Assets and
+    Findings) by assuming member_role_name in it (the management role's
+    name by default). Member scans are spread across `processes` worker
+    processes, at most ORG_SCAN_PROCESSES. The organization scan row gets
+    the rollup.
+    """
+    print(f"🏢 Starting organization scan {scan_id}...")
+    role_arn = role_arn.strip()
+    external_id = external_id.strip()
+    timer = PhaseTimer()
+
+    try:
+        with timer.phase("connect"):
+            connector = await _blocking(AWSConnector, role_arn=role_arn, external_id=external_id,
+                                        region='us-east-1')
+        with timer.phase("list_accounts"):
+            accounts = await _blocking(list_member_accounts, connector)
+        # account id -> (member scan id, member cloud account id)
+        members = {
+            account['id']: (member_scan_id(scan_id, account['id']),
+                            member_cloud_account_id(cloud_account_id, account['id']))
+            for account in accounts
+        }
+        await _blocking(create_member_scans, scan_id, list(members.values()))
+
+        # Callers may ask for fewer processes than this worker allows, never more
+        processes = max(1, min(processes or ORG_SCAN_PROCESSES, ORG_SCAN_PROCESSES, len(accounts) or 1))
+        print(f"🏢 Scanning {len(accounts)} member account(s) in {processes} process(es)...")
+
+        # spawn, not fork: the parent has live threads and pooled DB connections
+        pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        try:
+            with timer.phase("member_scans"):
+                outcomes = await asyncio.gather(*(
+                    loop.run_in_executor(
+                        pool, _scan_member_account,
+                        member_role_arn(role_arn, account['id'], member_role_name), *members[account['id']],
+                        external_id, force_refresh, incremental
+                    )
+                    for account in accounts
+                ), return_exceptions=True)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        # A member whose process died never recorded its own failure
+        for account, outcome in zip(accounts, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"⚠️ Member scan for account {account['id']} crashed: {outcome}")
+                await _blocking(update_scan_results, members[account['id']][0], "FAILED", 0, {"error": str(outcome)})
+
+        scans = await _blocking(get_scan_outcomes, [child_scan_id for child_scan_id, _ in members.values()])
+        summary = rollup(accounts, {
+            account_id: scans[child_scan_id]
+            for account_id, (child_scan_id, _) in members.items() if child_scan_id in scans
+        })
+        await _blocking(update_scan_results, scan_id, "COMPLETED", summary["score"], {
+            "result_count": summary["counts"]["total"],
+            "counts": summary["counts"],
+            "organization": {key: value for key, value in summary.items() if key != "counts"},
+            # Each member scan stores its own breakdown
+            "timings": _scan_timings(timer, connector=connector)
+        })
+        SCAN_SECONDS.observe(timer.elapsed(), "organization", "COMPLETED")
+        print(f"✅ Organization scan {scan_id} finished: {summary['completed']}/{summary['accounts']} account(s), "
+              f"score {summary['score']}.")
+
+    except Exception as e:
+        print(f"💥 Organization scan failed: {e}")
+        SCAN_SECONDS.observe(timer.elapsed(), "organization", "FAILED")
+        await _blocking(update_scan_results, scan_id, "FAILED", 0, {"error": str(e), "timings": timer.summary()})
+
+
+def _scan_member_account(role_arn, scan_id, cloud_account_id, external_id, force_refresh, incremental):
+    """
+    Runs in an organization scan's worker process: one member account's full scan.
+    """
+    asyncio.run(run_scan(role_arn, scan_id, cloud_account_id, external_id, force_refresh, incremental))
+    return scan_id
+
+
+def _scan_timings(timer, processor=None, uow=None, connector=None):
+    """
+    The timing breakdown stored with a scan: seconds per phase, plus the
+    AWS calls made through the scan's connector and the statements run in
+    its unit of work, when there are any yet.
+    """
+    timings = timer.summary()
+    connector = connector or (processor.connector if processor is not None else None)
+    if getattr(connector, "call_stats", None) is not None:
+        timings["aws"] = connector.call_stats.summary()
+    if uow is not None:
+        timings["db"] = dict(uow.db_stats, seconds=round(uow.db_stats["seconds"], 3))
+    return timings
+
+
+@asynccontextmanager
+async def _scan_transaction(scan_id, cloud_account_id):
+    """
+    Opens a ScanUnitOfWork on the IO pool; commits on success, rolls back on any error.
+    """
+    uow = ScanUnitOfWork(scan_id, cloud_account_id)
+    await _blocking(uow.__enter__)
+    try:
+        yield uow
+    except BaseException as e:
+        await _blocking(uow.__exit__, type(e), e, e.__traceback__)
+        raise
+    await _blocking(uow.__exit__, None, None, None)
+
+
+def _plan_incremental(processor, uow):
+    """
+    Works out what an incremental scan has to re-check: buckets new since
+    the last completed scan, buckets CloudTrail reports as changed since its
+    watermark, and buckets without previous results (every bucket if the
+    account-level settings changed). Existing buckets get their stored
+    region so they are not looked up again.
+    Returns the plan as a dict, or None when a full scan is needed instead.
+    """
+    state = uow.get_scan_state()
+    if state is None:
+        print("ℹ️ No completed scan to build on; running a full scan.")
+        return None
+    last_scan_id, watermark = state
+
+    if not processor.connector.session:
+        return None
+    try:
+        buckets = processor.snapshot.buckets()
+    except ConnectionError as e:
+        print(f"⚠️ Error listing S3 buckets: {e}")
+        return None
+
+    known_regions = uow.get_asset_regions()
+    new_buckets = []
+    for bucket in buckets:
+        region = known_regions.get(f"arn:aws:s3:::{bucket['Name']}")
+        if region is None:
+            new_buckets.append(bucket)
+        else:
+            processor.snapshot.set_location(bucket['Name'], region)
+
+    # Bucket management events are logged in the bucket's own region
+    bucket_names = [bucket['Name'] for bucket in buckets]
+    regions = {processor.bucket_region(name) for name in bucket_names} | {processor.connector.region_name}
+    changes = find_bucket_changes(processor.connector, watermark, regions)
+    if changes is None:
+        print("ℹ️ CloudTrail unavailable; running a full scan.")
+        return None
+
+    previous_results = uow.get_scan_results(last_scan_id)
+    previously_checked = {row["resource"] for row in previous_results}
+
+    if changes.account_changed:
+        recheck = set(bucket_names)
+    else:
+        recheck = {name for name in bucket_names
+                   if name in changes.buckets or name not in previously_checked}
+    recheck.update(bucket['Name'] for bucket in new_buckets)
+
+    invalidate = [f"arn:aws:s3:::{name}" for name in recheck]
+    if changes.account_changed:
+        invalidate.append('account')
+
+    print(f"♻️ Incremental scan since {watermark.isoformat()}: re-checking {len(recheck)} of "
+          f"{len(bucket_names)} bucket(s).")
+    return {
+        "since": watermark.isoformat(),
+        "base_scan_id": last_scan_id,
+        "events": changes.events,
+        "account_changed": changes.account_changed,
+        "rechecked": len(recheck),
+        "new": len(new_buckets),
+        "deleted": len(previously_checked - set(bucket_names)),
+        "reused": len(bucket_names) - len(recheck),
+        # Used by the scan and popped before the plan goes into the summary
+        "bucket_names": bucket_names,
+        "new_buckets": new_buckets,
+        "recheck": recheck,
+        "previous_results": previous_results,
+        "invalidate": invalidate
+    }
+
+
+async def _collect_inventory(processor, uow, bounded, buckets=None):
+    """
+    Resolves bucket regions as concurrent tasks while a writer task upserts
+    each finished batch, so DB writes overlap with enumeration. Lookups for
+    a listing page start as soon as it arrives, while the next page loads.
+    Pass `buckets` to inventory only those listing entries.
+    """
+    if not processor.connector.session:
+        return
+
+    pages = iter([buckets]) if buckets is not None else processor.snapshot.iter_bucket_pages()
+    batches = asyncio.Queue(maxsize=4)
+    count = 0
+
+    async def write_batches():
+        while (batch := await batches.get()) is not None:
+            await _blocking(uow.upsert_assets, batch)
+
+    async def resolve_assets():
+        nonlocal count
+        batch = []
+        lookups = []
+        next_page = asyncio.ensure_future(_blocking(next, pages, None))
+        try:
+            while (page := await next_page) is not None:
+                next_page = asyncio.ensure_future(_blocking(next, pages, None))
+                lookups = [asyncio.ensure_future(bounded(processor.build_asset, bucket)) for bucket in page]
+                for lookup in asyncio.as_completed(lookups):
+                    batch.append(await lookup)
+                    count += 1
+                    if len(batch) >= ASSET_BATCH_SIZE:
+                        await batches.put(batch)
+                        batch = []
+        except ConnectionError as e:
+            # Whatever was listed before the failure is still inventoried
+            print(f"⚠️ Error collecting assets: {e}")
+        finally:
+            # If the writer failed we are cancelled; don't leave lookups running
+            next_page.cancel()
+            for lookup in lookups:
+                lookup.cancel()
+        if batch:
+            await batches.put(batch)
+        await batches.put(None)
+
+    async with asyncio.TaskGroup() as phase:
+        phase.create_task(write_batches())
+        phase.create_task(resolve_assets())
+
+    print(f"✅ Collected {count} assets for inventory.")
+
+
+async def _run_checks(processor, bounded, bucket_names=None):
+    """
+    Checks every bucket (or just `bucket_names`) as its own task against its
+    region's client, under the scan's shared concurrency limit.
+    Returns (findings in listing order, per-region timings).
+    """
+    if not processor.connector.session:
+        return [], {}
+
+    if bucket_names is None:
+        try:
+            bucket_names = await _blocking(processor.snapshot.bucket_names)
+        except ConnectionError as e:
+            print(f"⚠️ Error listing S3 buckets: {e}")
+            return [], {}
+
+    findings = await processor.check_buckets(bucket_names, bounded)
+    return findings, processor.region_timings
+
+
+def _persist_findings(uow, raw_findings_objects, asset_map, scan_id):
+    """
+    Turns findings into report rows, updates asset statuses and syncs the
+    stored FAIL findings against the previous scan's.
+    Returns (findings_json, failure_count, finding_changes).
+    """
+    findings_json = []
+    finding_records = []
+    asset_statuses = {}
+    failure_count = 0
+
+    for finding in raw_findings_objects:
+        f_control = getattr(finding, "control_id", "N/A")
+        f_resource_name = getattr(finding, "resource", "Unknown")
+        f_status = getattr(finding, "status", "UNKNOWN")
+        f_desc = getattr(finding, "description", "")
+        f_evidence = getattr(finding, "evidence", {})
+
+        finding_dict = {
+            "control_id": f_control,
+            "resource": f_resource_name,
+            "status": f_status,
+            "description": f_desc,
+            "evidence": f_evidence
+        }
+        findings_json.append(finding_dict)
+
+        if f_status in ["FAIL", "ERROR"]:
+            failure_count += 1
+
+        if f_resource_name:
+            arn = f"arn:aws:s3:::{f_resource_name}"
+            # An asset gets the worst status of all its rules
+            previous = asset_statuses.get(arn)
+            if previous is None or STATUS_RANK.get(f_status, 0) > STATUS_RANK.get(previous, 0):
+                asset_statuses[arn] = f_status
+
+            db_asset_id = asset_map.get(arn)
+
+            if db_asset_id and f_status == "FAIL":
+                finding_records.append({
+                    "id": f"find_{uuid.uuid4().hex}",
+                    "controlId": f_control,
+                    "status": f_status,
+                    "description": f_desc,
+                    "severity": "HIGH",
+                    "assetId": db_asset_id,
+                    "scanId": scan_id,
+                    "updatedAt": datetime.now()
+                })
+
+    # One statement for every asset status instead of one round trip per finding
+    uow.update_asset_statuses(asset_statuses)
+
+    # E. Save Finding Records
+    # Diffed per (assetId, controlId) against what is stored for every asset in
+    # the account: only new, changed and vanished findings are written.
+    finding_changes = uow.sync_findings(list(asset_map.values()), finding_records)
+
+    return findings_json, failure_count, finding_changes
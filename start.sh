@@ -1 +1,2 @@
-uvicorn api:app --host 0.0.0.0 --port $PORT
\ No newline at end of file
+python worker.py &
+exec uvicorn api:app --host 0.0.0.0 --port $PORT
\ No newline at end of file
@@ -0,0 +1,284 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from connectors import aws_connector
+from connectors.aws_connector import AWSConnector, BucketListingError, CallStats, instrument_client
+from connectors.credential_cache import CredentialCache
+from connectors.rate_governor import RateGovernor, TokenBucket
+from core import resource_snapshot
+from core.resource_snapshot import ResourceSnapshot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+class FakeSTSClient:
+    """Counts AssumeRole calls and hands out credentials valid for `lifetime`."""
+
+    def __init__(self, clock, lifetime=timedelta(hours=1)):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls = []
+
+    def assume_role(self, RoleArn, RoleSessionName, ExternalId):
+        self.calls.append(RoleArn)
+        return {"Credentials": {
+            "AccessKeyId": f"AKIA{len(self.calls)}",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": self.clock() + self.lifetime,
+        }}
+
+
+def fetcher(sts, role_arn):
+    return lambda: sts.assume_role(RoleArn=role_arn, RoleSessionName="test", ExternalId="ext")["Credentials"]
+
+
+class CredentialCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sts = FakeSTSClient(self.clock)
+        # Run background refreshes inline so the tests are deterministic
+        self.cache = CredentialCache(max_entries=2, clock=self.clock, spawn=lambda target: target())
+
+    def test_hit_reuses_credentials(self):
+        first = self.cache.get(("role-a", "ext", "us-east-1"), fetcher(self.sts, "role-a"))
+        second = self.cache.get(("role-a", "ext", "us-east-1"), fetcher(self.sts, "role-a"))
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.sts.calls), 1)
+
+    def test_refresh_ahead_serves_current_and_replaces_in_background(self):
+        key = ("role-a", "ext", "us-east-1")
+        first = self.cache.get(key, fetcher(self.sts, "role-a"))
+
+        self.clock.advance(minutes=55)  # inside the 10 minute refresh window
+        served = self.cache.get(key, fetcher(self.sts, "role-a"))
+        self.assertIs(served, first)
+        self.assertEqual(len(self.sts.calls), 2)
+
+        refreshed = self.cache.get(key, fetcher(self.sts, "role-a"))
+        self.assertEqual(refreshed["AccessKeyId"], "AKIA2")
+
+    def test_expired_credentials_are_fetched_in_foreground(self):
+        key = ("role-a", "ext", "us-east-1")
+        self.cache.get(key, fetcher(self.sts, "role-a"))
+
+        self.clock.advance(minutes=59)
+        credentials = self.cache.get(key, fetcher(self.sts, "role-a"))
+
+        self.assertEqual(credentials["AccessKeyId"], "AKIA2")
+        self.assertGreater(credentials["Expiration"], self.clock())
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.get(("role-a", "ext", "us-east-1"), fetcher(self.sts, "role-a"))
+        self.cache.get(("role-b", "ext", "us-east-1"), fetcher(self.sts, "role-b"))
+        self.cache.get(("role-a", "ext", "us-east-1"), fetcher(self.sts, "role-a"))
+        self.cache.get(("role-c", "ext", "us-east-1"), fetcher(self.sts, "role-c"))
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIn(("role-a", "ext", "us-east-1"), self.cache)
+        self.assertNotIn(("role-b", "ext", "us-east-1"), self.cache)
+
+    def test_key_includes_external_id_and_region(self):
+        self.cache.get(("role-a", "ext", "us-east-1"), fetcher(self.sts, "role-a"))
+        self.cache.get(("role-a", "other", "us-east-1"), fetcher(self.sts, "role-a"))
+
+        self.assertEqual(len(self.sts.calls), 2)
+
+
+class AWSConnectorCredentialTests(unittest.TestCase):
+    def test_repeat_connectors_share_one_assume_role(self):
+        clock = FakeClock()
+        sts = FakeSTSClient(clock)
+        cache = CredentialCache(clock=clock)
+
+        with mock.patch.object(aws_connector, "CREDENTIAL_CACHE", cache), \
+                mock.patch.object(aws_connector, "get_sts_client", return_value=sts):
+            AWSConnector("arn:aws:iam::123456789012:role/loxe", "ext")
+            AWSConnector("arn:aws:iam::123456789012:role/loxe", "ext")
+
+        self.assertEqual(len(sts.calls), 1)
+
+
+class FlakyListingClient:
+    """Serves `count` buckets a page at a time; the pages in `fail_tokens` fail once each."""
+
+    def __init__(self, count, fail_tokens=()):
+        self.count = count
+        self.fail_tokens = set(fail_tokens)
+        self.requests = []
+
+    def list_buckets(self, MaxBuckets, ContinuationToken=None):
+        self.requests.append(ContinuationToken)
+        if ContinuationToken in self.fail_tokens:
+            self.fail_tokens.discard(ContinuationToken)
+            raise ClientError({"Error": {"Code": "InternalError", "Message": "try again"}}, "ListBuckets")
+        start = int(ContinuationToken or 0)
+        end = min(start + MaxBuckets, self.count)
+        response = {"Buckets": [{"Name": f"bucket-{i}"} for i in range(start, end)], "Owner": {"ID": "owner"}}
+        if end < self.count:
+            response["ContinuationToken"] = str(end)
+        return response
+
+
+class BucketListingTests(unittest.TestCase):
+    def setUp(self):
+        sts = FakeSTSClient(FakeClock())
+        with mock.patch.object(aws_connector, "CREDENTIAL_CACHE", CredentialCache()), \
+                mock.patch.object(aws_connector, "get_sts_client", return_value=sts):
+            self.connector = AWSConnector("arn:aws:iam::123456789012:role/loxe", "ext")
+
+    def test_failed_page_reports_its_continuation_token(self):
+        client = FlakyListingClient(5, fail_tokens={"4"})
+        pages = self.connector.iter_s3_bucket_pages(page_size=2, s3_client=client)
+
+        self.assertEqual(len(next(pages)["Buckets"]), 2)
+        self.assertEqual(len(next(pages)["Buckets"]), 2)
+        with self.assertRaises(BucketListingError) as raised:
+            next(pages)
+        self.assertEqual(raised.exception.continuation_token, "4")
+
+        resumed = list(self.connector.iter_s3_bucket_pages(page_size=2, continuation_token="4", s3_client=client))
+        self.assertEqual([b["Name"] for page in resumed for b in page["Buckets"]], ["bucket-4"])
+
+    def test_snapshot_resumes_from_the_failed_page(self):
+        client = FlakyListingClient(5, fail_tokens={"2"})
+        snapshot = ResourceSnapshot(self.connector, progress=None, page_size=2)
+        snapshot._s3_client = client
+
+        with mock.patch.object(resource_snapshot, "LIST_RESUME_BACKOFF_SECONDS", 0):
+            names = snapshot.bucket_names()
+
+        self.assertEqual(names, [f"bucket-{i}" for i in range(5)])
+        # The first page is read once; only the failed page is requested again
+        self.assertEqual(client.requests, [None, "2", "2", "4"])
+
+
+class FakeSleep:
+    def __init__(self, clock):
+        self.clock = clock
+        self.slept = []
+
+    def __call__(self, seconds):
+        self.slept.append(seconds)
+        self.clock.advance(seconds=seconds)
+
+
+class RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class ThrottlingS3Stub:
+    """Answers every S3 request in place of the network; the first `throttles` get SlowDown."""
+
+    def __init__(self, throttles):
+        self.throttles = throttles
+        self.requests = 0
+
+    def __call__(self, request, **kwargs):
+        self.requests += 1
+        if self.requests <= self.throttles:
+            body = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+            return AWSResponse(request.url, 503, {}, RawBody(body))
+        body = (b'<PublicAccessBlockConfiguration xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                b"<BlockPublicAcls>true</BlockPublicAcls></PublicAccessBlockConfiguration>")
+        return AWSResponse(request.url, 200, {}, RawBody(body))
+
+
+class RateGovernorTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleep = FakeSleep(self.clock)
+        started = self.clock()
+        self.monotonic = lambda: (self.clock() - started).total_seconds()
+
+    def bucket(self, rate, burst):
+        return TokenBucket(rate, burst, clock=self.monotonic, sleep=self.sleep, rng=lambda: 1.0)
+
+    def test_callers_queue_once_the_burst_is_spent(self):
+        bucket = self.bucket(rate=10, burst=2)
+        waits = [bucket.acquire() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.1)
+        self.assertAlmostEqual(waits[3], 0.1)
+        self.assertEqual(bucket.metrics()["delayed_calls"], 2)
+
+    def test_throttle_halves_the_rate_and_backs_off(self):
+        bucket = self.bucket(rate=10, burst=10)
+        bucket.on_throttle()
+
+        self.assertEqual(bucket.rate, 5)
+        self.assertAlmostEqual(bucket.acquire(), 0.2)  # rng 1.0 -> full 0.1 * 2**1 backoff
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 5.1)
+
+    def test_client_slows_down_when_s3_throttles(self):
+        governor = RateGovernor(rate=50, burst=50, bucket_factory=self.bucket)
+        client = boto3.Session(aws_access_key_id="x", aws_secret_access_key="y").client("s3", region_name="us-east-1")
+        governor.attach(client, "123456789012", "s3", "us-east-1")
+        stub = ThrottlingS3Stub(throttles=2)
+        client.meta.events.register("before-send", stub)
+
+        with mock.patch("botocore.endpoint.time.sleep"):
+            response = client.get_public_access_block(Bucket="bucket")
+
+        self.assertTrue(response["PublicAccessBlockConfiguration"]["BlockPublicAcls"])
+        metrics = governor.metrics("123456789012")["123456789012/s3/us-east-1"]
+        # Every attempt took a token. Both SlowDowns fell in one cooldown window,
+        # so the rate was halved once (then the success added 1% back)
+        self.assertEqual((metrics["calls"], metrics["throttles"]), (3, 2))
+        self.assertEqual(metrics["rate"], 25.5)
+        self.assertEqual(metrics["delayed_calls"], 1)
+
+
+class CallInstrumentationTests(unittest.TestCase):
+    def client(self, stub, call_stats):
+        client = boto3.Session(aws_access_key_id="x", aws_secret_access_key="y").client(
+            "s3", region_name="us-east-1", config=Config(retries={"mode": "standard", "max_attempts": 3})
+        )
+        client.meta.events.register("before-send", stub)
+        return instrument_client(client, "s3", call_stats)
+
+    def test_a_call_is_counted_once_with_its_retries(self):
+        call_stats = CallStats()
+        client = self.client(ThrottlingS3Stub(throttles=2), call_stats)
+
+        with mock.patch("botocore.endpoint.time.sleep"):
+            client.get_public_access_block(Bucket="bucket")
+
+        operation = call_stats.summary()["operations"]["s3:GetPublicAccessBlock"]
+        self.assertEqual((operation["calls"], operation["errors"], operation["throttles"]), (1, 0, 0))
+
+    def test_throttled_call_is_told_apart_from_errors(self):
+        call_stats = CallStats()
+        client = self.client(ThrottlingS3Stub(throttles=10), call_stats)
+
+        with mock.patch("botocore.endpoint.time.sleep"), self.assertRaises(ClientError):
+            client.get_public_access_block(Bucket="bucket")
+
+        summary = call_stats.summary()
+        self.assertEqual((summary["calls"], summary["errors"], summary["throttles"]), (1, 0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
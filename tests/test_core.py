@@ -0,0 +1,523 @@
+import contextlib
+import io
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from core.data_models import EvidenceFinding
+from core.evidence_cache import EvidenceCache
+from core.evidence_processor import EvidenceProcessor, location_to_region
+from core.findings_diff import diff_findings
+from core.incremental import find_bucket_changes, merge_results
+from core.metrics import PhaseTimer, Registry, render
+from core.organization import list_member_accounts, member_role_arn, rollup
+from core.rules_engine import RulesEngine, Rule, ApiResult, load_controls
+from reporting.report_generator import arrow_schema, iter_arrow_chunks, iter_csv_chunks, generate_csv_string
+
+
+def stored(id, asset, control, description="Public access block is disabled."):
+    return {"id": id, "assetId": asset, "controlId": control, "status": "FAIL",
+            "description": description, "severity": "HIGH"}
+
+
+def current(asset, control, description="Public access block is disabled."):
+    return {"id": f"new-{asset}", "assetId": asset, "controlId": control, "status": "FAIL",
+            "description": description, "severity": "HIGH"}
+
+
+class FindingsDiffTest(unittest.TestCase):
+    def test_classifies_new_changed_unchanged_and_vanished(self):
+        existing = [
+            stored("f1", "a1", "CC6.1"),
+            stored("f2", "a2", "CC6.1"),
+            stored("f3", "a3", "CC6.1"),
+        ]
+        diff = diff_findings(existing, [
+            current("a1", "CC6.1"),
+            current("a2", "CC6.1", description="Only partially configured."),
+            current("a4", "CC6.1"),
+        ])
+
+        self.assertEqual([r["assetId"] for r in diff.inserts], ["a4"])
+        self.assertEqual([(r["id"], r["description"]) for r in diff.updates], [("f2", "Only partially configured.")])
+        self.assertEqual(diff.resolved_ids, ["f3"])
+        self.assertEqual(diff.summary(), {"inserted": 1, "updated": 1, "unchanged": 1, "resolved": 1})
+
+    def test_duplicate_stored_rows_are_resolved(self):
+        existing = [stored("f1", "a1", "CC6.1"), stored("f2", "a1", "CC6.1")]
+        diff = diff_findings(existing, [current("a1", "CC6.1")])
+
+        self.assertEqual(diff.unchanged, 1)
+        self.assertEqual(diff.resolved_ids, ["f2"])
+
+
+class CountingS3Client:
+    def __init__(self):
+        self.calls = []
+
+    def get_public_access_block(self, Bucket):
+        self.calls.append(("get_public_access_block", Bucket))
+        if Bucket == "no-pab":
+            raise ClientError({"Error": {"Code": "NoSuchPublicAccessBlockConfiguration", "Message": "none"}},
+                              "GetPublicAccessBlock")
+        if Bucket == "denied":
+            raise ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}}, "GetPublicAccessBlock")
+        return {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": True, "IgnorePublicAcls": True, "BlockPublicPolicy": True, "RestrictPublicBuckets": True
+        }}
+
+    def get_bucket_versioning(self, Bucket):
+        self.calls.append(("get_bucket_versioning", Bucket))
+        return {"Status": "Enabled"}
+
+
+class FakeS3ControlClient:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def get_public_access_block(self, AccountId):
+        self.calls.append(AccountId)
+        return self.response
+
+
+class FakeConnector:
+    account_id = "123456789012"
+    session = True
+
+    def __init__(self, account_response):
+        self.s3control = FakeS3ControlClient(account_response)
+
+    def client(self, service_name, region=None):
+        return self.s3control
+
+
+class RulesEngineTest(unittest.TestCase):
+    def make_engine(self, controls):
+        return RulesEngine(None, s3_client=CountingS3Client(), controls=controls)
+
+    def test_config_keywords_enable_rules_under_their_control(self):
+        engine = self.make_engine([
+            {"control_id": "CC6.1", "keywords": ["iam", "s3_public_access"]},
+            {"control_id": "CC8.1", "keywords": ["cloudtrail"]},
+        ])
+
+        findings = engine.evaluate_bucket("no-pab")
+
+        self.assertEqual([(f.control_id, f.status) for f in findings], [("CC6.1", "FAIL")])
+        self.assertEqual(findings[0].evidence["bucket"], {"error": "NoSuchPublicAccessBlockConfiguration"})
+
+    def test_account_level_block_skips_bucket_calls(self):
+        settings = {"BlockPublicAcls": True, "IgnorePublicAcls": True,
+                    "BlockPublicPolicy": True, "RestrictPublicBuckets": True}
+        connector = FakeConnector({"PublicAccessBlockConfiguration": settings})
+        engine = RulesEngine(connector, s3_client=CountingS3Client(),
+                             controls=[{"control_id": "CC6.1", "keywords": ["s3_public_access"]}])
+
+        findings = [engine.evaluate_bucket(name)[0] for name in ("no-pab", "other")]
+
+        self.assertEqual([f.status for f in findings], ["PASS", "PASS"])
+        self.assertEqual(findings[0].evidence["account"], settings)
+        self.assertEqual(engine.s3_client.calls, [])
+        self.assertEqual(connector.s3control.calls, ["123456789012"])
+        self.assertEqual(engine.skipped_calls, 2)
+
+    def test_partial_account_block_combines_with_bucket_settings(self):
+        connector = FakeConnector({"PublicAccessBlockConfiguration": {"RestrictPublicBuckets": True}})
+        engine = RulesEngine(connector, s3_client=CountingS3Client(),
+                             controls=[{"control_id": "CC6.1", "keywords": ["s3_public_access"]}])
+
+        self.assertEqual(engine.evaluate_bucket("bucket")[0].status, "PASS")
+        self.assertEqual(engine.evaluate_bucket("no-pab")[0].status, "FAIL")
+        self.assertEqual(len(engine.s3_client.calls), 2)
+
+    def test_each_api_call_is_made_once_per_bucket(self):
+        registry = {
+            "pab_a": Rule("pab_a", ("get_public_access_block",), lambda name, data: ("PASS", "a", {})),
+            "pab_b": Rule("pab_b", ("get_public_access_block", "get_bucket_versioning"),
+                          lambda name, data: ("PASS", "b", data["get_bucket_versioning"].response)),
+        }
+        engine = RulesEngine(None, s3_client=CountingS3Client(),
+                             controls=[{"control_id": "CC6.1", "keywords": ["pab_a", "pab_b"]}], registry=registry)
+
+        findings = engine.evaluate_bucket("bucket")
+
+        self.assertEqual(len(findings), 2)
+        self.assertEqual(findings[1].evidence, {"Status": "Enabled"})
+        self.assertEqual(engine.s3_client.calls, [("get_public_access_block", "bucket"),
+                                                  ("get_bucket_versioning", "bucket")])
+
+    def test_no_enabled_rules_is_an_error_not_a_pass(self):
+        with self.assertRaises(ValueError):
+            self.make_engine([])
+        with self.assertRaises(ValueError):
+            self.make_engine([{"control_id": "CC6.1", "keywords": ["not_a_rule"]}])
+        with self.assertRaises(ValueError):
+            load_controls("/nonexistent/config.yaml")
+
+
+class FakeSnapshot:
+    def __init__(self, locations):
+        self.locations = locations
+
+    def get_location(self, bucket_name):
+        return self.locations.get(bucket_name)
+
+
+class BucketRegionTest(unittest.TestCase):
+    def test_location_constraints_map_to_region_names(self):
+        self.assertEqual(location_to_region(None), "us-east-1")
+        self.assertEqual(location_to_region(""), "us-east-1")
+        self.assertEqual(location_to_region("EU"), "eu-west-1")
+        self.assertEqual(location_to_region("ap-south-1"), "ap-south-1")
+
+    def test_stored_legacy_region_is_checked_in_eu_west_1(self):
+        # Asset.region saved by an earlier scan, before constraints were mapped
+        processor = EvidenceProcessor.__new__(EvidenceProcessor)
+        processor.snapshot = FakeSnapshot({"old-eu": "EU", "lost": "unknown"})
+        processor.connector = SimpleNamespace(region_name="us-east-2")
+
+        self.assertEqual(processor.bucket_region("old-eu"), "eu-west-1")
+        self.assertEqual(processor.bucket_region("lost"), "us-east-2")
+
+    def test_checks_keep_listing_order_across_regions(self):
+        processor = EvidenceProcessor.__new__(EvidenceProcessor)
+        processor.snapshot = FakeSnapshot({"a": "eu-west-1", "b": "us-east-1", "c": "eu-west-1"})
+        processor.snapshot.bucket_names = lambda: ["a", "b", "c"]
+        processor.connector = SimpleNamespace(session=True, region_name="us-east-1", client=lambda *args: None)
+        processor.rules_engine = SimpleNamespace(
+            evaluate_bucket=lambda name, s3_client: [SimpleNamespace(resource=name)])
+        processor.max_workers = 4
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            findings = processor.run_s3_checks()
+
+        self.assertEqual([f.resource for f in findings], ["a", "b", "c"])
+        self.assertEqual({region: t["buckets"] for region, t in processor.region_timings.items()},
+                         {"eu-west-1": 2, "us-east-1": 1})
+
+
+class EvidenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.clock = lambda: self.now
+
+    def cached_entry(self, arn, call, response, expires_in=timedelta(hours=1)):
+        return {"resourceArn": arn, "apiCall": call, "response": response, "errorCode": None, "error": None,
+                "expiresAt": self.now + expires_in}
+
+    def test_rules_engine_reuses_cached_responses(self):
+        cache = EvidenceCache("acct", [self.cached_entry("arn:aws:s3:::bucket", "get_public_access_block", {
+            "PublicAccessBlockConfiguration": {"BlockPublicAcls": True}
+        })], clock=self.clock)
+        engine = RulesEngine(None, s3_client=CountingS3Client(), evidence_cache=cache,
+                             controls=[{"control_id": "CC6.1", "keywords": ["s3_public_access"]}])
+
+        self.assertEqual(engine.evaluate_bucket("bucket")[0].status, "FAIL")
+        engine.evaluate_bucket("no-pab")
+
+        self.assertEqual(engine.s3_client.calls, [("get_public_access_block", "no-pab")])
+        # The account lookup and no-pab missed; no-pab's NoSuch... error is cacheable
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual([e["resourceArn"] for e in cache.pending()], ["arn:aws:s3:::no-pab"])
+
+    def test_expired_entries_and_force_refresh_miss(self):
+        entries = [self.cached_entry("arn", "get_public_access_block", {}, expires_in=timedelta(minutes=5))]
+        cache = EvidenceCache("acct", entries, clock=self.clock)
+        self.assertIsNotNone(cache.get("arn", "get_public_access_block"))
+
+        self.now += timedelta(minutes=10)
+        self.assertIsNone(cache.get("arn", "get_public_access_block"))
+
+        forced = EvidenceCache("acct", entries, force_refresh=True, clock=self.clock)
+        self.assertIsNone(forced.get("arn", "get_public_access_block"))
+
+    def test_transient_errors_are_not_cached(self):
+        cache = EvidenceCache("acct", clock=self.clock)
+        cache.put("arn", "get_public_access_block", ApiResult(error_code="Throttling", error="slow down"))
+        self.assertEqual(cache.pending(), [])
+
+
+class FakeCloudTrailConnector:
+    """Serves canned LookupEvents pages per region."""
+
+    def __init__(self, events_by_region):
+        self.events_by_region = events_by_region
+        self.regions = []
+        self.lookups = []
+
+    def client(self, service_name, region=None):
+        connector = self
+
+        class Paginator:
+            def paginate(self, LookupAttributes=(), **kwargs):
+                connector.regions.append(region)
+                connector.lookups.append(LookupAttributes)
+                events = [event for event in connector.events_by_region.get(region, [])
+                          if all(event.get(a["AttributeKey"], "") == a["AttributeValue"] for a in LookupAttributes)]
+                return [{"Events": events}]
+
+        class Client:
+            def get_paginator(self, name):
+                return Paginator()
+
+        return Client()
+
+
+class IncrementalScanTest(unittest.TestCase):
+    def test_changed_buckets_come_from_write_events(self):
+        connector = FakeCloudTrailConnector({
+            "us-east-1": [
+                {"EventName": "PutBucketPublicAccessBlock", "EventSource": "s3.amazonaws.com", "ReadOnly": "false",
+                 "Resources": [{"ResourceType": "AWS::S3::Bucket", "ResourceName": "changed"}]},
+                {"EventName": "PutBucketAcl", "EventSource": "s3.amazonaws.com", "ReadOnly": "false",
+                 "Resources": [{"ResourceType": "AWS::S3::Bucket", "ResourceName": "acl"}]},
+            ],
+            "eu-west-1": [
+                {"EventName": "DeleteBucketPolicy", "EventSource": "s3.amazonaws.com", "ReadOnly": "false",
+                 "CloudTrailEvent": '{"requestParameters": {"bucketName": "eu-bucket"}}'},
+            ],
+        })
+        changes = find_bucket_changes(connector, datetime.now(timezone.utc), {"us-east-1", "eu-west-1"})
+
+        self.assertEqual(changes.buckets, {"changed", "acl", "eu-bucket"})
+        self.assertFalse(changes.account_changed)
+        self.assertEqual(changes.events, 3)
+        self.assertEqual(sorted(connector.regions), ["eu-west-1", "us-east-1"])
+
+    def test_read_events_are_not_fetched_or_counted(self):
+        connector = FakeCloudTrailConnector({"us-east-1": [
+            # The previous scan's own calls
+            {"EventName": "ListBuckets", "EventSource": "s3.amazonaws.com", "ReadOnly": "true"},
+            {"EventName": "GetBucketPublicAccessBlock", "EventSource": "s3.amazonaws.com", "ReadOnly": "true",
+             "Resources": [{"ResourceType": "AWS::S3::Bucket", "ResourceName": "read"}]},
+            {"EventName": "CreateSecurityGroup", "EventSource": "ec2.amazonaws.com", "ReadOnly": "false"},
+            {"EventName": "PutBucketPolicy", "EventSource": "s3.amazonaws.com", "ReadOnly": "false",
+             "Resources": [{"ResourceType": "AWS::S3::Bucket", "ResourceName": "written"}]},
+        ]})
+
+        changes = find_bucket_changes(connector, datetime.now(timezone.utc), {"us-east-1"})
+
+        self.assertEqual(connector.lookups, [[{"AttributeKey": "ReadOnly", "AttributeValue": "false"}]])
+        self.assertEqual(changes.buckets, {"written"})
+        self.assertEqual(changes.events, 1)
+
+    def test_merge_reuses_previous_results_for_unchanged_buckets(self):
+        previous = [
+            {"control_id": "CC6.1", "resource": "kept", "status": "PASS", "description": "ok", "evidence": {}},
+            {"control_id": "CC6.1", "resource": "changed", "status": "PASS", "description": "ok", "evidence": {}},
+            {"control_id": "CC6.1", "resource": "deleted", "status": "FAIL", "description": "no", "evidence": {}},
+        ]
+        fresh = [EvidenceFinding(control_id="CC6.1", resource="changed", status="FAIL", description="no", evidence={})]
+
+        merged = merge_results(["changed", "kept"], previous, fresh, {"changed"})
+
+        self.assertEqual([(f.resource, f.status) for f in merged], [("changed", "FAIL"), ("kept", "PASS")])
+
+
+class FakeOrganizationsConnector:
+    session = True
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def client(self, service_name, region=None):
+        pages = self.pages
+
+        class Client:
+            def get_paginator(self, name):
+                class Paginator:
+                    def paginate(self):
+                        return pages
+                return Paginator()
+
+        return Client()
+
+
+class OrganizationScanTest(unittest.TestCase):
+    def test_lists_active_member_accounts(self):
+        connector = FakeOrganizationsConnector([
+            {"Accounts": [{"Id": "222222222222", "Name": "prod", "Status": "ACTIVE"},
+                          {"Id": "333333333333", "Name": "closed", "Status": "SUSPENDED"}]},
+            {"Accounts": [{"Id": "111111111111", "Name": "mgmt", "Status": "ACTIVE"}]},
+        ])
+
+        self.assertEqual([a["id"] for a in list_member_accounts(connector)], ["111111111111", "222222222222"])
+        self.assertEqual(member_role_arn("arn:aws:iam::111111111111:role/loxe-audit", "222222222222"),
+                         "arn:aws:iam::222222222222:role/loxe-audit")
+
+    def test_rollup_sums_counts_and_weights_scores(self):
+        accounts = [{"id": "a", "name": "a"}, {"id": "b", "name": "b"}, {"id": "c", "name": "c"}]
+        summary = rollup(accounts, {
+            "a": ("COMPLETED", 50, {"result_count": 2, "counts": {
+                "by_status": {"PASS": 1, "FAIL": 1}, "by_control": {"CC6.1": {"PASS": 1, "FAIL": 1}}}}),
+            "b": ("COMPLETED", 100, {"result_count": 6, "counts": {
+                "by_status": {"PASS": 6}, "by_control": {"CC6.1": {"PASS": 6}}}}),
+            "c": ("FAILED", 0, {"error": "AccessDenied"}),
+        })
+
+        self.assertEqual((summary["completed"], summary["failed"]), (2, 1))
+        self.assertEqual(summary["score"], 87)
+        self.assertEqual(summary["counts"]["by_control"], {"CC6.1": {"PASS": 7, "FAIL": 1}})
+        self.assertEqual(summary["per_account"][2]["error"], "AccessDenied")
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histograms_render_cumulative_buckets(self):
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests.", ("operation",))
+        latency = registry.histogram("latency_seconds", "Latency.", ("operation",), buckets=(0.1, 1.0))
+        requests.inc("List")
+        requests.inc("List", amount=2)
+        for seconds in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(seconds, "List")
+
+        lines = render([({"process": "w1"}, registry.snapshot())]).splitlines()
+
+        self.assertIn('requests_total{operation="List",process="w1"} 3', lines)
+        self.assertIn('latency_seconds_bucket{operation="List",process="w1",le="0.1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{operation="List",process="w1",le="1.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{operation="List",process="w1",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count{operation="List",process="w1"} 4', lines)
+        self.assertEqual(lines.count("# TYPE latency_seconds histogram"), 1)
+
+    def test_phase_timer_sums_repeated_phases(self):
+        ticks = iter([0.0, 1.0, 3.0, 4.0, 4.5, 6.0])
+        timer = PhaseTimer(clock=lambda: next(ticks))
+        with timer.phase("checks"):
+            pass
+        with timer.phase("checks"):
+            pass
+
+        self.assertEqual(timer.summary(), {"total_seconds": 6.0, "phases": {"checks": 2.5}})
+
+
+class ReportExportTest(unittest.TestCase):
+    # What get_evidence_key_types returns for s3_public_access_block evidence
+    NESTED_KEY_TYPES = {
+        ("account",): {"object"},
+        ("account", "BlockPublicAcls"): {"boolean"},
+        ("account", "error"): {"string"},
+        ("bucket",): {"object"},
+        ("bucket", "BlockPublicAcls"): {"boolean"},
+        ("bucket", "error"): {"string"},
+    }
+
+    def test_nested_evidence_exports_as_nested_structs(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = arrow_schema(self.NESTED_KEY_TYPES)
+        layer = pa.struct([pa.field("BlockPublicAcls", pa.bool_()), pa.field("error", pa.string())])
+        self.assertEqual(schema.field("evidence").type, pa.struct([pa.field("account", layer),
+                                                                  pa.field("bucket", layer)]))
+
+        findings = [
+            {"control_id": "CC6.1", "status": "PASS", "resource": "a", "description": "ok",
+             "evidence": {"account": {"BlockPublicAcls": True}, "bucket": {"BlockPublicAcls": False}}},
+            {"control_id": "CC6.1", "status": "FAIL", "resource": "b", "description": "no",
+             "evidence": {"account": {"error": "NoSuchPublicAccessBlockConfiguration"},
+                          "bucket": {"error": "NoSuchPublicAccessBlockConfiguration"}}},
+        ]
+        table = pq.read_table(io.BytesIO(b"".join(iter_arrow_chunks(findings, self.NESTED_KEY_TYPES, "parquet"))))
+
+        self.assertEqual(table.column("evidence").combine_chunks().field("account").field("BlockPublicAcls")
+                         .to_pylist(), [True, None])
+
+    FLAT_KEY_TYPES = {"Status": {"string"}, "MFADelete": {"boolean", "null"}, "Rules": {"array"},
+                      "Mixed": {"number", "string"}}
+    FLAT_FINDINGS = [
+        {"control_id": "CC6.1", "status": "PASS", "resource": "a", "description": "ok",
+         "evidence": {"Status": "Enabled", "MFADelete": True, "Rules": [{"Id": "r1"}], "Mixed": 3}},
+        {"control_id": "CC7.2", "status": "ERROR", "resource": "b",
+         "evidence": {"Status": "Suspended", "Mixed": "three"}},
+    ]
+
+    def test_arrow_stream_round_trips(self):
+        import pyarrow as pa
+
+        data = b"".join(iter_arrow_chunks(self.FLAT_FINDINGS, self.FLAT_KEY_TYPES, "arrow", batch_rows=1))
+        table = pa.ipc.open_stream(data).read_all()
+
+        self.assertEqual(table.schema, arrow_schema(self.FLAT_KEY_TYPES))
+        self.assertEqual(table.column("status").to_pylist(), ["PASS", "ERROR"])
+        self.assertEqual(table.column("description").to_pylist(), ["ok", "N/A"])
+        self.assertEqual(table.column("evidence").to_pylist(), [
+            {"MFADelete": True, "Mixed": "3", "Rules": '[{"Id": "r1"}]', "Status": "Enabled"},
+            {"MFADelete": None, "Mixed": '"three"', "Rules": None, "Status": "Suspended"},
+        ])
+
+    def test_parquet_file_and_partitioned_dataset_round_trip(self):
+        import tempfile
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+        from reporting.report_generator import write_partitioned_dataset
+
+        data = b"".join(iter_arrow_chunks(self.FLAT_FINDINGS, self.FLAT_KEY_TYPES, "parquet", batch_rows=1))
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        self.assertEqual(parquet.read().column("resource").to_pylist(), ["a", "b"])
+
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_partitioned_dataset([("s1", self.FLAT_FINDINGS), ("s2", self.FLAT_FINDINGS[:1])],
+                                      self.FLAT_KEY_TYPES, base_dir)
+            table = ds.dataset(base_dir, format="parquet", partitioning="hive").to_table()
+
+        rows = sorted(zip(table.column("scan_id").to_pylist(), table.column("resource").to_pylist()))
+        self.assertEqual(rows, [("s1", "a"), ("s1", "b"), ("s2", "a")])
+
+
+def pandas_csv(findings):
+    """The report as the pandas-based export wrote it."""
+    import pandas as pd
+
+    if not findings:
+        return ""
+    df = pd.DataFrame(findings)
+    for col in ['control_id', 'status', 'resource', 'description']:
+        if col not in df.columns:
+            df[col] = 'N/A'
+    buffer = io.StringIO()
+    df.reindex(columns=['control_id', 'status', 'resource', 'description']).to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+class CsvReportTest(unittest.TestCase):
+    FINDINGS = [
+        {"control_id": "CC6.1", "status": "PASS", "resource": "plain", "description": "Blocked.", "evidence": {}},
+        {"control_id": "CC6.1", "status": "FAIL", "resource": "quoted", "evidence": {},
+         "description": 'Says "no", then, a comma'},
+        {"control_id": "CC6.1", "status": "ERROR", "resource": "multi", "description": "line one\nline two",
+         "evidence": {}},
+        {"control_id": "CC7.2", "status": "PASS", "resource": "none", "description": None, "evidence": {}},
+    ]
+
+    def test_output_matches_the_pandas_export(self):
+        self.assertEqual(generate_csv_string(self.FINDINGS), pandas_csv(self.FINDINGS))
+        missing = [{"control_id": "CC6.1", "status": "PASS", "resource": "a"}]
+        self.assertEqual(generate_csv_string(missing), pandas_csv(missing))
+        self.assertEqual(generate_csv_string([]), "")
+
+    def test_chunks_split_on_row_boundaries(self):
+        chunks = list(iter_csv_chunks(self.FINDINGS, chunk_rows=2))
+
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0].startswith("control_id,status,resource,description\n"))
+        self.assertEqual("".join(chunks), pandas_csv(self.FINDINGS))
+
+    def test_failed_check_is_reported_as_an_error_row(self):
+        engine = RulesEngine(None, s3_client=CountingS3Client(),
+                             controls=[{"control_id": "CC6.1", "keywords": ["s3_public_access"]}])
+
+        finding = engine.evaluate_bucket("denied")[0]
+
+        self.assertEqual(finding.status, "ERROR")
+        self.assertIn("AccessDenied", finding.evidence["bucket"]["error"])
+        report = generate_csv_string([vars(finding)])
+        self.assertEqual(report.splitlines()[1], "CC6.1,ERROR,denied,Could not check bucket 'denied'.")
+
+
+if __name__ == "__main__":
+    unittest.main()
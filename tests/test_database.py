@@ -0,0 +1,338 @@
+import contextlib
+import io
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# These tests run against a real Postgres, inside benchmarks.pg's throwaway schema
+DATABASE_URL = os.getenv("DATABASE_URL") or ""
+
+
+def payload(cloud_account_id="acct", **overrides):
+    return dict({"role_arn": "arn:aws:iam::123456789012:role/loxe", "cloud_account_id": cloud_account_id,
+                 "external_id": "ext", "force_refresh": False, "incremental": False}, **overrides)
+
+
+def import_database():
+    # The engine is created at import but only connects when used
+    with mock.patch.dict(os.environ, {"DATABASE_URL": DATABASE_URL or "postgresql://loxe@localhost/loxe"}):
+        import database
+    return database
+
+
+class CopyEncodingTest(unittest.TestCase):
+    # Values a description, metadata blob or timestamp can hold
+    AWKWARD = ["C:\\path\\to", "tab\there", "line\nbreak\r\n", "\\N", "", "Ünïcödé"]
+
+    def test_values_are_escaped_for_copy_text_format(self):
+        copy_value = import_database()._copy_value
+
+        self.assertEqual(copy_value(None), "\\N")
+        self.assertEqual([copy_value(value) for value in self.AWKWARD],
+                         ["C:\\\\path\\\\to", "tab\\there", "line\\nbreak\\r\\n", "\\\\N", "", "Ünïcödé"])
+        self.assertEqual(copy_value(42), "42")
+        self.assertEqual(copy_value(datetime(2025, 1, 2, 3, 4, 5)), "2025-01-02T03:04:05")
+        self.assertEqual(copy_value(datetime(2025, 1, 2, tzinfo=timezone.utc)), "2025-01-02T00:00:00+00:00")
+        # JSON is encoded, then escaped like any other text
+        self.assertEqual(copy_value({"note": "a\tb", "at": datetime(2025, 1, 2)}),
+                         '{"note": "a\\\\tb", "at": "2025-01-02 00:00:00"}')
+        self.assertEqual(copy_value([1, None]), "[1, null]")
+
+    def test_no_encoded_value_contains_a_field_or_row_separator(self):
+        copy_value = import_database()._copy_value
+
+        for value in self.AWKWARD + [{"k": "\t\n"}]:
+            self.assertNotRegex(copy_value(value), "[\t\n\r]")
+
+    @unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+    def test_awkward_values_round_trip_through_copy(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        results = [{"control_id": "CC6.1", "status": "FAIL", "resource": str(i), "description": value,
+                    "evidence": {"value": value}} for i, value in enumerate(self.AWKWARD + [None])]
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine):
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (\'a\', \'COMPLETED\')'))
+            with contextlib.redirect_stdout(io.StringIO()), database.ScanUnitOfWork("a", "acct") as uow:
+                uow.save_results("COMPLETED", 0, {}, results)
+            with engine.connect() as conn:
+                rows = conn.execute(text('SELECT description, evidence FROM "ScanResult" ORDER BY position')).fetchall()
+
+        self.assertEqual([tuple(row) for row in rows], [(value, {"value": value}) for value in self.AWKWARD + [None]])
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class ScanQueueTest(unittest.TestCase):
+    def setUp(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        self.database = database
+        self.text = text
+        self.stack = contextlib.ExitStack()
+        self.engine = self.stack.enter_context(bench_engine())
+        self.stack.enter_context(mock.patch.object(database, "engine", self.engine))
+        self.stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        with self.engine.begin() as conn:
+            for scan_id in ("a", "b", "c", "d"):
+                conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (:id, \'PENDING\')'), {"id": scan_id})
+
+    def tearDown(self):
+        self.stack.close()
+
+    def scans(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(self.text('SELECT id, status, score, "coalescedInto" FROM "Scan" ORDER BY id'))
+            return {scan_id: (status, score, leader) for scan_id, status, score, leader in rows}
+
+    def test_equivalent_scan_joins_the_one_in_flight(self):
+        self.assertEqual(self.database.enqueue_scan("a", payload()), "a")
+        self.assertEqual(self.database.enqueue_scan("b", payload()), "a")
+
+        self.assertEqual(self.scans()["b"], ("QUEUED", None, "a"))
+
+    def test_scan_with_different_options_is_queued_on_its_own(self):
+        self.database.enqueue_scan("a", payload())
+
+        self.assertEqual(self.database.enqueue_scan("b", payload(force_refresh=True)), "b")
+        self.assertEqual(self.scans()["b"], ("QUEUED", None, None))
+
+    def test_requeueing_a_running_scan_keeps_its_lease(self):
+        self.database.enqueue_scan("a", payload())
+        self.assertEqual(len(self.database.claim_scan_jobs("w1", 10, 60, 3)), 1)
+
+        self.assertEqual(self.database.enqueue_scan("a", payload()), "a")
+        self.assertEqual(self.scans()["a"][0], "RUNNING")
+        self.assertEqual(self.database.claim_scan_jobs("w2", 10, 60, 3), [])
+
+    def test_followers_complete_with_their_leader(self):
+        self.database.enqueue_scan("a", payload())
+        self.database.enqueue_scan("b", payload())
+        self.database.claim_scan_jobs("w1", 10, 60, 3)
+
+        with self.database.ScanUnitOfWork("a", "acct") as uow:
+            uow.save_results("COMPLETED", 90, {"result_count": 1},
+                             [{"control_id": "CC6.1", "status": "PASS", "resource": "bucket"}])
+
+        self.assertEqual(self.scans()["b"], ("COMPLETED", 90, "a"))
+        with self.engine.connect() as conn:
+            copied = conn.execute(self.text('SELECT resource FROM "ScanResult" WHERE "scanId" = \'b\'')).fetchall()
+        self.assertEqual(copied, [("bucket",)])
+
+    def test_released_scan_is_claimed_again(self):
+        self.database.enqueue_scan("a", payload())
+        for worker_id in ("w1", "w2", "w3", "w4"):
+            self.assertEqual([job[0] for job in self.database.claim_scan_jobs(worker_id, 10, 60, 3)], ["a"])
+            self.database.release_scan_leases(worker_id, ["a"])
+
+        self.assertEqual(self.scans()["a"][0], "QUEUED")
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(self.text('SELECT attempts FROM "Scan" WHERE id = \'a\'')).scalar(), 0)
+
+    def test_exhausted_queued_scan_fails_with_its_followers(self):
+        self.database.enqueue_scan("a", payload())
+        self.database.enqueue_scan("b", payload())
+        with self.engine.begin() as conn:
+            conn.execute(self.text('UPDATE "Scan" SET attempts = 3 WHERE id = \'a\''))
+
+        self.database.fail_exhausted_scan_jobs(3)
+
+        self.assertEqual(self.scans()["a"], ("FAILED", 0, None))
+        self.assertEqual(self.scans()["b"], ("FAILED", 0, "a"))
+
+    def test_claims_one_scan_per_account(self):
+        self.database.enqueue_scan("a", payload())
+        self.database.enqueue_scan("b", payload(force_refresh=True))
+        self.database.enqueue_scan("c", payload(cloud_account_id="other"))
+
+        claimed = sorted(scan_id for scan_id, _, _ in self.database.claim_scan_jobs("w1", 10, 60, 3))
+        self.assertEqual(claimed, ["a", "c"])
+        # "b" waits until the account's running scan is done
+        self.assertEqual(self.database.claim_scan_jobs("w2", 10, 60, 3), [])
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class EvidenceCacheEvictionTest(unittest.TestCase):
+    def entry(self, account, arn, used_minutes_ago):
+        now = datetime.now(timezone.utc)
+        return {"cloudAccountId": account, "resourceArn": arn, "apiCall": "get_public_access_block",
+                "response": {}, "errorCode": None, "error": None, "fetchedAt": now,
+                "expiresAt": now + timedelta(hours=1), "lastUsedAt": now - timedelta(minutes=used_minutes_ago)}
+
+    def test_eviction_only_trims_the_scanned_account(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine), \
+                mock.patch.object(database, "EVIDENCE_CACHE_MAX_ENTRIES_PER_ACCOUNT", 2), \
+                contextlib.redirect_stdout(io.StringIO()):
+            database.ensure_evidence_cache_schema()
+            database.save_evidence_cache("other", [self.entry("other", f"o{i}", i) for i in range(3)], [])
+            database.save_evidence_cache("acct", [self.entry("acct", f"a{i}", i) for i in range(3)], [])
+
+            with engine.connect() as conn:
+                rows = conn.execute(text('SELECT "resourceArn" FROM "EvidenceCache" ORDER BY 1')).fetchall()
+
+        # Each account kept its two most recently used entries
+        self.assertEqual([arn for arn, in rows], ["a0", "a1", "o0", "o1"])
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class ScanResultsQueryTest(unittest.TestCase):
+    # Report order, which is not the order of any column
+    RESULTS = [
+        {"control_id": "CC6.1", "status": "FAIL", "resource": "zeta", "description": "", "evidence": {"n": 0}},
+        {"control_id": "CC6.1", "status": "PASS", "resource": "alpha", "description": "", "evidence": {"n": 1}},
+        {"control_id": "CC7.2", "status": "FAIL", "resource": "logs_1", "description": "", "evidence": {"n": 2}},
+        {"control_id": "CC6.1", "status": "FAIL", "resource": "logs%2", "description": "", "evidence": {"n": 3}},
+        {"control_id": "CC6.1", "status": "ERROR", "resource": "beta", "description": "", "evidence": {"n": 4}},
+    ]
+
+    def setUp(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        self.database = database
+        self.stack = contextlib.ExitStack()
+        engine = self.stack.enter_context(bench_engine())
+        self.stack.enter_context(mock.patch.object(database, "engine", engine))
+        self.stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (\'a\', \'PENDING\')'))
+        with database.ScanUnitOfWork("a", "acct") as uow:
+            uow.save_results("COMPLETED", 40, {"result_count": 5}, self.RESULTS)
+
+    def tearDown(self):
+        self.stack.close()
+
+    def pages(self, limit, after=None, **filters):
+        pages = []
+        while True:
+            rows, after = self.database.get_scan_results_page("a", limit, after=after, **filters)
+            pages.append([row["resource"] for row in rows])
+            if after is None:
+                return pages
+
+    def test_results_stream_in_report_order(self):
+        rows = list(self.database.iter_scan_results("a", fetch_size=2, with_evidence=True))
+
+        self.assertEqual([row["resource"] for row in rows], [r["resource"] for r in self.RESULTS])
+        self.assertEqual([row["evidence"] for row in rows], [r["evidence"] for r in self.RESULTS])
+
+    def test_keyset_pages_cover_every_row_once(self):
+        self.assertEqual(self.pages(2), [["zeta", "alpha"], ["logs_1", "logs%2"], ["beta"]])
+        self.assertEqual(self.pages(5), [["zeta", "alpha", "logs_1", "logs%2", "beta"]])
+
+    def test_filters_page_in_report_order(self):
+        self.assertEqual(self.pages(1, status="FAIL", control_id="CC6.1"), [["zeta"], ["logs%2"]])
+        # The prefix is matched literally, not as a LIKE pattern
+        self.assertEqual(self.pages(10, resource_prefix="logs%"), [["logs%2"]])
+        # Prefix matches are paged by name
+        self.assertEqual(self.pages(1, resource_prefix="logs"), [["logs%2"], ["logs_1"]])
+        self.assertEqual(self.pages(10, status="PASS", after=1), [[]])
+
+    def test_summary_counts_stored_results(self):
+        summary = self.database.get_scan_summary("a")
+
+        self.assertEqual((summary["status"], summary["score"], summary["total"]), ("COMPLETED", 40, 5))
+        self.assertEqual(summary["by_status"], {"FAIL": 3, "PASS": 1, "ERROR": 1})
+        self.assertEqual(summary["by_control"]["CC7.2"], {"FAIL": 1})
+        self.assertIsNone(self.database.get_scan_summary("missing"))
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class ScanOutcomesTest(unittest.TestCase):
+    def test_findings_are_decoded(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine):
+            with engine.begin() as conn:
+                # Stored as a JSON string, as rows written with a pre-encoded blob are
+                conn.execute(text('INSERT INTO "Scan" (id, status, score, findings) '
+                                  'VALUES (\'m\', \'FAILED\', 0, to_jsonb(CAST(:blob AS text)))'),
+                             {"blob": '{"error": "AccessDenied"}'})
+            outcomes = database.get_scan_outcomes(["m"])
+
+        self.assertEqual(outcomes, {"m": ("FAILED", 0, {"error": "AccessDenied"})})
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class DbStatsTest(unittest.TestCase):
+    def test_staging_copies_are_not_counted_as_written(self):
+        import database
+        from benchmarks.pg import bench_engine
+
+        assets = [{"resourceId": f"b{i}", "name": f"b{i}", "type": "s3_bucket", "provider": "aws",
+                   "region": "us-east-1", "status": "ACTIVE", "metadata": {}} for i in range(3)]
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine), \
+                contextlib.redirect_stdout(io.StringIO()), database.ScanUnitOfWork("a", "acct") as uow:
+            uow.upsert_assets(assets)
+
+        self.assertEqual(uow.db_stats["rows_written"], {"Asset": 3})
+
+
+@unittest.skipUnless(DATABASE_URL.startswith("postgres"), "needs a Postgres DATABASE_URL")
+class EvidenceKeyTypesTest(unittest.TestCase):
+    def test_nested_evidence_keys_are_reported_by_path(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine):
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (\'a\', \'COMPLETED\')'))
+            with contextlib.redirect_stdout(io.StringIO()), database.ScanUnitOfWork("a", "acct") as uow:
+                uow.save_results("COMPLETED", 100, {}, [{"control_id": "CC6.1", "status": "PASS", "resource": "b",
+                                                         "evidence": {"account": {"BlockPublicAcls": True},
+                                                                      "bucket": {"skipped": "covered"}}}])
+
+            key_types = database.get_evidence_key_types(["a"])
+
+        self.assertEqual(key_types, {
+            ("account",): {"object"},
+            ("account", "BlockPublicAcls"): {"boolean"},
+            ("bucket",): {"object"},
+            ("bucket", "skipped"): {"string"},
+        })
+
+    def test_stored_key_types_match_the_stored_results(self):
+        import database
+        from benchmarks.pg import bench_engine
+        from sqlalchemy import text
+
+        results = [{"control_id": "CC6.1", "status": status, "resource": "b", "evidence": evidence}
+                   for status, evidence in [
+                       ("PASS", {"account": {"BlockPublicAcls": True, "n": 1}, "rules": [1], "note": None}),
+                       ("FAIL", {"account": {"error": "x", "n": 1.5}, "rules": "none", "a": {"b": {"c": {"d": 1}}}}),
+                   ]]
+        with bench_engine() as engine, mock.patch.object(database, "engine", engine), \
+                contextlib.redirect_stdout(io.StringIO()):
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO "Scan" (id, status) VALUES (\'a\', \'COMPLETED\'), '
+                                  '(\'b\', \'COMPLETED\')'))
+            with database.ScanUnitOfWork("a", "acct") as uow:
+                uow.save_results("COMPLETED", 50, {}, results)
+            with database.ScanUnitOfWork("b", "acct") as uow:
+                uow.save_results("COMPLETED", 50, {"evidence_key_types": database.evidence_key_types(results)},
+                                 results)
+
+            # "a" is read from its rows, "b" from the types stored with it
+            from_rows = database.get_evidence_key_types(["a"])
+            with mock.patch.object(database, "SELECT_EVIDENCE_KEY_TYPES", None):
+                stored = database.get_evidence_key_types(["b"])
+
+        self.assertEqual(stored, from_rows)
+        self.assertEqual(stored[("a", "b", "c")], {"object"})
+        self.assertNotIn(("a", "b", "c", "d"), stored)
+
+
+if __name__ == "__main__":
+    unittest.main()
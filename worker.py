@@ -0,0 +1,130 @@
+import asyncio
+import os
+import signal
+import socket
+import uuid
+
+from core.metrics import REGISTRY
+from database import ensure_scan_queue_schema, ensure_scan_results_schema, ensure_evidence_cache_schema, \
+    ensure_scan_state_schema, ensure_worker_metrics_schema, claim_scan_jobs, heartbeat_scan_leases, \
+    release_scan_leases, fail_exhausted_scan_jobs, publish_worker_metrics
+from scan_pipeline import run_scan, run_org_scan
+
+# Scans this process runs at once. Throughput scales by adding worker processes.
+WORKER_CONCURRENCY = int(os.getenv("LOXE_WORKER_CONCURRENCY", "4"))
+
+# A claimed scan is re-queued if its worker stops heartbeating for this long
+LEASE_SECONDS = int(os.getenv("LOXE_SCAN_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 3)
+
+POLL_SECONDS = float(os.getenv("LOXE_WORKER_POLL_SECONDS", "2"))
+
+# Scans whose worker died this many times are marked FAILED
+MAX_ATTEMPTS = int(os.getenv("LOXE_SCAN_MAX_ATTEMPTS", "3"))
+
+# How often this worker's metrics are published for the API's /metrics endpoint
+METRICS_PUBLISH_SECONDS = float(os.getenv("LOXE_WORKER_METRICS_SECONDS", "15"))
+
+
+class ScanWorker:
+    """
+    Pulls queued scans from the "Scan" table and runs them with scan_pipeline.run_scan.
+    """
+
+    def __init__(self, concurrency=WORKER_CONCURRENCY):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.running = {}
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        print(f"👷 Scan worker {self.worker_id} started (concurrency {self.concurrency}).")
+        await asyncio.to_thread(ensure_scan_queue_schema)
+        await asyncio.to_thread(ensure_scan_results_schema)
+        await asyncio.to_thread(ensure_evidence_cache_schema)
+        await asyncio.to_thread(ensure_scan_state_schema)
+        await asyncio.to_thread(ensure_worker_metrics_schema)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        publisher = asyncio.create_task(self._publish_metrics())
+
+        try:
+            while not self.stopping.is_set():
+                claimed = await self._claim()
+                if not claimed:
+                    try:
+                        await asyncio.wait_for(self.stopping.wait(), timeout=POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            heartbeat.cancel()
+            publisher.cancel()
+            abandoned = list(self.running)
+            if abandoned:
+                print(f"↩️ Returning {len(abandoned)} unfinished scan(s) to the queue.")
+                tasks = list(self.running.values())
+                for task in tasks:
+                    task.cancel()
+                # Let cancelled scans finish rolling back before their leases go back
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await asyncio.to_thread(release_scan_leases, self.worker_id, abandoned)
+            await asyncio.to_thread(publish_worker_metrics, self.worker_id, REGISTRY.snapshot())
+            print(f"👋 Scan worker {self.worker_id} stopped.")
+
+    def stop(self):
+        self.stopping.set()
+
+    async def _claim(self):
+        free_slots = self.concurrency - len(self.running)
+        if free_slots <= 0:
+            return 0
+
+        await asyncio.to_thread(fail_exhausted_scan_jobs, MAX_ATTEMPTS)
+        jobs = await asyncio.to_thread(claim_scan_jobs, self.worker_id, free_slots, LEASE_SECONDS, MAX_ATTEMPTS)
+        for scan_id, payload, attempts in jobs:
+            print(f"📥 Claimed scan {scan_id} (attempt {attempts}).")
+            if payload.get("organization"):
+                scan = run_org_scan(
+                    payload["role_arn"],
+                    scan_id,
+                    payload["cloud_account_id"],
+                    payload["external_id"],
+                    payload.get("member_role_name"),
+                    payload.get("processes"),
+                    payload.get("force_refresh", False),
+                    payload.get("incremental", False)
+                )
+            else:
+                scan = run_scan(
+                    payload["role_arn"],
+                    scan_id,
+                    payload["cloud_account_id"],
+                    payload["external_id"],
+                    payload.get("force_refresh", False),
+                    payload.get("incremental", False)
+                )
+            task = asyncio.create_task(scan)
+            self.running[scan_id] = task
+            task.add_done_callback(lambda _, scan_id=scan_id: self.running.pop(scan_id, None))
+        return len(jobs)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await asyncio.to_thread(heartbeat_scan_leases, self.worker_id, list(self.running), LEASE_SECONDS)
+
+    async def _publish_metrics(self):
+        while True:
+            await asyncio.to_thread(publish_worker_metrics, self.worker_id, REGISTRY.snapshot())
+            await asyncio.sleep(METRICS_PUBLISH_SECONDS)
+
+
+async def main():
+    worker = ScanWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())